@@ -0,0 +1,209 @@
+"""
+Synthetic graphbank generator.
+
+Sentences are random projective trees, then non projective and cyclic
+edges, extra heads (reentrancies) and void tokens are added at the given
+rates. Tokens, lemmas and labels follow Zipf distributions.
+
+    python -m benchmarks.generate -n 1000 -f sdp -o corpus.sdp --reentrancy 0.2
+"""
+import argparse, math, random, sys
+
+__all__ = ['Sentence', 'generate', 'perturb', 'write', 'FORMATS']
+
+FORMATS = ('sequoia', 'sagae', 'sdp')
+
+LABELS = ['mod', 'det', 'suj', 'obj', 'dep', 'p_obj', 'coord', 'dep_coord', 'ats', 'aff', 'a_obj', 'de_obj', 'root', 'ponct', 'arg']
+POS    = ['N', 'V', 'D', 'P', 'ADJ', 'ADV', 'CC', 'PRO', 'PONCT', 'NC']
+
+class Sentence(object):
+    """
+    tokens[i-1] = (token, lemma, pos) of node i, heads[i-1] = [(head, label), ...]
+    """
+    __slots__ = ('sentid', 'tokens', 'heads')
+
+    def __init__(self, sentid, tokens, heads):
+        self.sentid = sentid
+        self.tokens = tokens
+        self.heads  = heads
+
+    def __len__(self):
+        return len(self.tokens)
+
+def _zipf(rnd, n, s = 1.1):
+    """
+    Rank in [0, n) drawn from a Zipf law of exponent s (inverse transform on the continuous approximation)
+    """
+    u = rnd.random()
+    if s == 1.:
+        return min(n - 1, int(math.exp(u * math.log(n + 1))) - 1)
+    a = 1. - s
+    return min(n - 1, int((((n + 1) ** a - 1.) * u + 1.) ** (1. / a)) - 1)
+
+def _projective(rnd, a, b, head, parent):
+    """
+    Random projective tree over [a, b] attached to head (iterative)
+    """
+    todo = [(a, b, head)]
+    while todo:
+        a, b, head = todo.pop()
+        if a > b:
+            continue
+        h = rnd.randint(a, b)
+        parent[h] = head
+        todo.append((a, h - 1, h))
+        todo.append((h + 1, b, h))
+
+def _descendants(children, v):
+    seen, todo = set([v]), [v]
+    while todo:
+        for w in children[todo.pop()]:
+            if w not in seen:
+                seen.add(w)
+                todo.append(w)
+    return seen
+
+def generate(n, seed = 0, mean_length = 25, length_sigma = 0.5, max_length = 150, density = 1.,
+             reentrancy = 0., crossing = 0.05, cycles = 0., vocabulary = 20000):
+    """
+    n sentences. Lengths follow a log-normal law of median mean_length.
+    - density: probability that a token has a head (others are void)
+    - reentrancy: probability that a token has a second head
+    - crossing: probability that a token is attached to a random head
+      (which makes most of these edges non projective)
+    - cycles: probability that a sentence gets an edge closing a cycle
+    """
+    rnd = random.Random(seed)
+    mu = math.log(mean_length)
+    for s in range(n):
+        length = max(1, min(max_length, int(round(rnd.lognormvariate(mu, length_sigma)))))
+        tokens = []
+        for _ in range(length):
+            w = _zipf(rnd, vocabulary)
+            tokens.append(("w%i" % w, "l%i" % (w // 3), POS[_zipf(rnd, len(POS), 1.3)]))
+
+        parent = [None] * (length + 1)
+        _projective(rnd, 1, length, 0, parent)
+        children = [[] for _ in range(length + 1)]
+        for d in range(1, length + 1):
+            children[parent[d]].append(d)
+
+        for d in range(1, length + 1):
+            if length > 2 and rnd.random() < crossing:
+                below = _descendants(children, d)
+                candidates = [h for h in range(length + 1) if h not in below and h != parent[d]]
+                if candidates:
+                    children[parent[d]].remove(d)
+                    parent[d] = rnd.choice(candidates)
+                    children[parent[d]].append(d)
+
+        heads = [[(parent[d], LABELS[_zipf(rnd, len(LABELS), 1.2)])] for d in range(1, length + 1)]
+        for d in range(1, length + 1):
+            if rnd.random() < reentrancy:
+                below = _descendants(children, d)
+                candidates = [h for h in range(1, length + 1) if h not in below and h != parent[d]]
+                if candidates:
+                    heads[d-1].append((rnd.choice(candidates), LABELS[_zipf(rnd, len(LABELS), 1.2)]))
+        if length > 1 and rnd.random() < cycles:
+            d = rnd.randint(1, length)
+            below = [w for w in _descendants(children, d) if w != d]
+            if below:
+                heads[d-1].append((rnd.choice(below), LABELS[_zipf(rnd, len(LABELS), 1.2)]))
+        if density < 1.:
+            for d in range(1, length + 1):
+                if rnd.random() > density:
+                    heads[d-1] = []
+                    for h in heads:
+                        h[:] = [(x, l) for x, l in h if x != d]
+
+        yield Sentence("sent%i" % s, tokens, heads)
+
+def perturb(sentences, noise = 0.1, seed = 1):
+    """
+    System output of the same sentences: each head and label is replaced
+    by a random one with probability noise
+    """
+    rnd = random.Random(seed)
+    for sentence in sentences:
+        length, heads = len(sentence), []
+        for d, hs in enumerate(sentence.heads, 1):
+            new = {}
+            for h, l in hs:
+                if rnd.random() < noise:
+                    h = rnd.randint(0, length)
+                if rnd.random() < noise:
+                    l = rnd.choice(LABELS)
+                if h != d:
+                    new[h] = l
+            heads.append(sorted(new.items()))
+        yield Sentence(sentence.sentid, sentence.tokens, heads)
+
+def _write_sequoia(sentence, out):
+    out.write("# %s\n" % sentence.sentid)
+    for i, ((token, lemma, pos), heads) in enumerate(zip(sentence.tokens, sentence.heads), 1):
+        if heads:
+            out.write("%i\t%s\t%s\t%s\t%s\t_\t%s\t%s\n" % (i, token, lemma, pos, pos, '|'.join(str(h) for h, _ in heads), '|'.join(l for _, l in heads)))
+        else:
+            out.write("%i\t%s\t%s\t%s\t%s\t_\t-1\tNONE\n" % (i, token, lemma, pos, pos))
+    out.write("\n")
+
+def _write_sagae(sentence, out):
+    out.write("# %s\n" % sentence.sentid)
+    for i, ((token, lemma, pos), heads) in enumerate(zip(sentence.tokens, sentence.heads), 1):
+        for h, l in (heads or [(-1, 'NONE')]):
+            out.write("%i\t%s\t%s\t%s\t%s\t_\t%i\t%s\n" % (i, token, lemma, pos, pos, h, l))
+    out.write("\n")
+
+def _write_sdp(sentence, out):
+    #Edges from the root are given by the top column, the others by one column per predicate
+    predicates = sorted(set(h for heads in sentence.heads for h, _ in heads if h > 0))
+    column = dict((p, i) for i, p in enumerate(predicates))
+    out.write("#%s\n" % sentence.sentid)
+    for i, ((token, lemma, pos), heads) in enumerate(zip(sentence.tokens, sentence.heads), 1):
+        args = ['_'] * len(predicates)
+        top = '-'
+        for h, l in heads:
+            if h == 0:
+                top = '+'
+            else:
+                args[column[h]] = l
+        out.write('\t'.join([str(i), token, lemma, pos, top, '+' if i in column else '-'] + args) + "\n")
+    out.write("\n")
+
+_WRITERS = {'sequoia': _write_sequoia, 'sagae': _write_sagae, 'sdp': _write_sdp}
+
+def write(sentences, format, out):
+    writer = _WRITERS[format]
+    for sentence in sentences:
+        writer(sentence, out)
+
+def options():
+    parser = argparse.ArgumentParser(description='Generate a synthetic graphbank')
+    parser.add_argument('-n', '--sentences', type=int, default=1000, help='Number of sentences')
+    parser.add_argument('-f', '--format', default='sequoia', choices=FORMATS)
+    parser.add_argument('-o', '--output', help='Output file (default: stdout)', metavar="FILE")
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('--mean-length', type=float, default=25, help='Median sentence length')
+    parser.add_argument('--length-sigma', type=float, default=0.5, help='Sigma of the log-normal sentence length law')
+    parser.add_argument('--max-length', type=int, default=150)
+    parser.add_argument('--density', type=float, default=1., help='Probability that a token has a head')
+    parser.add_argument('--reentrancy', type=float, default=0., help='Probability that a token has a second head')
+    parser.add_argument('--crossing', type=float, default=0.05, help='Probability that a token is attached to a random head')
+    parser.add_argument('--cycles', type=float, default=0., help='Probability that a sentence has a cycle')
+    parser.add_argument('--noise', type=float, default=None, help='Write a system output of the corpus with this error rate instead')
+    return parser
+
+def main():
+    args = options().parse_args()
+    sentences = generate(args.sentences, args.seed, args.mean_length, args.length_sigma, args.max_length,
+                         args.density, args.reentrancy, args.crossing, args.cycles)
+    if args.noise is not None:
+        sentences = perturb(sentences, args.noise, args.seed + 1)
+    if args.output is None:
+        write(sentences, args.format, sys.stdout)
+    else:
+        with open(args.output, 'w') as out:
+            write(sentences, args.format, out)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Benchmark harness: times each reader, writer, analyzer and scorer on
+synthetic corpora of several sizes, and compares the throughputs with a
+saved baseline.
+
+    python -m benchmarks.harness --scales 100 1000 -o results.json
+    python -m benchmarks.harness --scales 100 1000 --baseline results.json
+"""
+import argparse, io, json, os, platform, sys, tempfile, time, tracemalloc
+
+from treebankanalytics import __version__
+from treebankanalytics.actions import Analyzer, Evaluator
+from treebankanalytics.formatters import CSVFormatter
+from treebankanalytics.registry import ANALYZERS, SCORERS, WRITERS
+from treebankanalytics.supported_formats import format_factory_reader
+from benchmarks.generate import FORMATS, generate, perturb, write
+
+__all__ = ['run', 'compare', 'benchmarks']
+
+class _NullSink(io.TextIOBase):
+    """
+    Text stream discarding what is written, which writers cannot close
+    """
+    def write(self, s):
+        return len(s)
+
+    def close(self):
+        pass
+
+def _classes(registry):
+    return [registry.get(name) for name in registry.names()]
+
+def _writer(format):
+    return WRITERS.get(format) if format in WRITERS else None
+
+def benchmarks(directory, config = {}):
+    """
+    (name, function) pairs, each function running one benchmark on the
+    corpora written in directory and returning the number of sentences processed
+    """
+    def read(format):
+        def run():
+            return sum(1 for _ in format_factory_reader(format)(open(os.path.join(directory, 'gold.' + format), 'r')))
+        return run
+
+    golds   = list(format_factory_reader('sequoia')(open(os.path.join(directory, 'gold.sequoia'), 'r')))
+    systems = list(format_factory_reader('sequoia')(open(os.path.join(directory, 'system.sequoia'), 'r')))
+
+    def write_(writer):
+        def run():
+            sink = _NullSink()
+            for graph in golds:
+                writer(graph, sink)
+            return len(golds)
+        return run
+
+    def analyze(cls):
+        def run():
+            analyzer = Analyzer(CSVFormatter(), config, [cls])
+            analyzer.accumulate(golds)
+            for _, table in analyzer.tables():
+                print(table, file=_NullSink())
+            return len(golds)
+        return run
+
+    def score(cls):
+        def run():
+            evaluator = Evaluator(CSVFormatter(), config, [cls])
+            evaluator.accumulate(golds, systems)
+            list(evaluator.tables())
+            return len(golds)
+        return run
+
+    tasks = [('read ' + f, read(f)) for f in FORMATS]
+    tasks.extend(('write ' + f, write_(_writer(f))) for f in FORMATS if _writer(f) is not None)
+    tasks.extend(('analyze ' + cls.name(), analyze(cls)) for cls in _classes(ANALYZERS))
+    tasks.extend(('score ' + cls.name(), score(cls)) for cls in _classes(SCORERS))
+    return tasks
+
+def _measure(fn, repeat, memory):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        n = fn()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    r = {'seconds': best, 'sentences_per_second': n / best if best > 0 else 0.}
+    if memory:
+        tracemalloc.start()
+        fn()
+        r['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return r
+
+def run(scales, repeat = 3, memory = False, config = {}, params = {}, log = sys.stderr):
+    """
+    Results: {'meta': ..., 'results': {benchmark: {scale: measures}}}
+    """
+    results = {}
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as directory:
+            for f in FORMATS:
+                with open(os.path.join(directory, 'gold.' + f), 'w') as out:
+                    write(generate(scale, **params), f, out)
+            with open(os.path.join(directory, 'system.sequoia'), 'w') as out:
+                write(perturb(generate(scale, **params)), 'sequoia', out)
+
+            for name, fn in benchmarks(directory, config):
+                r = _measure(fn, repeat, memory)
+                results.setdefault(name, {})[str(scale)] = r
+                print("%s\t%i\t%.0f sentences/s" % (name, scale, r['sentences_per_second']), file=log)
+
+    meta = {'version': __version__, 'python': platform.python_version(), 'machine': platform.machine(),
+            'repeat': repeat, 'params': params}
+    return {'meta': meta, 'results': results}
+
+def compare(current, baseline, tolerance = 0.1):
+    """
+    Comparison table (list of rows) and number of regressions: throughput
+    lower, or memory peak higher, than the baseline by more than tolerance
+    """
+    table = [['Benchmark', 'Scale', 'Baseline/s', 'Current/s', 'Ratio', 'Status']]
+    regressions = 0
+    for name, scales in sorted(current['results'].items()):
+        for scale, r in sorted(scales.items(), key=lambda k: int(k[0])):
+            b = baseline['results'].get(name, {}).get(scale)
+            if b is None:
+                table.append([name, scale, '-', "%.0f" % r['sentences_per_second'], '-', 'new'])
+                continue
+            ratio = r['sentences_per_second'] / b['sentences_per_second'] if b['sentences_per_second'] > 0 else 0.
+            status = 'ok'
+            if ratio < 1. - tolerance:
+                status = 'slower'
+            elif 'peak_bytes' in r and 'peak_bytes' in b and r['peak_bytes'] > b['peak_bytes'] * (1. + tolerance):
+                status = 'more memory'
+            regressions += status != 'ok'
+            table.append([name, scale, "%.0f" % b['sentences_per_second'], "%.0f" % r['sentences_per_second'], "%.2f" % ratio, status])
+    return table, regressions
+
+def options():
+    parser = argparse.ArgumentParser(description='Benchmark readers, writers, analyzers and scorers on synthetic corpora')
+    parser.add_argument('--scales', type=int, nargs='+', default=[100, 1000], help='Corpus sizes (number of sentences)')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Runs of each benchmark, the fastest is kept')
+    parser.add_argument('--memory', action='store_true', help='Also measure the memory peak of each benchmark (tracemalloc)')
+    parser.add_argument('-o', '--output', help='Write the results to this JSON file', metavar="FILE")
+    parser.add_argument('-b', '--baseline', help='Compare the results with this JSON file', metavar="FILE")
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Relative slowdown reported as a regression')
+    parser.add_argument('--reentrancy', type=float, default=0.1)
+    parser.add_argument('--crossing', type=float, default=0.05)
+    parser.add_argument('--cycles', type=float, default=0.05)
+    parser.add_argument('--density', type=float, default=0.95)
+    parser.add_argument('--mean-length', type=float, default=25)
+    return parser
+
+def main():
+    args   = options().parse_args()
+    params = {'reentrancy': args.reentrancy, 'crossing': args.crossing, 'cycles': args.cycles,
+              'density': args.density, 'mean_length': args.mean_length}
+    results = run(args.scales, args.repeat, args.memory, params=params)
+
+    if args.output is not None:
+        with open(args.output, 'w') as out:
+            json.dump(results, out, indent=2, sort_keys=True)
+            out.write('\n')
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as stream:
+            baseline = json.load(stream)
+        table, regressions = compare(results, baseline, args.tolerance)
+        print(CSVFormatter().format(table))
+        if regressions:
+            print("%i regression(s)" % regressions, file=sys.stderr)
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -12,7 +12,7 @@ setup(
     license= 'MIT',
     platforms=["any"],
     packages=find_packages(exclude = ['ez_setup',
-        '*.tests', '*.tests.*', 'tests.*', 'tests']),
+        '*.tests', '*.tests.*', 'tests.*', 'tests', 'benchmarks', 'benchmarks.*']),
     install_requires=['pyyaml'],
 
     #We use nose for testing, it's far easier than the classic method
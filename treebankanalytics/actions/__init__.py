@@ -1,2 +1,21 @@
-from treebankanalytics.actions.eval import *
-from treebankanalytics.actions.analyze import *
+import importlib
+
+#Names are looked up in these modules on first access, so that importing a
+#submodule (e.g. actions.eval for scoring) does not load the others
+_MODULES = ['accumulators', 'eval', 'analyze']
+
+def _module(name):
+    return importlib.import_module('%s.%s' % (__name__, name))
+
+def __getattr__(name):
+    if name == '__all__':
+        names = []
+        for m in _MODULES:
+            names.extend(n for n in _module(m).__all__ if n not in names)
+        return names
+    if not name.startswith('__'):
+        for m in _MODULES:
+            module = _module(m)
+            if name in module.__all__:
+                return getattr(module, name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,128 @@
+import abc
+
+__all__ = ['MergeNotDefinedError', 'Accumulator', 'Counts', 'Histogram', 'CountArray', 'Nested', 'Vocabulary']
+
+class MergeNotDefinedError(Exception):
+    pass
+
+class Accumulator(metaclass=abc.ABCMeta):
+    """
+    Typed partial result of an analyzer or a scorer.
+
+    Accumulators are updated in place while reading a corpus and
+    merge(other) is associative, so partial results computed on different
+    chunks (or processes, or machines) can be reduced in any grouping.
+    merge() takes ownership of other's content and returns self.
+    """
+
+    @abc.abstractmethod
+    def merge(self, other):
+        pass
+
+    def _check_mergeable(self, other):
+        if type(self) is not type(other):
+            raise MergeNotDefinedError('Merge not defined between %s and %s' % (type(self).__name__, type(other).__name__))
+
+class Counts(dict, Accumulator):
+    """
+    Fixed set of named counters, e.g. Counts('Graphs', 'DAGs').
+    Updates are plain increments: counts['Graphs'] += 1
+    """
+    def __init__(self, *names):
+        super().__init__((name, 0) for name in names)
+
+    def merge(self, other):
+        self._check_mergeable(other)
+        for k, v in other.items():
+            self[k] = self.get(k, 0) + v
+        return self
+
+class Histogram(Counts):
+    """
+    Open set of counters (missing keys count as 0): histogram[key] += 1
+    """
+    def __missing__(self, key):
+        return 0
+
+    def add(self, key, n = 1):
+        self[key] += n
+
+class CountArray(list, Accumulator):
+    """
+    Counters indexed by small integers (e.g. bin ids). The array grows on demand.
+    """
+    def __init__(self, size = 0):
+        super().__init__([0] * size)
+
+    def add(self, idx, n = 1):
+        if idx >= len(self):
+            self.extend([0] * (idx + 1 - len(self)))
+        self[idx] += n
+
+    def merge(self, other):
+        self._check_mergeable(other)
+        if len(other) > len(self):
+            self.extend([0] * (len(other) - len(self)))
+        for i, v in enumerate(other):
+            self[i] += v
+        return self
+
+class Nested(dict, Accumulator):
+    """
+    Accumulators grouped by key (label, bin, ...). Sub-accumulators are
+    created on first access with factory(), which must be picklable
+    (a class or a functools.partial) so that results can cross processes.
+    """
+    def __init__(self, factory):
+        super().__init__()
+        self.factory = factory
+
+    def __missing__(self, key):
+        acc = self[key] = self.factory()
+        return acc
+
+    def merge(self, other):
+        self._check_mergeable(other)
+        for k, v in other.items():
+            if k in self:
+                self[k].merge(v)
+            else:
+                self[k] = v
+        return self
+
+class Vocabulary(Accumulator):
+    """
+    Interns hashable items (labels, ...) as consecutive integer ids.
+    Ids are local to a vocabulary: remap(other) merges other's items and
+    returns the list translating other's ids into self's ids.
+    """
+    def __init__(self):
+        self._ids   = {}
+        self._items = []
+
+    def id(self, item):
+        i = self._ids.get(item)
+        if i is None:
+            i = self._ids[item] = len(self._items)
+            self._items.append(item)
+        return i
+
+    def get(self, item, default = None):
+        return self._ids.get(item, default)
+
+    def __getitem__(self, i):
+        return self._items[i]
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def remap(self, other):
+        return [self.id(item) for item in other._items]
+
+    def merge(self, other):
+        self._check_mergeable(other)
+        self.remap(other)
+        return self
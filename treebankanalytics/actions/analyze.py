@@ -1,17 +1,30 @@
-import os, re, sys, abc, numbers
+import os, re, sys, abc, functools, heapq, itertools
 from collections import defaultdict
 from treebankanalytics.graphs.Graph import Graph, Node
+from treebankanalytics.actions.accumulators import MergeNotDefinedError, Accumulator, Counts, Histogram, Nested, Vocabulary
+from treebankanalytics.actions.sketches import SpaceSaving, Cardinality
+from treebankanalytics.actions.bins import Bins, BinnedCounts
+from treebankanalytics.actions.spill import SpilledCounts, footprint
+from treebankanalytics.formatters.streamed import StreamedTable
 
 __all__ = ['MergeNotDefinedError', 'Analyzer', 'PropertyAnalyzer', 'VoidAnalyzer',
-'CrossingEdgesAnalyzer', 'NonPlanarAnalyzer', 'CyclesAnalyzer', 'LabelsAnalyzer', 'EdgeLengthBinsAnalyzer', 'LexicalLabelPairsAnalyzer', 'LexicalPairsByLabelAnalyzer',
-'SentenceLengthBinsAnalyzer', 'DependencyPathsAnalyzer']
-
-class MergeNotDefinedError(Exception):
-    pass
+'CrossingEdgesAnalyzer', 'NonPlanarAnalyzer', 'MultiplanarityAnalyzer', 'NonProjectivityAnalyzer', 'CyclesAnalyzer', 'LabelsAnalyzer', 'EdgeLengthBinsAnalyzer', 'LexicalLabelPairsAnalyzer', 'LexicalPairsByLabelAnalyzer',
+'SentenceLengthBinsAnalyzer', 'DependencyPathsAnalyzer', 'VocabularyAnalyzer']
 
 class PropertyAnalyzer(object):
-    def __init__(self, graph, config):
-        self._graph = graph
+    """
+    An analyzer is built once per run. For each sentence, analyze() updates
+    in place the accumulator returned by accumulator(). table() returns the
+    formatted table, or formatter.stream(rows) to format large tables
+    row by row while they are written.
+
+    Analyzers whose results for a sentence only depend on its graph and
+    whose accumulators merge exactly set memoizable, so that their results
+    can be reused for repeated graphs (see SentenceMemo).
+    """
+    memoizable = False
+
+    def __init__(self, config):
         self._config = config
 
     @classmethod
@@ -20,11 +33,11 @@ class PropertyAnalyzer(object):
         pass
 
     @abc.abstractmethod
-    def analyze(self):
+    def accumulator(self):
         pass
 
     @abc.abstractmethod
-    def get_results(self):
+    def analyze(self, graph, acc):
         pass
 
     @classmethod
@@ -32,74 +45,214 @@ class PropertyAnalyzer(object):
     def table(cls, results, formatter):
         pass
 
-class DependencyPathsAnalyzer(PropertyAnalyzer):
-    def __init__(self, graph, config):
-        super().__init__(graph, config)
+class PathCounts(Accumulator):
+    """
+    Counts of label paths. A path is interned as (label, suffix path id),
+    the empty suffix being -1, so that paths sharing a suffix share its id.
+    Path strings are only built by path().
+    """
+    def __init__(self):
+        self.paths  = Vocabulary()
+        self.counts = Histogram()
+        self._extensions = {}
+
+    def extensions(self, label):
+        """
+        Cache label -> {suffix id: id of the path label + suffix}
+        """
+        ext = self._extensions.get(label)
+        if ext is None:
+            ext = self._extensions[label] = {}
+        return ext
+
+    def extend(self, label, suffix):
+        pid = self.paths.id((label, suffix))
+        self.extensions(label)[suffix] = pid
+        return pid
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_extensions'] = {}
+        return state
+
+    def labels(self, pid):
+        labels = []
+        while pid >= 0:
+            label, pid = self.paths[pid]
+            labels.append(label)
+        return tuple(labels)
+
+    def path(self, pid):
+        return "-".join(self.labels(pid))
+
+    def merge(self, other):
+        self._check_mergeable(other)
+        #A suffix is always interned before the paths extending it
+        remap = []
+        for label, suffix in other.paths:
+            remap.append(self.paths.id((label, remap[suffix] if suffix >= 0 else -1)))
+        for pid, n in other.counts.items():
+            self.counts[remap[pid]] += n
+        return self
+
+def _by_count(record):
+    return -record[1], record[2]
+
+def _largest(items, top = None):
+    """
+    (key, count) pairs by decreasing count, equal counts in iteration
+    order. With top, only the top first ones are selected (partial sort).
+    """
+    if top is None:
+        return sorted(items, key=lambda k: k[1], reverse=True)
+    return heapq.nlargest(top, items, key=lambda k: k[1])
+
+def _parse_top(scorer):
+    return scorer['topN'] if 'topN' in scorer else None
+
+class SpillableCountsMixin(object):
+    """
+    Counts which Analyzer can spill to disk under a memory budget:
+    spill_items() flattens an accumulator into (key, count) pairs in
+    insertion order, unspill() rebuilds it from SpilledCounts. table()
+    also accepts SpilledCounts.
+    """
+    def spillable(self):
+        return not getattr(self, '_approximate', False)
+
+    def spill_items(self, acc):
+        return acc.items()
+
+    def unspill(self, spilled):
+        acc = self.accumulator()
+        for key, count in spilled.ranked():
+            acc[key] = count
+        return acc
+
+class DependencyPathsAnalyzer(SpillableCountsMixin, PropertyAnalyzer):
+    def __init__(self, config):
+        super().__init__(config)
         self._length = 2
-        self._paths = {}
+        self._top_n  = None
         self._parse_config()
 
     def _parse_config(self):
-        cls = eval(self.__class__.__name__)
-        if not cls.name() in self._config:
+        if not DependencyPathsAnalyzer.name() in self._config:
             return
-        scorer = self._config[cls.name()]
+        scorer = self._config[DependencyPathsAnalyzer.name()]
         self._length = scorer['length'] if 'length' in scorer else 2
+        self._top_n  = _parse_top(scorer)
 
     @classmethod
     def name(cls):
         return "DependencyPathsAnalyzer"
 
-    def _path_rec(self, parent, labels, paths):
-        try:
-            targets = self._graph.targets_of(parent)
-        except AttributeError:
-            targets = {}
-
-        for idx in targets:
-            e = targets[idx]
-            label = e['label']
-            labels.append(label)
-            if len(labels) == self._length:
-                paths.append("-".join(labels))
-                labels.pop(-1)
+    def accumulator(self):
+        return PathCounts()
+
+    def analyze(self, graph, acc):
+        """
+        Count label paths of self._length edges by dynamic programming:
+        the table of paths of length k starting from a node is built from
+        the tables of length k-1 of its targets, each computed once.
+        """
+        sources = []
+        for n in graph.nodes():
+            try:
+                sources.append((n.index(), graph.targets_of(n)))
+            except AttributeError:
+                pass
+
+        suffixes = {} #node -> {path id: number of paths of length k-1 from node}
+        for k in range(self._length):
+            tables = {}
+            for nidx, targets in sources:
+                table = {}
+                for tidx, e in targets.items():
+                    label = e['label']
+                    ext   = acc.extensions(label)
+                    if k == 0:
+                        pid = ext.get(-1)
+                        if pid is None:
+                            pid = acc.extend(label, -1)
+                        table[pid] = table.get(pid, 0) + 1
+                    elif tidx in suffixes:
+                        for suffix, n in suffixes[tidx].items():
+                            pid = ext.get(suffix)
+                            if pid is None:
+                                pid = acc.extend(label, suffix)
+                            table[pid] = table.get(pid, 0) + n
+                if table:
+                    tables[nidx] = table
+            suffixes = tables
+
+        counts = acc.counts
+        for nidx, table in suffixes.items():
+            if nidx == 0: #Paths starting from the root are not counted
+                continue
+            for pid, n in table.items():
+                counts[pid] += n
+
+    def spill_items(self, acc):
+        return ((acc.labels(pid), n) for pid, n in acc.counts.items())
+
+    def unspill(self, spilled):
+        acc = PathCounts()
+        for labels, count in spilled.ranked():
+            pid = -1
+            for label in reversed(labels):
+                pid = acc.paths.id((label, pid))
+            acc.counts[pid] = count
+        return acc
+
+    def table(self, results, formatter):
+        return formatter.stream(self._rows(results))
+
+    def _rows(self, results):
+        if isinstance(results, SpilledCounts):
+            total = results.total()
+            r = (("-".join(labels), n) for labels, n in results.ranked(lambda k: (-k[1], "-".join(k[0])), self._top_n))
+        else:
+            total = sum(results.counts.values())
+            paths = ((results.path(pid), n) for pid, n in results.counts.items())
+            if self._top_n is None:
+                r = sorted(paths, key=lambda k: (-k[1], k[0]))
             else:
-                self._path_rec(e.target(), labels, paths)
-
-        if len(labels) > 0:
-           labels.pop(-1)
-
-    def analyze(self):
-        paths = []
-        for nidx in self._graph.nodes()[1:]:
-            self._path_rec(nidx, [], paths)
-        for path in paths:
-            self._paths[path] = self._paths.setdefault(path, 0) + 1
-
-    def get_results(self):
-        return {'Paths': self._paths, 'Total': sum(self._paths.values())}
+                r = heapq.nsmallest(self._top_n, paths, key=lambda k: (-k[1], k[0]))
 
-    @classmethod
-    def table(cls, results, formatter):
-        r = {'Paths': {}}
-        total = results['Total']
-
-        for path in results['Paths']:
-            r['Paths'][path] = results['Paths'][path] / total * 100.0
-        r = sorted(r['Paths'].items(), key= lambda k: k[1], reverse = True)
-
-        table = [['Path', '#', '%', "% Cumulated"]]
+        yield ['Path', '#', '%', "% Cumulated"]
         cumul = 0.0
-        for path, percent in r:
-            table.append([path, str(results['Paths'][path]), str(percent), str(cumul + percent)])
+        for path, n in r:
+            percent = n / total * 100.0
+            yield [path, str(n), str(percent), str(cumul + percent)]
             cumul += percent
-        return formatter.format(table)
 
-class LexicalPairsByLabelAnalyzer(PropertyAnalyzer):
-    def __init__(self, graph, config):
-        super().__init__(graph, config)
+class ApproximateCountsMixin(object):
+    """
+    Optional bounded-memory counting with a SpaceSaving sketch (options
+    approximate, capacity and topK of the analyzer's config section)
+    """
+    def _parse_approximate_config(self, scorer):
+        self._approximate = scorer['approximate'] if 'approximate' in scorer else False
+        self._capacity    = scorer['capacity'] if 'capacity' in scorer else 10000
+        self._top         = scorer['topK'] if 'topK' in scorer else 20
+
+    def _counter(self):
+        if self._approximate:
+            return SpaceSaving(self._capacity, self._top)
+        return Histogram()
+
+    @staticmethod
+    def _approximate_rows(sketch):
+        for (s, t), count, error in sketch.items():
+            yield "%s / %s" % (s, t), str(count), str(error)
+
+class LexicalPairsByLabelAnalyzer(ApproximateCountsMixin, SpillableCountsMixin, PropertyAnalyzer):
+    def __init__(self, config):
+        super().__init__(config)
         self._lex_info = "token"
-        self._pairs = defaultdict(dict)
+        self._approximate = False
+        self._top_n = None
         self._parse_config()
 
     def _parse_config(self):
@@ -107,6 +260,8 @@ class LexicalPairsByLabelAnalyzer(PropertyAnalyzer):
             return
         scorer = self._config[LexicalPairsByLabelAnalyzer.name()]
         self._lex_info = scorer['lexical'] if 'lexical' in scorer else "token"
+        self._top_n    = _parse_top(scorer)
+        self._parse_approximate_config(scorer)
 
         if self._lex_info not in ('token', 'lemma', 'pos', 'cpos'):
             raise KeyError('lexical option for %s should be token or lemma or cpos or pos' % LexicalPairsByLabelAnalyzer.name())
@@ -115,45 +270,64 @@ class LexicalPairsByLabelAnalyzer(PropertyAnalyzer):
     def name(cls):
         return "LexicalPairsByLabelAnalyzer"
 
-    def _get_lex_info(self, nidx):
-        node = self._graph.node(nidx)
+    def accumulator(self):
+        if self._approximate:
+            return Nested(functools.partial(SpaceSaving, self._capacity, self._top))
+        return Nested(Histogram)
+
+    def _get_lex_info(self, graph, nidx):
+        node = graph.node(nidx)
         return node[self._lex_info]
 
-    def analyze(self):
-        for e in self._graph.edges():
+    def analyze(self, graph, acc):
+        for e in graph.edges():
             label = e['label']
-            p     = (self._get_lex_info(e.source()), self._get_lex_info(e.target()))
-            self._pairs[label][p] = self._pairs[label].setdefault(p, 0) + 1
-
-    def get_results(self):
-        return {'Edges': len(self._graph), 'Pairs': self._pairs, 'Nodes': self._graph.order()}
+            p     = (self._get_lex_info(graph, e.source()), self._get_lex_info(graph, e.target()))
+            acc[label].add(p)
+
+    def spill_items(self, acc):
+        return (((label,) + p, n) for label, pairs in acc.items() for p, n in pairs.items())
+
+    def unspill(self, spilled):
+        acc = self.accumulator()
+        for key, count in spilled.ranked():
+            acc[key[0]][key[1:]] = count
+        return acc
+
+    def table(self, results, formatter):
+        return formatter.stream(self._rows(results))
+
+    def _spilled_pairs(self, results):
+        if self._top_n is None:
+            return ((key[0], key[1:], n) for key, n in results.ranked(lambda k: (k[0][0], -k[1], k[2])))
+        #Counts are merged in key order, so the pairs of each label are contiguous
+        return ((label, key[1:], n) for label, records in itertools.groupby(results.items(), lambda k: k[0][0])
+                for key, n, _ in heapq.nsmallest(self._top_n, records, key=_by_count))
+
+    def _rows(self, results):
+        if isinstance(results, SpilledCounts):
+            pairs = self._spilled_pairs(results)
+        elif any(isinstance(sketch, SpaceSaving) for sketch in results.values()):
+            yield ['Label', 'Pair', '#', 'Error']
+            for label in sorted(results):
+                for row in self._approximate_rows(results[label]):
+                    yield [label] + list(row)
+            return
+        else:
+            pairs = ((label, p, n) for label in sorted(results) for p, n in _largest(results[label].items(), self._top_n))
 
-    @classmethod
-    def table(cls, results, formatter):
-        r = {'Pairs': defaultdict(dict)}
-        for label in results['Pairs']:
-            for s, t in results['Pairs'][label]:
-                r['Pairs'][label]["%s / %s" % (s, t)] = results['Pairs'][label][(s,t)]
-
-        sorted_ = {}
-        for label in r['Pairs']:
-            ssorted_ = sorted( r['Pairs'][label].items(), key=lambda k: k[1], reverse=True )
-            sorted_[label] = ssorted_
-        sorted_ = sorted( sorted_.items(), key=lambda k: k[0] )
-
-        table = [['Label', 'Pair', '#']]
-        for label, list_of_pairs in sorted_:
-            for pair, freq in list_of_pairs:
-                table.append([label, pair, str(freq)])
-        return formatter.format(table)
+        yield ['Label', 'Pair', '#']
+        for label, (s, t), n in pairs:
+            yield [label, "%s / %s" % (s, t), str(n)]
 
 
-class LexicalLabelPairsAnalyzer(PropertyAnalyzer):
-    def __init__(self, graph, config):
-        super().__init__(graph, config)
+class LexicalLabelPairsAnalyzer(ApproximateCountsMixin, SpillableCountsMixin, PropertyAnalyzer):
+    def __init__(self, config):
+        super().__init__(config)
         self._lex_info = "token"
         self._type = "head"
-        self._pairs = {}
+        self._approximate = False
+        self._top_n = None
         self._parse_config()
 
     def _parse_config(self):
@@ -162,6 +336,8 @@ class LexicalLabelPairsAnalyzer(PropertyAnalyzer):
         scorer = self._config[LexicalLabelPairsAnalyzer.name()]
         self._lex_info = scorer['lexical'] if 'lexical' in scorer else "token"
         self._type     = scorer['type'] if 'type' in scorer else 'head'
+        self._top_n    = _parse_top(scorer)
+        self._parse_approximate_config(scorer)
 
         if self._lex_info not in ('token', 'lemma', 'pos', 'cpos'):
             raise KeyError('lexical option for %s should be token or lemma or cpos or pos' % LexicalLabelPairsAnalyzer.name())
@@ -172,8 +348,11 @@ class LexicalLabelPairsAnalyzer(PropertyAnalyzer):
     def name(cls):
         return "LexicalLabelPairsAnalyzer"
 
-    def _get_lex_info(self, nidx):
-        node = self._graph.node(nidx)
+    def accumulator(self):
+        return self._counter()
+
+    def _get_lex_info(self, graph, nidx):
+        node = graph.node(nidx)
         return node[self._lex_info]
 
     def _get_lex(self, edge):
@@ -185,71 +364,135 @@ class LexicalLabelPairsAnalyzer(PropertyAnalyzer):
             yield edge.source()
             yield edge.target()
 
-    def analyze(self):
-        for e in self._graph.edges():
+    def analyze(self, graph, acc):
+        for e in graph.edges():
             label = e['label']
             for nidx in self._get_lex(e):
-                lex   = self._get_lex_info(nidx)
-                self._pairs[(lex, label)] = self._pairs.setdefault((lex, label), 0) + 1
+                lex   = self._get_lex_info(graph, nidx)
+                acc.add((lex, label))
 
-    def get_results(self):
-        return {'Edges': len(self._graph), 'Pairs': self._pairs, 'Nodes': self._graph.order()}
+    def table(self, results, formatter):
+        return formatter.stream(self._rows(results))
+
+    def _rows(self, results):
+        if isinstance(results, SpaceSaving):
+            yield ['Pair', '#', 'Error']
+            for row in self._approximate_rows(results):
+                yield list(row)
+            return
+
+        if isinstance(results, SpilledCounts):
+            pairs = results.ranked(_by_count, self._top_n)
+        else:
+            pairs = _largest(results.items(), self._top_n)
+        yield ['Pair', '#']
+        for p, n in pairs:
+            yield ["%s / %s" % p, str(n)]
+
+
+class VocabularyAnalyzer(PropertyAnalyzer):
+    """
+    Number of distinct tokens, lemmas, POS and (lemma, label) pairs in the
+    corpus, and of distinct tokens, lemmas and POS of the dependents of each
+    label. Counts are exact up to threshold types, then estimated with
+    HyperLogLog sketches of 2^precision registers.
+    """
+    KINDS = ('token', 'lemma', 'pos', 'lemma/label')
+
+    def __init__(self, config):
+        super().__init__(config)
+        self._threshold = 10000
+        self._precision = 12
+        self._parse_config()
+
+    def _parse_config(self):
+        if not VocabularyAnalyzer.name() in self._config:
+            return
+        scorer = self._config[VocabularyAnalyzer.name()]
+        self._threshold = scorer['threshold'] if 'threshold' in scorer else 10000
+        self._precision = scorer['precision'] if 'precision' in scorer else 12
 
     @classmethod
-    def table(cls, results, formatter):
-        r = {'Pairs': {}}
-        for lex, label in results['Pairs']:
-            p = (lex, label)
-            r['Pairs']["%s / %s" % (lex, label)] = results['Pairs'][p]
+    def name(cls):
+        return "VocabularyAnalyzer"
 
-        sorted_ = sorted(r['Pairs'].items(), key=lambda k: k[1], reverse=True)
+    def accumulator(self):
+        #Keyed by (label, kind), label being None for the whole corpus
+        return Nested(functools.partial(Cardinality, self._threshold, self._precision))
+
+    def analyze(self, graph, acc):
+        tokens, lemmas, poss = acc[(None, 'token')], acc[(None, 'lemma')], acc[(None, 'pos')]
+        for n in graph.nodes()[1:]:
+            tokens.add(n['token'])
+            lemmas.add(n['lemma'])
+            poss.add(n['pos'])
+
+        pairs = acc[(None, 'lemma/label')]
+        for e in graph.edges():
+            label = e['label']
+            dep   = graph.node(e.target())
+            pairs.add((dep['lemma'], label))
+            acc[(label, 'token')].add(dep['token'])
+            acc[(label, 'lemma')].add(dep['lemma'])
+            acc[(label, 'pos')].add(dep['pos'])
 
-        table = [['Pair', '#']]
-        for label, percent in sorted_:
-            table.append([label, str(r['Pairs'][label])])
+    @classmethod
+    def table(cls, results, formatter):
+        def sorting(k):
+            label, kind = k
+            return (label is not None, label or '', cls.KINDS.index(kind))
+
+        table = [['Label', 'Type', '# Types', 'Error', '# Occurrences', 'Types / Occurrences']]
+        for label, kind in sorted(results, key=sorting):
+            c = results[(label, kind)]
+            types = c.estimate()
+            table.append(['ALL' if label is None else label, kind, "%.0f" % types, "%.0f" % c.error(),
+                          str(c.total), str(types / c.total if c.total > 0 else 0.)])
         return formatter.format(table)
 
+class LabelsAnalyzer(SpillableCountsMixin, PropertyAnalyzer):
+    def __init__(self, config):
+        super().__init__(config)
+        self._top_n = None
+        self._parse_config()
 
-class LabelsAnalyzer(PropertyAnalyzer):
-    def __init__(self, graph, config):
-        super().__init__(graph, config)
-        self._labels = {}
+    def _parse_config(self):
+        if not LabelsAnalyzer.name() in self._config:
+            return
+        scorer = self._config[LabelsAnalyzer.name()]
+        self._top_n = _parse_top(scorer)
 
     @classmethod
     def name(cls):
         return "LabelsAnalyzer"
 
-    def analyze(self):
-        for e in self._graph.edges():
-            label = e['label']
-            self._labels[label] = self._labels.setdefault(label, 0) + 1
+    def accumulator(self):
+        return Histogram()
 
-    def get_results(self):
-        return {'Edges': len(self._graph), 'Labels': self._labels}
+    def analyze(self, graph, acc):
+        for e in graph.edges():
+            acc[e['label']] += 1
 
-    @classmethod
-    def table(cls, results, formatter):
-        r = {'Percents': {}, 'Labels': {}}
-        for label in results['Labels']:
-            r['Percents'][label] = results['Labels'][label] / results['Edges'] * 100.0
-            r['Labels'][label]   = results['Labels'][label]
+    def table(self, results, formatter):
+        return formatter.stream(self._rows(results))
 
-        sorted_percents = sorted(r['Percents'].items(), key=lambda k: k[1], reverse=True)
+    def _rows(self, results):
+        if isinstance(results, SpilledCounts):
+            edges, labels = results.total(), results.ranked(_by_count, self._top_n)
+        else:
+            edges, labels = sum(results.values()), _largest(results.items(), self._top_n)
 
-        table = [['Label', '#', '%', '% Cumulated']]
+        yield ['Label', '#', '%', '% Cumulated']
         cumul = 0.0
-        for label, percent in sorted_percents:
-            table.append([label, str(r['Labels'][label]), str(percent), str(cumul + percent)])
+        for label, n in labels:
+            percent = n / edges * 100.0
+            yield [label, str(n), str(percent), str(cumul + percent)]
             cumul += percent
-        return formatter.format(table)
 
 class EdgeLengthBinsAnalyzer(PropertyAnalyzer):
-    def __init__(self, graph, config):
-        super().__init__(graph, config)
-        self._lengths = {}
-        self._bin_start = 1
-        self._bin_end   = 100
-        self._bin_step  = 10
+    def __init__(self, config):
+        super().__init__(config)
+        self._bins = Bins()
         self._parse_config()
 
     @classmethod
@@ -259,57 +502,30 @@ class EdgeLengthBinsAnalyzer(PropertyAnalyzer):
     def _parse_config(self):
         if not EdgeLengthBinsAnalyzer.name() in self._config:
             return
-        scorer = self._config[EdgeLengthBinsAnalyzer.name()]
-        self._bin_start = scorer['binStart'] if 'binStart' in scorer else 1
-        self._bin_end   = scorer['binStop'] if 'binStop' in scorer else 100
-        self._bin_step  = scorer['binStep'] if 'binStep' in scorer else 10
-
-    def _determine_bins(self, e):
-        size = abs( e.source() - e.target() )
-        for low,high in zip( range(self._bin_start, self._bin_end+1, self._bin_step), range(self._bin_step, self._bin_end+1, self._bin_step) ):
-            if size >= low and size <= high:
-                return "{0}-{1}".format(low, high)
-        return "{0}+".format(self._bin_end)
-
-    def analyze(self):
-        for e in self._graph.edges():
-            _bin = self._determine_bins(e)
-            self._lengths[_bin] = self._lengths.setdefault(_bin, 0) + 1
-
-    def get_results(self):
-        return {'Edges': len(self._graph), 'Lengths': self._lengths}
+        self._bins = Bins.from_config(self._config[EdgeLengthBinsAnalyzer.name()])
 
-    @classmethod
-    def table(cls, results, formatter):
-        def sorting(k):
-            info = k[0].split('-')
-            if len(info) == 1:
-                t = info[0][:-1]
-                return (int(t), int(t))
-            else:
-                return (int(info[0]), int(info[1]))
+    def accumulator(self):
+        return BinnedCounts(self._bins)
 
-        r = {'Percents': {}, 'Lengths': {}}
-        for dist in results['Lengths']:
-            r['Percents'][dist] = results['Lengths'][dist] / results['Edges'] * 100.0
-            r['Lengths'][dist]   = results['Lengths'][dist]
+    def analyze(self, graph, acc):
+        bins = self._bins
+        for e in graph.edges():
+            acc.add(bins(abs( e.source() - e.target() )))
 
-        sorted_percents = sorted(r['Percents'].items(), key=sorting)
+    @classmethod
+    def table(cls, results, formatter):
+        rows  = results.rows()
+        edges = sum(n for _, n in rows)
 
         table = [['Length', '#', '%']]
-        cumul = 0.0
-        for dist, percent in sorted_percents:
-            table.append([dist, str(r['Lengths'][dist]), str(percent)])
-            cumul += percent
+        for dist, n in rows:
+            table.append([dist, str(n), str(n / edges * 100.0)])
         return formatter.format(table)
 
 class SentenceLengthBinsAnalyzer(PropertyAnalyzer):
-    def __init__(self, graph, config):
-        super().__init__(graph, config)
-        self._lengths = {}
-        self._bin_start = 1
-        self._bin_end   = 100
-        self._bin_step  = 10
+    def __init__(self, config):
+        super().__init__(config)
+        self._bins = Bins()
         self._parse_config()
 
     @classmethod
@@ -319,62 +535,39 @@ class SentenceLengthBinsAnalyzer(PropertyAnalyzer):
     def _parse_config(self):
         if not SentenceLengthBinsAnalyzer.name() in self._config:
             return
-        scorer = self._config[SentenceLengthBinsAnalyzer.name()]
-        self._bin_start = scorer['binStart'] if 'binStart' in scorer else 1
-        self._bin_end   = scorer['binStop'] if 'binStop' in scorer else 100
-        self._bin_step  = scorer['binStep'] if 'binStep' in scorer else 10
+        self._bins = Bins.from_config(self._config[SentenceLengthBinsAnalyzer.name()])
 
-    def _determine_bins(self, e):
-        for low,high in zip( range(self._bin_start, self._bin_end+1, self._bin_step), range(self._bin_step, self._bin_end+1, self._bin_step) ):
-            if e >= low and e <= high:
-                return "{0}-{1}".format(low, high)
-        return "{0}+".format(self._bin_end)
+    def accumulator(self):
+        return BinnedCounts(self._bins)
 
-    def analyze(self):
-        _bin = self._determine_bins(self._graph.order())
-        self._lengths[_bin] = self._lengths.setdefault(_bin, 0) + 1
-
-    def get_results(self):
-        return {'Lengths': self._lengths, 'Total': 1}
+    def analyze(self, graph, acc):
+        acc.add(self._bins(graph.order()))
 
     @classmethod
     def table(cls, results, formatter):
-        def sorting(k):
-            info = k[0].split('-')
-            if len(info) == 1:
-                t = info[0][:-1]
-                return (int(t), int(t))
-            else:
-                return (int(info[0]), int(info[1]))
-
-        r = {'Percents': {}, 'Lengths': {}}
-        for dist in results['Lengths']:
-            r['Percents'][dist] = results['Lengths'][dist] / results['Total'] * 100.0
-            r['Lengths'][dist]   = results['Lengths'][dist]
-
-        sorted_percents = sorted(r['Percents'].items(), key=sorting)
+        rows  = results.rows()
+        total = sum(n for _, n in rows)
 
         table = [['Length', '#', '%']]
-        cumul = 0.0
-        for dist, percent in sorted_percents:
-            table.append([dist, str(r['Lengths'][dist]), str(percent)])
-            cumul += percent
+        for dist, n in rows:
+            table.append([dist, str(n), str(n / total * 100.0)])
         return formatter.format(table)
 
 class CyclesAnalyzer(PropertyAnalyzer):
-    def __init__(self, graph, config):
-        super().__init__(graph, config)
-        self._cycles = 0
+    memoizable = True
 
     @classmethod
     def name(cls):
         return "CyclesAnalyzer"
 
-    def analyze(self):
-        self._cycles = len(Graph.strongly_connected_components(self._graph))
+    def accumulator(self):
+        return Counts('Graphs', 'DAGs', 'Cycles')
 
-    def get_results(self):
-        return {'Graphs': 1, 'DAGs': 0 if self._cycles > 0 else 1, 'Cycles': self._cycles}
+    def analyze(self, graph, acc):
+        cycles = len(Graph.strongly_connected_components(graph))
+        acc['Graphs'] += 1
+        acc['DAGs']   += 0 if cycles > 0 else 1
+        acc['Cycles'] += cycles
 
     @classmethod
     def table(cls, results, formatter):
@@ -385,19 +578,18 @@ class CyclesAnalyzer(PropertyAnalyzer):
 
 
 class NonPlanarAnalyzer(PropertyAnalyzer):
-    def __init__(self, graph, config):
-        super().__init__(graph, config)
-        self._non_planar = 0
+    memoizable = True
 
     @classmethod
     def name(cls):
         return "NonPlanarAnalyzer"
 
-    def analyze(self):
-        self._non_planar = 1 if len(self._graph.crossing_edges()) > 0 else 0
+    def accumulator(self):
+        return Counts('Graphs', 'NonPlanar')
 
-    def get_results(self):
-        return {'Graphs': 1, 'NonPlanar': self._non_planar}
+    def analyze(self, graph, acc):
+        acc['Graphs']    += 1
+        acc['NonPlanar'] += 1 if len(graph.crossing_edges()) > 0 else 0
 
     @classmethod
     def table(cls, results, formatter):
@@ -406,21 +598,274 @@ class NonPlanarAnalyzer(PropertyAnalyzer):
         table.append([str(e) for e in r])
         return formatter.format(table)
 
+class MultiplanarityAnalyzer(PropertyAnalyzer):
+    """
+    Number of planes (pages) needed to draw each graph without crossings,
+    i.e. the chromatic number of its crossing graph (Gomez-Rodriguez and
+    Nivre, 2013). 2-planarity is decided by a bipartiteness check, higher
+    numbers by backtracking up to maxPlanes, above which graphs are only
+    reported as needing more than maxPlanes planes.
+    """
+    memoizable = True
+
+    def __init__(self, config):
+        super().__init__(config)
+        self._max_planes = 4
+        self._parse_config()
+
+    @classmethod
+    def name(cls):
+        return "MultiplanarityAnalyzer"
+
+    def _parse_config(self):
+        if not MultiplanarityAnalyzer.name() in self._config:
+            return
+        scorer = self._config[MultiplanarityAnalyzer.name()]
+        self._max_planes = scorer['maxPlanes'] if 'maxPlanes' in scorer else 4
+
+    def accumulator(self):
+        #(planes, exact) -> number of graphs, exact is False for graphs needing more than maxPlanes planes
+        return Histogram()
+
+    def _colorable(self, vertices, adj, k):
+        color = {}
+        def rec(i, used):
+            if i == len(vertices):
+                return True
+            v = vertices[i]
+            taken = set(color[w] for w in adj[v] if w in color)
+            for c in range(min(used + 1, k)): #Colors are interchangeable: try at most one new color
+                if c not in taken:
+                    color[v] = c
+                    if rec(i + 1, max(used, c + 1)):
+                        return True
+                    del color[v]
+            return False
+        return rec(0, 0)
+
+    def _component_planes(self, vertices, adj):
+        vertices = sorted(vertices, key=lambda v: len(adj[v]), reverse=True)
+        for k in range(3, self._max_planes + 1):
+            if self._colorable(vertices, adj, k):
+                return k, True
+        return self._max_planes + 1, False
+
+    def planes(self, graph):
+        if len(graph) == 0:
+            return 0, True
+        ids = dict((e, i) for i, e in enumerate(graph.edges()))
+        adj = [[] for _ in ids]
+        for e1, e2 in graph.crossing_pairs():
+            adj[ids[e1]].append(ids[e2])
+            adj[ids[e2]].append(ids[e1])
+
+        planes, side = (1, True), {}
+        for v in range(len(adj)):
+            if v in side or not adj[v]:
+                continue
+            side[v] = 0
+            component, bipartite = [v], True
+            for u in component: #Breadth first 2-coloring, component grows while iterated
+                for w in adj[u]:
+                    if w not in side:
+                        side[w] = 1 - side[u]
+                        component.append(w)
+                    elif side[w] == side[u]:
+                        bipartite = False
+            needed = (2, True) if bipartite else self._component_planes(component, adj)
+            planes = max(planes, needed)
+            if not planes[1]:
+                break
+        return planes
+
+    def analyze(self, graph, acc):
+        acc[self.planes(graph)] += 1
+
+    @classmethod
+    def table(cls, results, formatter):
+        graphs = sum(results.values())
+        table = [['Planes', '# Graphs', '% Graphs', '% Cumulated']]
+        cumul = 0.0
+        for (planes, exact), n in sorted(results.items()):
+            percent = n / graphs * 100.0
+            cumul += percent
+            table.append([str(planes) if exact else ">%i" % (planes - 1), str(n), str(percent), str(cumul)])
+        return formatter.format(table)
+
+def yields(graph):
+    """
+    Yield of each token node (the node and the nodes reachable from it) as a
+    bitset, bit i standing for node i. Strongly connected components are
+    found with an iterative Tarjan's algorithm, which completes them
+    successors first, so each yield is the union of the yields of the
+    successors, nodes of a cycle sharing the same yield.
+    """
+    succ = {}
+    for n in graph.nodes()[1:]:
+        try:
+            succ[n.index()] = list(graph.targets_of(n.index()))
+        except AttributeError:
+            succ[n.index()] = []
+
+    index, low, stack, on_stack, result = {}, {}, [], set(), {}
+    for s in succ:
+        if s in index:
+            continue
+        index[s] = low[s] = len(index)
+        stack.append(s)
+        on_stack.add(s)
+        work = [(s, iter(succ[s]))]
+        while work:
+            v, targets = work[-1]
+            for w in targets:
+                if w not in index:
+                    index[w] = low[w] = len(index)
+                    stack.append(w)
+                    on_stack.add(w)
+                    work.append((w, iter(succ[w])))
+                    break
+                elif w in on_stack:
+                    low[v] = min(low[v], index[w])
+            else:
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    low[u] = min(low[u], low[v])
+                if low[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack.discard(w)
+                        component.append(w)
+                        if w == v:
+                            break
+                    mask = 0
+                    for w in component:
+                        mask |= 1 << w
+                    for w in component:
+                        for t in succ[w]:
+                            if t in result:
+                                mask |= result[t]
+                    for w in component:
+                        result[w] = mask
+    return result
+
+def gap_degree(bits):
+    """
+    Number of gaps of a non empty bitset (number of runs of ones minus one)
+    """
+    return bin(bits & ~(bits << 1)).count('1') - 1
+
+def _span(bits):
+    low = bits & -bits
+    return ((1 << bits.bit_length()) - 1) & ~(low - 1)
+
+def _interleaves(y1, y2):
+    """
+    Whether l1 < l2 < r1 < r2 for some l1, r1 in y1 and l2, r2 in y2 (disjoint bitsets)
+    """
+    inside = y2 & _span(y1)
+    if not inside:
+        return False
+    l2 = (inside & -inside).bit_length() - 1
+    above = y1 >> (l2 + 1)
+    r1 = l2 + (above & -above).bit_length()
+    return (y2 >> (r1 + 1)) != 0
+
+class NonProjectivity(Accumulator):
+    """
+    Graph and node counts of NonProjectivityAnalyzer, and histogram of the
+    gap degree of graphs
+    """
+    def __init__(self):
+        self.counts      = Counts('Graphs', 'Nodes', 'GappedNodes', 'WellNested', 'OneEndpointCrossing')
+        self.gap_degrees = Histogram()
+
+    def merge(self, other):
+        self._check_mergeable(other)
+        self.counts.merge(other.counts)
+        self.gap_degrees.merge(other.gap_degrees)
+        return self
+
+class NonProjectivityAnalyzer(PropertyAnalyzer):
+    """
+    Mildly non-projective measures: gap degree (Holan et al., 1998),
+    well-nestedness (Bodirsky et al., 2005) and 1-endpoint-crossing (Pitler
+    et al., 2013). For graphs, the yield of a node is the set of the nodes
+    reachable from it. Yields are computed once as bitsets: gaps are counted
+    with bit operations and only the nodes with gaps are tested for
+    interleaving yields, since two disjoint yields can only interleave if
+    one of them has a gap. 1-endpoint-crossing is checked on the crossing
+    pairs of Graph.crossing_pairs.
+    """
+    memoizable = True
+
+    @classmethod
+    def name(cls):
+        return "NonProjectivityAnalyzer"
+
+    def accumulator(self):
+        return NonProjectivity()
+
+    def _well_nested(self, ys, gapped):
+        for u in gapped:
+            yu = ys[u]
+            for v, yv in ys.items():
+                if not yu & yv and _interleaves(yu, yv):
+                    return False
+        return True
+
+    def _one_endpoint_crossing(self, graph):
+        shared = {}
+        for e1, e2 in graph.crossing_pairs():
+            for e, other in ((e1, e2), (e2, e1)):
+                endpoints = set((other.source(), other.target()))
+                if e in shared:
+                    shared[e] &= endpoints
+                else:
+                    shared[e] = endpoints
+                if not shared[e]:
+                    return False
+        return True
+
+    def analyze(self, graph, acc):
+        ys = yields(graph)
+        gaps = dict((v, gap_degree(y)) for v, y in ys.items())
+        gapped = [v for v, g in gaps.items() if g > 0]
+
+        counts = acc.counts
+        counts['Graphs']      += 1
+        counts['Nodes']       += len(ys)
+        counts['GappedNodes'] += len(gapped)
+        counts['WellNested']  += 1 if self._well_nested(ys, gapped) else 0
+        counts['OneEndpointCrossing'] += 1 if self._one_endpoint_crossing(graph) else 0
+        acc.gap_degrees[max(gaps.values()) if gaps else 0] += 1
+
+    @classmethod
+    def table(cls, results, formatter):
+        counts = results.counts
+        graphs = counts['Graphs']
+        table = [['Measure', '#', '%']]
+        for degree, n in sorted(results.gap_degrees.items()):
+            table.append(['Gap degree %i' % degree, str(n), str(n / graphs * 100.0)])
+        table.append(['Well-nested', str(counts['WellNested']), str(counts['WellNested'] / graphs * 100.0)])
+        table.append(['1-endpoint-crossing', str(counts['OneEndpointCrossing']), str(counts['OneEndpointCrossing'] / graphs * 100.0)])
+        table.append(['Nodes with gaps', str(counts['GappedNodes']), str(counts['GappedNodes'] / counts['Nodes'] * 100.0 if counts['Nodes'] else 0.0)])
+        return formatter.format(table)
+
 class CrossingEdgesAnalyzer(PropertyAnalyzer):
-    def __init__(self, graph, config):
-        super().__init__(graph, config)
-        self._size = len(self._graph)
-        self._crossings  = 0
+    memoizable = True
 
     @classmethod
     def name(cls):
         return "CrossingEdgesAnalyzer"
 
-    def analyze(self):
-        self._crossings += len(self._graph.crossing_edges()) / 2
+    def accumulator(self):
+        return Counts('Edges', 'Crossings')
 
-    def get_results(self):
-        return {'Edges': self._size, 'Crossings': self._crossings}
+    def analyze(self, graph, acc):
+        acc['Edges']     += len(graph)
+        acc['Crossings'] += len(graph.crossing_edges()) / 2
 
     @classmethod
     def table(cls, results, formatter):
@@ -430,11 +875,11 @@ class CrossingEdgesAnalyzer(PropertyAnalyzer):
         return formatter.format(table)
 
 class VoidAnalyzer(PropertyAnalyzer):
-    def __init__(self, graph, config):
-        super().__init__(graph, config)
-        self._order = self._graph.order()
+    memoizable = True
+
+    def __init__(self, config):
+        super().__init__(config)
         self._labels_as_void = set()
-        self._void  = 0
         self._parse_config()
 
     def _parse_config(self):
@@ -449,18 +894,19 @@ class VoidAnalyzer(PropertyAnalyzer):
     def name(cls):
         return "VoidAnalyzer"
 
-    def analyze(self):
-        for n in self._graph.nodes():
+    def accumulator(self):
+        return Counts('Tokens', 'Void')
+
+    def analyze(self, graph, acc):
+        acc['Tokens'] += graph.order()
+        for n in graph.nodes():
             try:
-                edges = self._graph.edges_of(n)
+                edges = graph.edges_of(n)
                 for edge in edges:
                     if edge['label'] in self._labels_as_void:
-                        self._void += 1
+                        acc['Void'] += 1
             except AttributeError:
-                self._void += 1
-
-    def get_results(self):
-        return {'Tokens': self._order, 'Void': self._void}
+                acc['Void'] += 1
 
     @classmethod
     def table(cls, results, formatter):
@@ -471,45 +917,137 @@ class VoidAnalyzer(PropertyAnalyzer):
 
 
 class Analyzer(object):
-    def __init__(self, formatter, config, analyzers = []):
-        self._analyzers = analyzers
+    """
+    Runs analyzers over a corpus. With max_memory (bytes), the counts of
+    spillable analyzers (see SpillableCountsMixin) are written to disk
+    whenever their estimated size exceeds it, and merged back exactly by
+    tables(). results() brings them back in memory. With memo (a
+    SentenceMemo), memoizable analyzers reuse the results of the graphs
+    already analyzed.
+    """
+    #Number of sentences between two estimations of the memory used
+    SPILL_CHECK = 256
+
+    def __init__(self, formatter, config, analyzers = [], profiler = None, max_memory = None, memo = None):
+        self._analyzers = [analyzer(config) for analyzer in analyzers]
         self._formatter = formatter
-        self._results   = {}
+        self._results   = dict((an.name(), an.accumulator()) for an in self._analyzers)
+        self._restored  = set()
         self._config    = config
+        self._profiler  = profiler
+        self._max_memory = max_memory
+        self._spilled    = {}
+        self._memo       = memo
+
+    def _measured(self, stage, fn, per_sentence = False):
+        if self._profiler is None:
+            return fn
+        return self._profiler.wrap(stage, fn, per_sentence)
 
     def analyze(self, graphs):
-        for graph in graphs:
-            for analyzer in self._analyzers:
-                an = analyzer(graph, self._config)
-                an.analyze()
-                self._accumulate(an, analyzer.name())
-        for analyzer in self._analyzers:
-            yield analyzer.name(), analyzer.table(self._results[analyzer.name()], self._formatter)
-
-    def _accumulate(self, an, name):
-        if name not in self._results:
-            self._results[name] = an.get_results()
-        else:
-            acc = self._results[name]
-            self._merge_dict(acc, an.get_results())
-            self._results[name] = acc
-
-    def _merge_dict(self, result, add):
-        for i, k in enumerate(add):
-            if not isinstance(add, list) and k not in result:
-                result[k] = add[k]
-            else:
-                if isinstance(add, list):
-                    v = k
-                else:
-                    v = add[k]
-
-                if isinstance(v, numbers.Number):
-                    if isinstance(add, list):
-                        results[i] += v
-                    else:
-                        result[k] += v
-                elif isinstance(v, list) or isinstance(v, dict):
-                    self._merge_dict(result[k], v)
-                else:
-                    raise MergeNotDefinedError('Merge not defined for this type (%s, %s)' % (str(v), type(v)) )
+        self.accumulate(graphs)
+        yield from self.tables()
+
+    def _analyze(self, an):
+        if self._memo is None or not an.memoizable:
+            return an.analyze
+        return self._memo.memoize(an.name(), self._config.get(an.name()), an.accumulator, an.analyze)
+
+    def _accumulating(self):
+        return [(self._measured('analyze ' + an.name(), self._analyze(an), True), self._results[an.name()])
+                for an in self._analyzers if an.name() not in self._restored]
+
+    def accumulate(self, graphs):
+        analyzers = self._accumulating()
+        if self._max_memory is None:
+            for graph in graphs:
+                for analyze, acc in analyzers:
+                    analyze(graph, acc)
+            return
+
+        for i, graph in enumerate(graphs, 1):
+            for analyze, acc in analyzers:
+                analyze(graph, acc)
+            if i % self.SPILL_CHECK == 0 and self._spill():
+                analyzers = self._accumulating()
+
+    def _spill(self):
+        """
+        Spill the largest counts until the others fit in half the budget
+        """
+        sizes = [(footprint(self._results[an.name()]), an) for an in self._analyzers
+                 if an.name() not in self._restored and hasattr(an, 'spillable') and an.spillable()]
+        total = sum(size for size, _ in sizes)
+        if total <= self._max_memory:
+            return False
+        for size, an in sorted(sizes, key=lambda k: -k[0]):
+            name = an.name()
+            if name not in self._spilled:
+                #Records of a run are sorted in memory: roughly 200 bytes each
+                self._spilled[name] = SpilledCounts(chunk=max(1000, self._max_memory // 200))
+            self._measured('spill ' + name, self._spilled[name].spill)(an.spill_items(self._results[name]))
+            self._results[name] = an.accumulator()
+            total -= size
+            if total <= self._max_memory // 2:
+                break
+        return True
+
+    def _finish(self, an):
+        """
+        Spilled counts of an, including those still in memory
+        """
+        spilled = self._spilled.pop(an.name())
+        spilled.spill(an.spill_items(self._results[an.name()]))
+        self._results[an.name()] = an.accumulator()
+        return spilled
+
+    def results(self):
+        for an in self._analyzers:
+            if an.name() in self._spilled:
+                spilled = self._finish(an)
+                self._results[an.name()] = an.unspill(spilled)
+                spilled.close()
+        return self._results
+
+    def restore(self, results):
+        """
+        Use results computed beforehand (e.g. cached) for some analyzers,
+        accumulate() skips them
+        """
+        self._results.update(results)
+        self._restored.update(results)
+
+    def pending(self):
+        """
+        Names of the analyzers whose results are not restored
+        """
+        return [an.name() for an in self._analyzers if an.name() not in self._restored]
+
+    def merge(self, results):
+        """
+        Reduce step: merge the results of another Analyzer (same config),
+        spilling the largest counts if they no longer fit in max_memory
+        """
+        for name, acc in results.items():
+            self._measured('merge ' + name, self._results[name].merge)(acc)
+        if self._max_memory is not None:
+            self._spill()
+
+    def tables(self):
+        """
+        (name, table) of the analyzers. Streamed tables are built when they
+        are written: writing them is profiled with the table stage, and
+        spilled counts are closed once they are written.
+        """
+        for an in self._analyzers:
+            stage   = 'table ' + an.name()
+            results = self._finish(an) if an.name() in self._spilled else self._results[an.name()]
+            table   = self._measured(stage, an.table)(results, self._formatter)
+            if isinstance(table, StreamedTable):
+                if self._profiler is not None:
+                    table.write = self._profiler.wrap(stage, table.write, count=False)
+                if isinstance(results, SpilledCounts):
+                    table.on_done(results.close)
+            elif isinstance(results, SpilledCounts):
+                results.close()
+            yield an.name(), table
@@ -0,0 +1,122 @@
+from treebankanalytics.actions.accumulators import CountArray, Nested
+
+__all__ = ['Bins', 'BinnedCounts', 'BinnedGroups']
+
+class Bins(object):
+    """
+    Maps integer values (sentence lengths, edge lengths, ...) to integer bin
+    ids in O(1) with a lookup table computed once. Bin labels are only built
+    by rows(), when tables are printed.
+
+    Scales (binScale option):
+    - linear: binStart-binStep, ... up to binStop (historical bins)
+    - log: binStart-(binStart*binBase - 1), ... up to binStop
+    - quantile: binCount bins holding the same number of items. Boundaries
+      depend on the data: bins(value) returns the value itself and values
+      are grouped by rows() from their exact distribution.
+    Values above binStop (and, for linear and log bins, below binStart) go to
+    the last bin, labelled binStop+.
+    """
+    def __init__(self, start = 1, stop = 100, step = 10, scale = 'linear', base = 2, count = 10):
+        if scale not in ('linear', 'log', 'quantile'):
+            raise KeyError('binScale should be linear or log or quantile')
+        self.start, self.stop, self.step = start, stop, step
+        self.scale, self.base, self.count = scale, base, count
+
+        if scale == 'linear':
+            self._bounds = list(zip( range(start, stop+1, step), range(step, stop+1, step) ))
+        elif scale == 'log':
+            if start < 1 or base < 2:
+                raise KeyError('log bins need binStart >= 1 and binBase >= 2')
+            self._bounds = []
+            low = start
+            while low <= stop:
+                self._bounds.append((low, min(low * base - 1, stop)))
+                low *= base
+        else:
+            self._bounds = []
+
+        #First bin containing each value up to stop, bins may overlap
+        self._overflow = len(self._bounds)
+        self._lookup   = [self._overflow] * (stop + 1)
+        for i, (low, high) in reversed(list(enumerate(self._bounds))):
+            for v in range(max(low, 0), high + 1):
+                self._lookup[v] = i
+
+    @classmethod
+    def from_config(cls, scorer):
+        scorer = scorer or {}
+        return cls(start = scorer['binStart'] if 'binStart' in scorer else 1,
+                   stop  = scorer['binStop'] if 'binStop' in scorer else 100,
+                   step  = scorer['binStep'] if 'binStep' in scorer else 10,
+                   scale = scorer['binScale'] if 'binScale' in scorer else 'linear',
+                   base  = scorer['binBase'] if 'binBase' in scorer else 2,
+                   count = scorer['binCount'] if 'binCount' in scorer else 10)
+
+    def __call__(self, value):
+        if self.scale == 'quantile':
+            return value
+        if 0 <= value <= self.stop:
+            return self._lookup[value]
+        return self._overflow
+
+    def label(self, i):
+        if i == self._overflow:
+            return "{0}+".format(self.stop)
+        return "{0}-{1}".format(*self._bounds[i])
+
+    def rows(self, ids, weight):
+        """
+        (label, [ids]) of the non empty bins, in order. weight(id) is the
+        number of items of id, used to compute quantile bins.
+        """
+        ids = sorted(ids)
+        if self.scale != 'quantile':
+            return [(self.label(i), [i]) for i in ids]
+
+        total = sum(weight(v) for v in ids)
+        groups, current, cumul = [], [], 0
+        for v in ids:
+            current.append(v)
+            cumul += weight(v)
+            if cumul * self.count >= (len(groups) + 1) * total:
+                groups.append(current)
+                current = []
+        if current:
+            groups.append(current)
+        return [("{0}-{1}".format(g[0], g[-1]), g) for g in groups]
+
+class BinnedCounts(CountArray):
+    """
+    Counts indexed by bin id
+    """
+    def __init__(self, bins):
+        super().__init__()
+        self.bins = bins
+
+    def rows(self):
+        """
+        (label, count) of the non empty bins, in order
+        """
+        ids = [i for i, n in enumerate(self) if n > 0]
+        return [(label, sum(self[i] for i in group)) for label, group in self.bins.rows(ids, self.__getitem__)]
+
+class BinnedGroups(Nested):
+    """
+    Accumulators indexed by bin id
+    """
+    def __init__(self, bins, factory):
+        super().__init__(factory)
+        self.bins = bins
+
+    def rows(self, weight):
+        """
+        (label, merged accumulator) of the non empty bins, in order
+        """
+        rows = []
+        for label, group in self.bins.rows(self.keys(), lambda i: weight(self[i])):
+            acc = self.factory()
+            for i in group:
+                acc.merge(self[i])
+            rows.append((label, acc))
+        return rows
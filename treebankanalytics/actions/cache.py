@@ -0,0 +1,189 @@
+import collections, hashlib, json, os, pickle, sqlite3
+from treebankanalytics import __version__
+
+__all__ = ['ResultCache', 'AnalyzerState', 'SentenceMemo', 'file_fingerprint', 'prefix_checksum', 'default_cache_dir']
+
+def default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'treebankanalytics')
+
+def file_fingerprint(path, block = 1 << 20):
+    """
+    Hash of the content of a file
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as stream:
+        for data in iter(lambda: stream.read(block), b''):
+            h.update(data)
+    return h.hexdigest()
+
+def prefix_checksum(path, size, block = 1 << 20):
+    """
+    Hash of the size and of the first and last blocks of the first size
+    bytes of a file: enough to check that an append-only file still starts
+    with the same content, in constant time.
+    """
+    h = hashlib.blake2b(str(size).encode('ascii'), digest_size=16)
+    with open(path, 'rb') as stream:
+        h.update(stream.read(min(block, size)))
+        if size > block:
+            stream.seek(max(block, size - block))
+            h.update(stream.read(size - max(block, size - block)))
+    return h.hexdigest()
+
+class ResultCache(object):
+    """
+    Results of analyzers (their accumulator) stored in a directory, keyed on
+    the content of the corpus, its format, the analyzer name and its config
+    section, so that changing a config only recomputes the analyzers whose
+    section changed.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def key(self, fingerprint, format, name, section):
+        data = json.dumps([__version__, fingerprint, format, name, section], sort_keys=True, default=str)
+        return hashlib.blake2b(data.encode('utf-8'), digest_size=16).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as stream:
+                return pickle.load(stream)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+
+    def put(self, key, results):
+        os.makedirs(self.directory, exist_ok=True)
+        #Written aside then renamed, so that concurrent runs never read a partial file
+        tmp = '%s.%i.tmp' % (self._path(key), os.getpid())
+        with open(tmp, 'wb') as stream:
+            pickle.dump(results, stream, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._path(key))
+
+class AnalyzerState(object):
+    """
+    Results of analyzers over the beginning of an append-only corpus, up to
+    offset (the end of the last sentence read), so that a later run only
+    analyzes the sentences appended since.
+    """
+    def __init__(self, key, offset = 0, checksum = None, results = None):
+        self.key      = key
+        self.offset   = offset
+        self.checksum = checksum
+        self.results  = results
+
+    @staticmethod
+    def config_key(format, config, names):
+        return json.dumps([__version__, format, [(name, config.get(name)) for name in names]], sort_keys=True, default=str)
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, 'rb') as stream:
+                state = pickle.load(stream)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+        return state if isinstance(state, cls) else None
+
+    def save(self, path):
+        tmp = '%s.%i.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as stream:
+            pickle.dump(self, stream, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def matches(self, corpus, key):
+        """
+        Whether this state was computed with the same config (key) over a
+        prefix of corpus
+        """
+        if key != self.key or os.path.getsize(corpus) < self.offset:
+            return False
+        return prefix_checksum(corpus, self.offset) == self.checksum
+
+class SentenceMemo(object):
+    """
+    Results of analyzers and scorers for one sentence (or one pair of gold
+    and system sentences), keyed on the fingerprints of the graphs (see
+    Graph.fingerprint) and on the name and config section of the analyzer,
+    so that a graph seen before costs a lookup. The size most recently used
+    results are kept in memory; with a path, all of them are also stored in
+    an SQLite file, reused by later runs (e.g. on a new version of a corpus).
+    """
+    #Number of results written to the file at once
+    FLUSH = 1000
+
+    def __init__(self, path = None, size = 100000):
+        self.size    = size
+        self.hits    = 0
+        self.misses  = 0
+        self._lru    = collections.OrderedDict()
+        self._dirty  = []
+        self._db     = None
+        if path is not None:
+            self._db = sqlite3.connect(path)
+            self._db.execute('CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, result BLOB NOT NULL)')
+
+    @staticmethod
+    def prefix(name, section):
+        data = json.dumps([__version__, name, section], sort_keys=True, default=str)
+        return hashlib.blake2b(data.encode('utf-8'), digest_size=16).digest()
+
+    def get(self, key):
+        result = self._lru.get(key)
+        if result is not None:
+            self._lru.move_to_end(key)
+        elif self._db is not None:
+            row = self._db.execute('SELECT result FROM results WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                result = row[0]
+                self._keep(key, result)
+        return result
+
+    def put(self, key, result):
+        self._keep(key, result)
+        if self._db is not None:
+            self._dirty.append((key, result))
+            if len(self._dirty) >= self.FLUSH:
+                self._flush()
+
+    def _keep(self, key, result):
+        self._lru[key] = result
+        if len(self._lru) > self.size:
+            self._lru.popitem(last=False)
+
+    def _flush(self):
+        self._db.executemany('INSERT OR REPLACE INTO results VALUES (?, ?)', self._dirty)
+        self._db.commit()
+        self._dirty = []
+
+    def close(self):
+        if self._db is not None:
+            self._flush()
+            self._db.close()
+            self._db = None
+
+    def memoize(self, name, section, accumulator, fn):
+        """
+        fn(*graphs, acc), an analyze() or score() method, computing the
+        contribution of graphs in a new accumulator() only when it is not
+        memoized, then merging it into acc. Accumulators are stored pickled,
+        so that a result is never shared by two accumulators.
+        """
+        prefix = self.prefix(name, section)
+        def memoized(*args):
+            *graphs, acc = args
+            key    = prefix + b''.join(g.fingerprint() for g in graphs)
+            result = self.get(key)
+            if result is None:
+                self.misses += 1
+                part = accumulator()
+                fn(*graphs, part)
+                self.put(key, pickle.dumps(part, protocol=pickle.HIGHEST_PROTOCOL))
+            else:
+                self.hits += 1
+                part = pickle.loads(result)
+            acc.merge(part)
+        return memoized
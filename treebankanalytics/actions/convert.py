@@ -0,0 +1,79 @@
+import collections, functools, io, itertools, os
+from treebankanalytics.registry import READERS, WRITERS
+
+__all__ = ['sentence_batches', 'numbered_reader', 'convert_batch', 'convert']
+
+def sentence_batches(stream, size):
+    """
+    (number of the first sentence, text) of batches of size sentences of
+    stream, cut after the blank lines ending sentences, so that reading the
+    batches one by one gives the graphs read from the whole stream
+    """
+    numsent, lines, n = 1, [], 0
+    for line in stream:
+        lines.append(line)
+        if line.strip() == '':
+            n += 1
+            if n == size:
+                yield numsent, ''.join(lines)
+                numsent, lines, n = numsent + n, [], 0
+    if lines:
+        yield numsent, ''.join(lines)
+
+@functools.lru_cache(maxsize=None)
+def _numbers_sentences(reader):
+    #inspect is slow to import, convert only needs it for batches
+    import inspect
+    return 'numsent' in inspect.signature(reader).parameters
+
+def numbered_reader(ffrom, numsent):
+    """
+    Reader of format ffrom for a part of a corpus starting at sentence
+    numsent (from 1), for readers numbering sentences (sdp)
+    """
+    reader = READERS.get(ffrom)
+    if _numbers_sentences(reader):
+        return lambda stream: reader(stream, numsent=numsent)
+    return reader
+
+def _writer(to, options):
+    writer = WRITERS.get(to)
+    return functools.partial(writer, **options) if options else writer
+
+def convert_batch(ffrom, to, numsent, text, options = None):
+    """
+    text, a batch of sentences starting at sentence numsent, converted from
+    format ffrom to format to (options are passed to the writer)
+    """
+    writer = _writer(to, options)
+    output = io.StringIO()
+    for g in numbered_reader(ffrom, numsent)(io.StringIO(text)):
+        writer(g, output)
+    return output.getvalue()
+
+def convert(stream, output, ffrom, to, jobs = 1, batch_size = 1000, options = None):
+    """
+    Write the graphs of stream converted from format ffrom to format to on
+    output, options being passed to the writer (e.g. priority for dfs).
+    With several jobs, batches of batch_size sentences are converted by
+    worker processes and written back in order; at most two batches per
+    worker are in flight, so memory does not grow with the input.
+    """
+    if jobs == 1:
+        writer = _writer(to, options)
+        for g in READERS.get(ffrom)(stream):
+            writer(g, output)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    jobs = jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        batches = sentence_batches(stream, batch_size)
+        pending = collections.deque()
+        for numsent, text in itertools.islice(batches, 2 * jobs):
+            pending.append(executor.submit(convert_batch, ffrom, to, numsent, text, options))
+        while pending:
+            block = pending.popleft().result()
+            for numsent, text in itertools.islice(batches, 1):
+                pending.append(executor.submit(convert_batch, ffrom, to, numsent, text, options))
+            output.write(block)
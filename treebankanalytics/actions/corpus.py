@@ -0,0 +1,115 @@
+import glob, os
+from treebankanalytics.registry import READERS
+
+__all__ = ['corpus_files', 'is_corpus', 'pair_files', 'analyze_file', 'analyze_batch', 'eval_files', 'map_files']
+
+def is_corpus(path):
+    """
+    Whether path names several files: a directory or a glob pattern
+    """
+    return os.path.isdir(path) or (not os.path.isfile(path) and glob.has_magic(path))
+
+def corpus_files(path):
+    """
+    (name, path) of the files of a corpus given as a file, a directory
+    (walked recursively, hidden files skipped) or a glob pattern, sorted by
+    name. Names are relative to the directory, or base names for a pattern.
+    """
+    if os.path.isdir(path):
+        files = []
+        for root, dirs, names in os.walk(path):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            files.extend(os.path.join(root, n) for n in names if not n.startswith('.'))
+        return sorted((os.path.relpath(f, path), f) for f in files)
+    if os.path.isfile(path):
+        return [(os.path.basename(path), path)]
+    return sorted((os.path.basename(f), f) for f in glob.glob(path) if os.path.isfile(f))
+
+def pair_files(golds, systems):
+    """
+    Pair gold and system files by name, or by name without extension when
+    the names differ. Returns the (gold name, gold path, system path) triples and
+    the names of the files left unpaired.
+    """
+    systems = dict(systems)
+    stems   = {}
+    for name in systems:
+        stems.setdefault(os.path.splitext(name)[0], []).append(name)
+
+    pairs, unpaired = [], []
+    for name, path in golds:
+        system = name
+        if name not in systems:
+            candidates = [s for s in stems.get(os.path.splitext(name)[0], []) if s in systems]
+            if len(candidates) != 1:
+                unpaired.append(name)
+                continue
+            system = candidates[0]
+        pairs.append((name, path, systems.pop(system)))
+    return pairs, unpaired + sorted(systems)
+
+def _profiler(profile):
+    """
+    Profiler of a task run with profile (None, or whether to trace memory)
+    """
+    if profile is None:
+        return None
+    from treebankanalytics.profiling import Profiler
+    return Profiler(memory=profile)
+
+def _profiled(profiler, stage, graphs, count = True):
+    return graphs if profiler is None else profiler.iterate(stage, graphs, count)
+
+def analyze_file(path, format, config, analyzers, max_memory = None, profile = None):
+    """
+    Results of analyzers (classes) over one file. With profile (see
+    _profiler), (results, Profiler of the task).
+    """
+    from treebankanalytics.actions.analyze import Analyzer
+    profiler = _profiler(profile)
+    analyzer = Analyzer(None, config, analyzers, profiler, max_memory)
+    with open(path, 'r') as stream:
+        analyzer.accumulate(_profiled(profiler, 'read', READERS.get(format)(stream)))
+    return analyzer.results() if profiler is None else (analyzer.results(), profiler)
+
+def analyze_batch(batch, config, analyzers, max_memory = None, profile = None):
+    """
+    Results of analyzers (classes) over the graphs of a FlatBatch. With
+    profile (see _profiler), (results, Profiler of the task), decoding the
+    graphs being the decode stage: they were counted when read.
+    """
+    from treebankanalytics.actions.analyze import Analyzer
+    profiler = _profiler(profile)
+    analyzer = Analyzer(None, config, analyzers, profiler, max_memory)
+    analyzer.accumulate(_profiled(profiler, 'decode', batch.graphs(), False))
+    return analyzer.results() if profiler is None else (analyzer.results(), profiler)
+
+def eval_files(gold, system, gold_format, format, config, scorers, profile = None):
+    """
+    Results of scorers (classes) over one pair of gold and system files.
+    With profile (see _profiler), (results, Profiler of the task).
+    """
+    from treebankanalytics.actions.eval import Evaluator
+    profiler  = _profiler(profile)
+    evaluator = Evaluator(None, config, scorers, profiler)
+    with open(gold, 'r') as golds, open(system, 'r') as systems:
+        evaluator.accumulate(_profiled(profiler, 'read gold', READERS.get(gold_format)(golds)),
+                             _profiled(profiler, 'read system', READERS.get(format)(systems), False))
+    return evaluator.results() if profiler is None else (evaluator.results(), profiler)
+
+def _call(task):
+    fn, args = task
+    return fn(*args)
+
+def map_files(fn, args, jobs = None):
+    """
+    fn(*a) for each a of args, computed by jobs worker processes (default:
+    number of CPUs), one file per task. Results come in the order of args.
+    """
+    tasks = [(fn, a) for a in args]
+    if jobs == 1 or len(tasks) <= 1:
+        yield from map(_call, tasks)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(_call, tasks)
@@ -0,0 +1,259 @@
+from array import array
+from treebankanalytics.registry import READERS
+from treebankanalytics.actions.convert import sentence_batches
+from treebankanalytics.actions.sketches import stable_hash
+
+__all__ = ['shingles', 'MinHash', 'bands_for', 'Deduplicator', 'read_sentences', 'filter_sentences', 'deduplicate']
+
+SHINGLES = ('tokens', 'edges')
+
+#Value of the bins of the signature of an empty set
+_EMPTY  = 0xffffffff
+#Offset added to a value borrowed by an empty bin, for each bin skipped
+_BORROW = 0x9e3779b1
+
+def shingles(graph, n = 3, kinds = SHINGLES):
+    """
+    Token n-grams (the whole sentence when it is shorter) and (head token,
+    label, dependent token) triples of graph, as strings
+    """
+    tokens = dict((node.index(), node['token']) for node in graph.nodes())
+    result = set()
+    if 'tokens' in kinds:
+        words = [tokens[i] for i in sorted(tokens) if i > 0]
+        for i in range(max(1, len(words) - n + 1)):
+            result.add('t\x1f' + '\x1f'.join(words[i:i+n]))
+    if 'edges' in kinds:
+        for e in graph.edges():
+            result.add('e\x1f%s\x1f%s\x1f%s' % (tokens.get(e.source(), ''), e['label'], tokens.get(e.target(), '')))
+    return result
+
+class MinHash(object):
+    """
+    MinHash signatures of k 32 bits values, computed by one permutation
+    hashing (Li, Owen and Zhang, 2012): each item is hashed once, its hash
+    selects a bin and the signature keeps the smallest hash of each bin.
+    Empty bins borrow the value of the next non-empty one (rotation
+    densification, Shrivastava and Li, 2014), so that sets smaller than k
+    stay comparable. The fraction of equal values of two signatures
+    estimates the Jaccard similarity of the sets.
+    """
+    def __init__(self, k = 64):
+        self.k = k
+
+    def signature(self, items):
+        k = self.k
+        bins = [None] * k
+        for item in items:
+            h = stable_hash(item)
+            i, value = h % k, (h // k) & 0xffffffff
+            if bins[i] is None or value < bins[i]:
+                bins[i] = value
+        if all(v is None for v in bins):
+            return array('I', [_EMPTY] * k)
+        signature = array('I')
+        for i in range(k):
+            j = 0
+            while bins[(i + j) % k] is None:
+                j += 1
+            signature.append((bins[(i + j) % k] + j * _BORROW) & 0xffffffff)
+        return signature
+
+    @staticmethod
+    def similarity(a, b):
+        return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+def bands_for(threshold, k, recall = 0.95):
+    """
+    Least number of bands of k // bands rows (a divisor of k) for which a
+    pair of similarity threshold is a candidate with a probability of at
+    least recall: 1 - (1 - threshold ** rows) ** bands (Leskovec, Rajaraman
+    and Ullman, Mining of Massive Datasets, chapter 3). Candidates are
+    checked, so more bands only cost more checks.
+    """
+    for bands in range(1, k + 1):
+        if k % bands == 0 and 1 - (1 - threshold ** (k // bands)) ** bands >= recall:
+            return bands
+    return k
+
+class _Clusters(object):
+    """
+    Union-find of sentence positions, keeping the smallest similarity of
+    the links of each cluster
+    """
+    def __init__(self):
+        self._parent = {}
+        self._similarity = {}
+
+    def find(self, i):
+        parent = self._parent
+        root = i
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while i != root:
+            parent[i], i = root, parent[i]
+        return root
+
+    def union(self, i, j, similarity):
+        a, b = self.find(i), self.find(j)
+        if a == b:
+            return
+        a, b = min(a, b), max(a, b)
+        self._parent[b] = a
+        self._similarity[a] = min(similarity, self._similarity.get(a, 1.), self._similarity.pop(b, 1.))
+
+    def clusters(self):
+        """
+        (positions, smallest similarity) of the clusters, largest first
+        """
+        members = {}
+        for i in list(self._parent):
+            root = self.find(i)
+            members.setdefault(root, set([root])).add(i)
+        clusters = [(sorted(positions), self._similarity[root]) for root, positions in members.items()]
+        return sorted(clusters, key=lambda c: (-len(c[0]), c[0][0]))
+
+class Deduplicator(object):
+    """
+    Near-duplicate sentences, whose shingles (see shingles) have an
+    estimated Jaccard similarity of at least threshold. Candidate pairs are
+    the sentences whose signatures are equal on at least one band of rows
+    (locality-sensitive hashing), then checked on their signatures, so that
+    sentences are not compared pairwise.
+    """
+    def __init__(self, threshold = 0.8, k = 64, n = 3, kinds = SHINGLES, bands = None):
+        self.threshold = threshold
+        self.minhash   = MinHash(k)
+        self.n         = n
+        self.kinds     = kinds
+        self.bands     = bands or bands_for(threshold, k)
+        self.rows      = k // self.bands
+
+    def signature(self, graph):
+        return self.minhash.signature(shingles(graph, self.n, self.kinds))
+
+    def signatures(self, graphs):
+        """
+        Signatures of graphs, concatenated
+        """
+        signatures = array('I')
+        for graph in graphs:
+            signatures.extend(self.signature(graph))
+        return signatures
+
+    def _get(self, signatures, i):
+        k = self.minhash.k
+        return signatures[i*k:(i+1)*k]
+
+    def _key(self, signature, band):
+        return hash(signature[band*self.rows:(band+1)*self.rows].tobytes())
+
+    def clusters(self, signatures):
+        """
+        (positions, smallest similarity of their links) of the clusters of
+        near-duplicates among signatures, largest first
+        """
+        n = len(signatures) // self.minhash.k
+        clusters = _Clusters()
+        for band in range(self.bands):
+            buckets = {}
+            for i in range(n):
+                buckets.setdefault(self._key(self._get(signatures, i), band), []).append(i)
+            for bucket in buckets.values():
+                if len(bucket) > 1:
+                    self._link(signatures, bucket, clusters)
+        return clusters.clusters()
+
+    def _link(self, signatures, bucket, clusters):
+        #Each sentence is checked against the representatives of the bucket
+        #only, so that large groups of copies cost a linear number of checks
+        representatives = []
+        for i in bucket:
+            signature = self._get(signatures, i)
+            for r, rsignature in representatives:
+                if clusters.find(i) == clusters.find(r):
+                    break
+                similarity = MinHash.similarity(signature, rsignature)
+                if similarity >= self.threshold:
+                    clusters.union(i, r, similarity)
+                    break
+            else:
+                representatives.append((i, signature))
+
+    def duplicates(self, reference, signatures):
+        """
+        (position, reference position, similarity) of the sentences of
+        signatures with a near-duplicate among the reference signatures,
+        the most similar one
+        """
+        k = self.minhash.k
+        buckets = [{} for _ in range(self.bands)]
+        for i in range(len(reference) // k):
+            signature = self._get(reference, i)
+            for band in range(self.bands):
+                buckets[band].setdefault(self._key(signature, band), []).append(i)
+
+        for i in range(len(signatures) // k):
+            signature = self._get(signatures, i)
+            candidates = set()
+            for band in range(self.bands):
+                candidates.update(buckets[band].get(self._key(signature, band), ()))
+            best = None
+            for j in sorted(candidates):
+                similarity = MinHash.similarity(signature, self._get(reference, j))
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (j, similarity)
+            if best is not None:
+                yield i, best[0], best[1]
+
+def read_sentences(path, format):
+    """
+    Graphs of the sentences of a corpus file, whose positions are those of
+    filter_sentences
+    """
+    with open(path, 'r') as stream:
+        yield from READERS.get(format)(stream)
+
+def filter_sentences(path, output, removed):
+    """
+    Copy the sentences of a corpus file to output, except those whose
+    position is in removed
+    """
+    with open(path, 'r') as stream:
+        for numsent, text in sentence_batches(stream, 1):
+            if numsent - 1 not in removed:
+                output.write(text)
+
+def deduplicate(deduplicator, path, format, formatter, reference = None, output = None):
+    """
+    (name, table) of the near-duplicates of a corpus file: its clusters, or
+    with a reference file, its sentences duplicated in the reference. With
+    output (path), the corpus is copied there without the duplicates: all
+    the sentences of a cluster but the first, or those found in reference.
+    """
+    k = deduplicator.minhash.k
+    signatures = deduplicator.signatures(read_sentences(path, format))
+    n = len(signatures) // k
+    if reference is None:
+        clusters  = deduplicator.clusters(signatures)
+        clustered = sum(len(c) for c, _ in clusters)
+        redundant = clustered - len(clusters)
+        removed   = set(p for c, _ in clusters for p in c[1:])
+        tables    = [('Duplicates', formatter.format([
+            ['Sentences', 'Clusters', 'Sentences in clusters', 'Redundant sentences', '% Redundant'],
+            [str(n), str(len(clusters)), str(clustered), str(redundant), "%.2f" % (redundant / n * 100. if n else 0.)]])),
+            ('Clusters', formatter.format([['Cluster', 'Size', 'Similarity', 'Sentences']] +
+                [[str(i + 1), str(len(c)), "%.3f" % s, ','.join(str(p + 1) for p in c)] for i, (c, s) in enumerate(clusters)]))]
+    else:
+        references = deduplicator.signatures(read_sentences(reference, format))
+        pairs      = list(deduplicator.duplicates(references, signatures))
+        removed    = set(p for p, _, _ in pairs)
+        tables     = [('Duplicates', formatter.format([
+            ['Sentences', 'Reference sentences', 'Duplicated in reference', '% Duplicated'],
+            [str(n), str(len(references) // k), str(len(pairs)), "%.2f" % (len(pairs) / n * 100. if n else 0.)]])),
+            ('Pairs', formatter.format([['Sentence', 'Reference sentence', 'Similarity']] +
+                [[str(p + 1), str(r + 1), "%.3f" % s] for p, r, s in pairs]))]
+    if output is not None:
+        with open(output, 'w') as stream:
+            filter_sentences(path, stream, removed)
+    return tables
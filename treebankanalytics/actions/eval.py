@@ -1,19 +1,46 @@
-import abc, numbers, sys
+import abc, functools, heapq, sys
+from treebankanalytics.actions.accumulators import MergeNotDefinedError, Accumulator, Counts, Histogram, Nested, Vocabulary
+from treebankanalytics.actions.bins import Bins, BinnedGroups
+from treebankanalytics.actions.goldindex import KeyedSentence, attachment, attachments, count_common, label_id
 
-__all__ = ['compute_f1', 'AllScorer', 'SentenceBinsScorer', 'EdgeLengthBinsScorer', 'LabelsScorer', 'Scorer', 'Evaluator', 'MergeNotDefinedError', 'FilteredScorer']
+__all__ = ['compute_f1', 'AllScorer', 'SentenceBinsScorer', 'EdgeLengthBinsScorer', 'LabelsScorer', 'Scorer', 'Evaluator', 'MergeNotDefinedError', 'FilteredScorer', 'LabelConfusionScorer']
 
-class MergeNotDefinedError(Exception):
-    pass
+SCORE_FIELDS = ('LC', 'UC', 'LG', 'UG', 'LS', 'US')
 
 def compute_f1(recall, precision):
     return 2. * recall * precision / (recall + precision) if (recall + precision) > 0. else 0.
 
+def score_counts(*extra):
+    return Counts(*(SCORE_FIELDS + extra))
+
+def compute_scores(results):
+    r = {'LP': 0., 'LR': 0., 'LF': 0., 'UP': 0., 'UR': 0., 'UF': 0.}
+    r['LP'] =  results['LC'] / results['LS'] if results['LS'] > 0 else 0.
+    r['LR'] =  results['LC'] / results['LG'] if results['LG'] > 0 else 0.
+    r['UP'] =  results['UC'] / results['US'] if results['US'] > 0 else 0.
+    r['UR'] =  results['UC'] / results['UG'] if results['UG'] > 0 else 0.
+
+    r['LF'] = compute_f1(r['LR'], r['LP'])
+    r['UF'] = compute_f1(r['UR'], r['UP'])
+    return r
+
 class Scorer(metaclass=abc.ABCMeta):
-    def __init__(self, gold, system, config):
-        self._g = gold
-        self._s = system
+    """
+    A scorer is built once per evaluation. For each pair of sentences,
+    score() updates in place the accumulator returned by accumulator().
+
+    score_keys() does the same on KeyedSentence (sorted integer edge keys,
+    see goldindex) and is used when the gold side is a precompiled GoldIndex.
+
+    Costly scorers whose accumulators merge exactly may set memoizable, so
+    that the results of repeated pairs of sentences are reused (see
+    SentenceMemo). The scorers below cost less than the fingerprints of the
+    sentences and do not.
+    """
+    memoizable = False
+
+    def __init__(self, config):
         self._config = config
-        pass
 
     @classmethod
     @abc.abstractmethod
@@ -21,77 +48,113 @@ class Scorer(metaclass=abc.ABCMeta):
         pass
 
     @abc.abstractmethod
-    def add_gold(self, edge):
+    def accumulator(self):
         pass
 
     @abc.abstractmethod
-    def add_system(self, edge):
+    def score(self, gold, system, acc):
         pass
 
-    @abc.abstractmethod
-    def compute_common(self):
-        pass
-
-    @abc.abstractmethod
-    def get_results(self):
-        pass
+    def score_keys(self, gold, system, labels, acc):
+        raise NotImplementedError('%s cannot be used with a gold index' % self.name())
 
     @classmethod
     @abc.abstractmethod
     def table(cls, results, formatter):
         pass
 
+    @staticmethod
+    def _count(acc, gold, system):
+        """
+        Add the labeled and unlabeled counts of two sets of edges to acc
+        """
+        gold_uset   = set((e.source(), e.target()) for e in gold)
+        system_uset = set((e.source(), e.target()) for e in system)
+
+        acc['LC'] += len(gold & system)
+        acc['UC'] += len(gold_uset & system_uset)
+        acc['LG'] += len(gold)
+        acc['UG'] += len(gold_uset)
+        acc['LS'] += len(system)
+        acc['US'] += len(system_uset)
+
+    @staticmethod
+    def _count_keys(acc, gold, system):
+        """
+        Same as _count for two sorted lists of edge keys
+        """
+        gold_uset   = attachments(gold)
+        system_uset = attachments(system)
+
+        acc['LC'] += count_common(gold, system)
+        acc['UC'] += count_common(gold_uset, system_uset)
+        acc['LG'] += len(gold)
+        acc['UG'] += len(gold_uset)
+        acc['LS'] += len(system)
+        acc['US'] += len(system_uset)
+
+    @staticmethod
+    def _group_keys(keys, key):
+        """
+        Group sorted edge keys by key(index), each group staying sorted
+        """
+        groups = {}
+        for i, k in enumerate(keys):
+            g = key(i)
+            if g in groups:
+                groups[g].append(k)
+            else:
+                groups[g] = [k]
+        return groups
+
+    @staticmethod
+    def _count_key_groups(acc, gold_groups, system_groups):
+        empty = ()
+        for k in gold_groups.keys() | system_groups.keys():
+            Scorer._count_keys(acc[k], gold_groups.get(k, empty), system_groups.get(k, empty))
+
+    @staticmethod
+    def _group(edges, key):
+        groups = {}
+        for e in edges:
+            k = key(e)
+            if k in groups:
+                groups[k].add(e)
+            else:
+                groups[k] = set([e])
+        return groups
 
-class AllScorer(Scorer):
-    def __init__(self, gold, system, config):
-        super().__init__(gold, system, config)
-        self._gold_lset = set()
-        self._gold_uset = set()
-
-        self._system_lset = set()
-        self._system_uset = set()
+    @staticmethod
+    def _count_groups(acc, gold_groups, system_groups):
+        empty = frozenset()
+        for k in gold_groups.keys() | system_groups.keys():
+            Scorer._count(acc[k], gold_groups.get(k, empty), system_groups.get(k, empty))
 
-        self._common_lset = set()
-        self._common_uset = set()
 
+class AllScorer(Scorer):
     @classmethod
     def name(cls):
         return "AllScorer"
 
-    def add_gold(self, e):
-        self._gold_lset.add(e)
-        self._gold_uset.add((e.source(), e.target()))
+    def accumulator(self):
+        return score_counts()
 
-    def add_system(self, e):
-        self._system_lset.add(e)
-        self._system_uset.add((e.source(), e.target()))
+    def score(self, gold, system, acc):
+        self._count(acc, gold.edges(), system.edges())
 
-    def compute_common(self):
-        self._common_lset = self._gold_lset & self._system_lset
-        self._common_uset = self._gold_uset & self._system_uset
-
-    def get_results(self):
-        return {'LC': len(self._common_lset), 'UC': len(self._common_uset),
-                'LG': len(self._gold_lset),   'UG': len(self._gold_uset),
-                'LS': len(self._system_lset), 'US': len(self._system_uset)}
+    def score_keys(self, gold, system, labels, acc):
+        self._count_keys(acc, gold.keys, system.keys)
 
     @classmethod
     def table(cls, results, formatter):
-        r = {'LP': 0., 'LR': 0., 'LF': 0., 'UP': 0., 'UR': 0., 'UF': 0.}
-        r['LP'] =  results['LC'] / results['LS'] if results['LS'] > 0 else 0.
-        r['LR'] =  results['LC'] / results['LG'] if results['LG'] > 0 else 0.
-        r['UP'] =  results['UC'] / results['US'] if results['US'] > 0 else 0.
-        r['UR'] =  results['UC'] / results['UG'] if results['UG'] > 0 else 0.
-
-        r['LF'] = compute_f1(r['LR'], r['LP'])
-        r['UF'] = compute_f1(r['UR'], r['UP'])
+        r = compute_scores(results)
         table = [ ["LP", "LR", "LF", "UP", "UR", "UF"] ]
         table.append(["%.2f" % (r[k]*100.0,) for k in ('LP', 'LR', 'LF', 'UP', 'UR', 'UF')])
         return formatter.format(table)
 
 class FilteredScorer(AllScorer):
-    def __init__(self, gold, system, config):
-        super().__init__(gold, system, config)
+    def __init__(self, config):
+        super().__init__(config)
         self._filtered_labels = set()
         self._keep = False
         self._parse_config()
@@ -110,7 +173,6 @@ class FilteredScorer(AllScorer):
             self._keep = scorer['keep']
 
     def _must_continue_with_this_label(self, label):
-
         if self._keep: #Do I need to keep the filtered labels
             if label in self._filtered_labels:
                 return True
@@ -122,90 +184,58 @@ class FilteredScorer(AllScorer):
             else:
                 return True
 
-    def add_gold(self, e):
-        if not self._must_continue_with_this_label(e['label']):
-            return
-        self._gold_lset.add(e)
-        self._gold_uset.add((e.source(), e.target()))
-
-    def add_system(self, e):
-        if not self._must_continue_with_this_label(e['label']):
-            return
+    def score(self, gold, system, acc):
+        gold   = set(e for e in gold.edges() if self._must_continue_with_this_label(e['label']))
+        system = set(e for e in system.edges() if self._must_continue_with_this_label(e['label']))
+        self._count(acc, gold, system)
 
-        self._system_lset.add(e)
-        self._system_uset.add((e.source(), e.target()))
+    def score_keys(self, gold, system, labels, acc):
+        gold   = [k for k in gold.keys if self._must_continue_with_this_label(labels[label_id(k)])]
+        system = [k for k in system.keys if self._must_continue_with_this_label(labels[label_id(k)])]
+        self._count_keys(acc, gold, system)
 
 class SentenceBinsScorer(AllScorer):
-    def __init__(self, gold, system, config):
-        super().__init__(gold, system, config)
-        self._size = gold.order()
-        self._bin_start = 1
-        self._bin_end   = 100
-        self._bin_step  = 10
+    def __init__(self, config):
+        super().__init__(config)
+        self._bins = Bins()
         self._parse_config()
-        self._bin  = self._determine_bins()
 
     def _parse_config(self):
         if not SentenceBinsScorer.name() in self._config:
             return
-        scorer = self._config[SentenceBinsScorer.name()]
-        self._bin_start = scorer['binStart'] if 'binStart' in scorer else 1
-        self._bin_end   = scorer['binStop'] if 'binStop' in scorer else 100
-        self._bin_step  = scorer['binStep'] if 'binStep' in scorer else 10
-
-    def _determine_bins(self):
-        for low,high in zip( range(self._bin_start, self._bin_end+1, self._bin_step),
-                             range(self._bin_step, self._bin_end+1, self._bin_step) ):
-            if self._size >= low and self._size <= high:
-                return "{0}-{1}".format(low, high)
-        return "{0}+".format(self._bin_end)
+        self._bins = Bins.from_config(self._config[SentenceBinsScorer.name()])
 
     @classmethod
     def name(cls):
         return "SentenceBinsScorer"
 
-    def get_results(self):
-        r = {self._bin: { 'LC': len(self._common_lset), 'UC': len(self._common_uset),
-            'LG': len(self._gold_lset), 'UG': len(self._gold_uset),
-            'LS': len(self._system_lset), 'US': len(self._system_uset), 'Sent': 1}}
-        return r
+    def accumulator(self):
+        return BinnedGroups(self._bins, functools.partial(score_counts, 'Sent'))
 
-    @classmethod
-    def table(cls, results, formatter):
-        def sorting(k):
-            info = k[0].split('-')
-            if len(info) == 1:
-                t = info[0][:-1]
-                return (int(t), int(t))
-            else:
-                return (int(info[0]), int(info[1]))
+    def score(self, gold, system, acc):
+        counts = acc[self._bins(gold.order())]
+        self._count(counts, gold.edges(), system.edges())
+        counts['Sent'] += 1
 
-        for _bin in results:
-            r = {'LP': 0., 'LR': 0., 'LF': 0., 'UP': 0., 'UR': 0., 'UF': 0.}
-            r['LP'] =  results[_bin]['LC'] / results[_bin]['LS'] if results[_bin]['LS'] > 0 else 0.
-            r['LR'] =  results[_bin]['LC'] / results[_bin]['LG'] if results[_bin]['LG'] > 0 else 0.
-            r['UP'] =  results[_bin]['UC'] / results[_bin]['US'] if results[_bin]['US'] > 0 else 0.
-            r['UR'] =  results[_bin]['UC'] / results[_bin]['UG'] if results[_bin]['UG'] > 0 else 0.
-
-            r['LF'] = compute_f1(r['LR'], r['LP'])
-            r['UF'] = compute_f1(r['UR'], r['UP'])
-            r['Gold'] = results[_bin]['Sent']
-            results[_bin] = r
+    def score_keys(self, gold, system, labels, acc):
+        counts = acc[self._bins(gold.order)]
+        self._count_keys(counts, gold.keys, system.keys)
+        counts['Sent'] += 1
 
+    @classmethod
+    def table(cls, results, formatter):
         table = [ ["Bin", "NumberInGold", "LP", "LR", "LF", "UP", "UR", "UF"] ]
-
-
-        for _bin, r in sorted(results.items(), key=sorting):
+        for _bin, counts in results.rows(lambda c: c['Sent']):
+            r = compute_scores(counts)
             row = ["%.2f" % (r[k]*100.0,) for k in ('LP', 'LR', 'LF', 'UP', 'UR', 'UF')]
-            row.insert(0, str(r['Gold']))
+            row.insert(0, str(counts['Sent']))
             row.insert(0, _bin)
             table.append(row)
         return formatter.format(table)
 
 class LabelsScorer(AllScorer):
-    def __init__(self, gold, system, config):
-        super().__init__(gold, system, config)
-        self._labels = {}
+    def __init__(self, config):
+        super().__init__(config)
         self._keep   = True
         self._filtered_labels = set()
         self._parse_config()
@@ -232,40 +262,23 @@ class LabelsScorer(AllScorer):
             else:
                 return True
 
-    def add_gold(self, e):
-        label = e['label']
-        if not self._must_continue_with_this_label(label):
-            return
+    def accumulator(self):
+        return Nested(score_counts)
 
-        if label not in self._labels:
-            self._labels[label] = {'LG': set([e]), 'UG': set([(e.source(), e.target())]), 'LS': set(), 'US': set()}
-        else:
-            self._labels[label]['LG'].add(e)
-            self._labels[label]['UG'].add((e.source(), e.target()))
+    def _labels(self, graph):
+        groups = self._group(graph.edges(), lambda e: e['label'])
+        return dict((l, edges) for l, edges in groups.items() if self._must_continue_with_this_label(l))
 
-    def add_system(self, e):
-        label = e['label']
-        if not self._must_continue_with_this_label(label):
-            return
+    def score(self, gold, system, acc):
+        self._count_groups(acc, self._labels(gold), self._labels(system))
 
-        if label not in self._labels:
-            self._labels[label] = {'LS': set([e]), 'US': set([(e.source(), e.target())]), 'LG': set(), 'UG': set()}
-        else:
-            self._labels[label]['LS'].add(e)
-            self._labels[label]['US'].add((e.source(), e.target()))
-
-    def compute_common(self):
-        for l in self._labels:
-            r = self._labels[l]
-            r['LC'] = r['LS'] & r['LG']
-            r['UC'] = r['US'] & r['UG']
-
-    def get_results(self):
-        results = {}
-        for l in self._labels:
-            r = self._labels[l]
-            results[l] = dict([(k, len(v)) for k,v in r.items()])
-        return results
+    def _key_labels(self, sentence, labels):
+        keys   = sentence.keys
+        groups = self._group_keys(keys, lambda i: labels[label_id(keys[i])])
+        return dict((l, k) for l, k in groups.items() if self._must_continue_with_this_label(l))
+
+    def score_keys(self, gold, system, labels, acc):
+        self._count_key_groups(acc, self._key_labels(gold, labels), self._key_labels(system, labels))
 
     @classmethod
     def name(cls):
@@ -273,78 +286,42 @@ class LabelsScorer(AllScorer):
 
     @classmethod
     def table(cls, results, formatter):
-        for label in results:
-            r = {'Gold': 0., 'LP': 0., 'LR': 0., 'LF': 0., 'UP': 0., 'UR': 0., 'UF': 0.}
-            r['LP'] =  results[label]['LC'] / results[label]['LS'] if results[label]['LS'] > 0 else 0.
-            r['LR'] =  results[label]['LC'] / results[label]['LG'] if results[label]['LG'] > 0 else 0.
-            r['UP'] =  results[label]['UC'] / results[label]['US'] if results[label]['US'] > 0 else 0.
-            r['UR'] =  results[label]['UC'] / results[label]['UG'] if results[label]['UG'] > 0 else 0.
-
-            r['LF'] = compute_f1(r['LR'], r['LP'])
-            r['UF'] = compute_f1(r['UR'], r['UP'])
-            r['Gold'] = results[label]['LG']
-            results[label] = r
-
         table = [ ["Label", 'NumberInGold', "LP", "LR", "LF", "UP", "UR", "UF"] ]
-        for label, r in sorted(results.items(), key= lambda k: k[0]):
+        for label, counts in sorted(results.items(), key= lambda k: k[0]):
+            r = compute_scores(counts)
             row = ["%.2f" % (r[k]*100.0,) for k in ('LP', 'LR', 'LF', 'UP', 'UR', 'UF')]
-            row.insert(0, str(r['Gold']))
+            row.insert(0, str(counts['LG']))
             row.insert(0, label)
             table.append(row)
         return formatter.format(table)
 
 class EdgeLengthBinsScorer(Scorer):
-    def __init__(self, gold, system, config):
-        super().__init__(gold, system, config)
-        self._bin_start = 1
-        self._bin_end   = 100
-        self._bin_step  = 10
+    def __init__(self, config):
+        super().__init__(config)
+        self._bins = Bins()
         self._parse_config()
-        self._lengths = {}
 
     def _parse_config(self):
         if not EdgeLengthBinsScorer.name() in self._config:
             return
-        scorer = self._config[EdgeLengthBinsScorer.name()]
-        self._bin_start = scorer['binStart'] if 'binStart' in scorer else 1
-        self._bin_end   = scorer['binStop'] if 'binStop' in scorer else 100
-        self._bin_step  = scorer['binStep'] if 'binStep' in scorer else 10
+        self._bins = Bins.from_config(self._config[EdgeLengthBinsScorer.name()])
 
     def _determine_bins(self, e):
-        size = abs( e.source() - e.target() )
-        for low,high in zip( range(self._bin_start, self._bin_end+1, self._bin_step), range(self._bin_step, self._bin_end+1, self._bin_step) ):
-            if size >= low and size <= high:
-                return "{0}-{1}".format(low, high)
-        return "{0}+".format(self._bin_end)
-
-    def add_gold(self, e):
-        _bin = self._determine_bins(e)
-        if _bin not in self._lengths:
-            self._lengths[_bin] = {'LG': set([e]), 'UG': set([(e.source(), e.target())]), 'LS': set(), 'US': set()}
-        else:
-            self._lengths[_bin]['LG'].add(e)
-            self._lengths[_bin]['UG'].add((e.source(), e.target()))
-
-    def add_system(self, e):
-        _bin = self._determine_bins(e)
-        if _bin not in self._lengths:
-            self._lengths[_bin] = {'LS': set([e]), 'US': set([(e.source(), e.target())]), 'LG': set(), 'UG': set()}
-        else:
-            self._lengths[_bin]['LS'].add(e)
-            self._lengths[_bin]['US'].add((e.source(), e.target()))
-
-    def compute_common(self):
-        for b in self._lengths:
-            r = self._lengths[b]
-            r['LC'] = r['LS'] & r['LG']
-            r['UC'] = r['US'] & r['UG']
-
-    def get_results(self):
-        results = {}
-        for b in self._lengths:
-            r = self._lengths[b]
-            results[b] = dict([(k, len(v)) for k,v in r.items()])
-        return results
+        return self._bins(abs( e.source() - e.target() ))
+
+    def accumulator(self):
+        return BinnedGroups(self._bins, score_counts)
+
+    def score(self, gold, system, acc):
+        self._count_groups(acc, self._group(gold.edges(), self._determine_bins),
+                                self._group(system.edges(), self._determine_bins))
+
+    def _key_bins(self, sentence):
+        lengths, bins = sentence.lengths(), self._bins
+        return self._group_keys(sentence.keys, lambda i: bins(lengths[i]))
+
+    def score_keys(self, gold, system, labels, acc):
+        self._count_key_groups(acc, self._key_bins(gold), self._key_bins(system))
 
     @classmethod
     def name(cls):
@@ -352,86 +329,193 @@ class EdgeLengthBinsScorer(Scorer):
 
     @classmethod
     def table(cls, results, formatter):
-        def sorting(k):
-            info = k[0].split('-')
-            if len(info) == 1:
-                t = info[0][:-1]
-                return (int(t), int(t))
-            else:
-                return (int(info[0]), int(info[1]))
-
-        for _bin in results:
-            r = {'Gold': 0., 'LP': 0., 'LR': 0., 'LF': 0., 'UP': 0., 'UR': 0., 'UF': 0.}
-            r['LP'] =  results[_bin]['LC'] / results[_bin]['LS'] if results[_bin]['LS'] > 0 else 0.
-            r['LR'] =  results[_bin]['LC'] / results[_bin]['LG'] if results[_bin]['LG'] > 0 else 0.
-            r['UP'] =  results[_bin]['UC'] / results[_bin]['US'] if results[_bin]['US'] > 0 else 0.
-            r['UR'] =  results[_bin]['UC'] / results[_bin]['UG'] if results[_bin]['UG'] > 0 else 0.
-
-            r['LF'] = compute_f1(r['LR'], r['LP'])
-            r['UF'] = compute_f1(r['UR'], r['UP'])
-            r['Gold'] = results[_bin]['LG']
-            #r['System'] = results[_bin]['LS']
-            #r['Common'] = results[_bin]['LC']
-            results[_bin] = r
-
         table = [ ["Bin", 'NumberInGold', "LP", "LR", "LF", "UP", "UR", "UF"] ]
-
-        for _bin, r in sorted(results.items(), key=sorting):
+        for _bin, counts in results.rows(lambda c: c['LG']):
+            r = compute_scores(counts)
             row = ["%.2f" % (r[k]*100.0,) for k in ('LP', 'LR', 'LF', 'UP', 'UR', 'UF')]
-            #row.insert(0, str(r['Common']))
-            #row.insert(0, str(r['System']))
-            row.insert(0, str(r['Gold']))
+            row.insert(0, str(counts['LG']))
             row.insert(0, _bin)
             table.append(row)
         return formatter.format(table)
 
+class LabelConfusion(Accumulator):
+    """
+    Sparse (gold label id, system label id) -> count matrix. The NONE id
+    stands for a missing attachment: (gold, NONE) is a gold edge without
+    any system edge between the same nodes, (NONE, system) the converse.
+    """
+    NONE = -1
+
+    def __init__(self, top = 20):
+        self.top    = top
+        self.labels = Vocabulary()
+        self.matrix = Histogram()
+
+    def label(self, i):
+        return "NONE" if i == LabelConfusion.NONE else self.labels[i]
+
+    def merge(self, other):
+        self._check_mergeable(other)
+        remap = self.labels.remap(other.labels)
+        remap.append(LabelConfusion.NONE) #remap[-1] == NONE
+        for (g, s), n in other.matrix.items():
+            self.matrix[(remap[g], remap[s])] += n
+        return self
+
+class LabelConfusionScorer(Scorer):
+    def __init__(self, config):
+        super().__init__(config)
+        self._top = 20
+        self._parse_config()
+
+    def _parse_config(self):
+        if not LabelConfusionScorer.name() in self._config:
+            return
+        scorer = self._config[LabelConfusionScorer.name()]
+        self._top = scorer['topN'] if 'topN' in scorer else 20
+
+    @classmethod
+    def name(cls):
+        return "LabelConfusionScorer"
+
+    def accumulator(self):
+        return LabelConfusion(self._top)
+
+    @staticmethod
+    def _pairs(graph, labels):
+        pairs = {}
+        for e in graph.edges():
+            p = (e.source(), e.target())
+            if p in pairs:
+                pairs[p].add(labels.id(e['label']))
+            else:
+                pairs[p] = set([labels.id(e['label'])])
+        return pairs
+
+    @staticmethod
+    def _key_pairs(sentence, labels, acc_labels):
+        pairs = {}
+        for k in sentence.keys:
+            p = attachment(k)
+            l = acc_labels.id(labels[label_id(k)])
+            if p in pairs:
+                pairs[p].add(l)
+            else:
+                pairs[p] = set([l])
+        return pairs
+
+    def score(self, gold, system, acc):
+        self._count_pairs(acc, self._pairs(gold, acc.labels), self._pairs(system, acc.labels))
+
+    def score_keys(self, gold, system, labels, acc):
+        self._count_pairs(acc, self._key_pairs(gold, labels, acc.labels), self._key_pairs(system, labels, acc.labels))
+
+    def _count_pairs(self, acc, gold_pairs, system_pairs):
+        NONE   = LabelConfusion.NONE
+        matrix = acc.matrix
+
+        for p, glabels in gold_pairs.items():
+            slabels = system_pairs.get(p)
+            if slabels is None:
+                for g in glabels:
+                    matrix[(g, NONE)] += 1
+                continue
+
+            for g in glabels & slabels:
+                matrix[(g, g)] += 1
+            #Several labels on the same attachment are paired in id order
+            gonly, sonly = sorted(glabels - slabels), sorted(slabels - glabels)
+            for g, s in zip(gonly, sonly):
+                matrix[(g, s)] += 1
+            for g in gonly[len(sonly):]:
+                matrix[(g, NONE)] += 1
+            for s in sonly[len(gonly):]:
+                matrix[(NONE, s)] += 1
+
+        for p, slabels in system_pairs.items():
+            if p not in gold_pairs:
+                for s in slabels:
+                    matrix[(NONE, s)] += 1
+
+    @classmethod
+    def table(cls, results, formatter):
+        gold_totals = {}
+        errors = 0
+        for (g, s), n in results.matrix.items():
+            gold_totals[g] = gold_totals.get(g, 0) + n
+            if g != s:
+                errors += n
+
+        confusions = ((k, n) for k, n in results.matrix.items() if k[0] != k[1])
+        top = heapq.nsmallest(results.top, confusions,
+                              key=lambda k: (-k[1], results.label(k[0][0]), results.label(k[0][1])))
+
+        table = [ ["Gold", "System", "#", "% Errors", "% Gold"] ]
+        for (g, s), n in top:
+            gold = "%.2f" % (n / gold_totals[g] * 100.0,) if g != LabelConfusion.NONE else "_"
+            table.append([results.label(g), results.label(s), str(n), "%.2f" % (n / errors * 100.0,), gold])
+        return formatter.format(table)
+
 class Evaluator(object):
-    def __init__(self, formatter, config, scorers = []):
-        self._scorers   = scorers
-        self._results   = {}
+    """
+    Runs scorers over pairs of gold and system sentences. With memo (a
+    SentenceMemo), memoizable scorers reuse the results of the pairs already
+    scored (not with a GoldIndex).
+    """
+    def __init__(self, formatter, config, scorers = [], profiler = None, memo = None):
+        self._scorers   = [scorer(config) for scorer in scorers]
+        self._results   = dict((sc.name(), sc.accumulator()) for sc in self._scorers)
         self._formatter = formatter
         self._config    = config
+        self._profiler  = profiler
+        self._memo      = memo
+
+    def _measured(self, stage, fn, per_sentence = False):
+        if self._profiler is None:
+            return fn
+        return self._profiler.wrap(stage, fn, per_sentence)
 
     def eval(self, golds, systems):
-        for gold, system in zip(golds, systems):
-            for scorer in self._scorers:
-                sc = scorer(gold, system, self._config)
-                for e in gold.edges():
-                    sc.add_gold(e)
-                for e in system.edges():
-                    sc.add_system(e)
-                sc.compute_common()
-                self._accumulate(sc, scorer.name())
-
-        for scorer in self._scorers:
-            yield scorer.name(), scorer.table(self._results[scorer.name()], self._formatter)
-
-    def _accumulate(self, sc, name):
-        if name not in self._results:
-            self._results[name] = sc.get_results()
-        else:
-            acc = self._results[name]
-            self._merge_dict(acc, sc.get_results())
-            self._results[name] = acc
-
-    def _merge_dict(self, result, add):
-        for i, k in enumerate(add):
-            if not isinstance(add, list) and k not in result:
-                result[k] = add[k]
-            else:
-                if isinstance(add, list):
-                    v = k
-                else:
-                    v = add[k]
-
-                if isinstance(v, numbers.Number):
-                    if isinstance(add, list):
-                        results[i] += v
-                    else:
-                        result[k] += v
-                elif isinstance(v, list) or isinstance(v, dict):
-                    self._merge_dict(result[k], v)
-                else:
-                    raise MergeNotDefinedError('Merge not defined for this type (%s, %s)' % (str(v), type(v)) )
+        self.accumulate(golds, systems)
+        yield from self.tables()
+
+    def eval_index(self, index, systems):
+        self.accumulate_index(index, systems)
+        yield from self.tables()
 
+    def _score(self, sc):
+        if self._memo is None or not sc.memoizable:
+            return sc.score
+        return self._memo.memoize(sc.name(), self._config.get(sc.name()), sc.accumulator, sc.score)
 
+    def accumulate(self, golds, systems):
+        scorers = [(self._measured('score ' + sc.name(), self._score(sc), True), self._results[sc.name()]) for sc in self._scorers]
+        for gold, system in zip(golds, systems):
+            for score, acc in scorers:
+                score(gold, system, acc)
+
+    def accumulate_index(self, index, systems):
+        """
+        Same as accumulate() with a precompiled GoldIndex as gold side
+        """
+        scorers = [(self._measured('score ' + sc.name(), sc.score_keys, True), self._results[sc.name()]) for sc in self._scorers]
+        labels  = index.labels
+        encode  = self._measured('encode system', KeyedSentence.from_graph, True)
+        for gold, system in zip(index, systems):
+            system = encode(system, labels)
+            for score, acc in scorers:
+                score(gold, system, labels, acc)
+
+    def results(self):
+        return self._results
+
+    def merge(self, results):
+        """
+        Reduce step: merge the results of another Evaluator (same config)
+        """
+        for name, acc in results.items():
+            self._measured('merge ' + name, self._results[name].merge)(acc)
+
+    def tables(self):
+        for sc in self._scorers:
+            yield sc.name(), self._measured('table ' + sc.name(), sc.table)(self._results[sc.name()], self._formatter)
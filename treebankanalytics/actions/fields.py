@@ -0,0 +1,10 @@
+#Names shared by the sentence index and the commands using it, kept free of
+#imports so that building the command line does not load the index (sqlite3)
+
+__all__ = ['COLUMNS', 'TERM_FIELDS']
+
+#Per sentence properties which can be used in select predicates
+COLUMNS = ('position', 'sentid', 'length', 'edges', 'crossings', 'cycles', 'voids')
+
+#Node fields (and edge labels, as 'label') indexed as search terms
+TERM_FIELDS = ('token', 'lemma', 'cpos', 'pos')
@@ -0,0 +1,314 @@
+import collections, contextlib, itertools, json, mmap, os, struct, tempfile
+from array import array
+from treebankanalytics.actions.accumulators import Vocabulary
+import treebankanalytics.graphs.Graph as G
+
+__all__ = ['FlatBatch', 'SentenceView', 'SharedBatch', 'attached', 'map_batches']
+
+#Arrays of a batch: per sentence node and edge offsets and id, 5 ints per node
+#(index, token, lemma, cpos, pos), (key, value) pairs of node features, extra
+#columns of nodes and 3 ints per edge (source, target, label). Strings are ids
+#in the string table of the batch.
+_ARRAYS = [('node_offsets', 'q'), ('edge_offsets', 'q'), ('ids', 'i'), ('nodes', 'i'),
+           ('feature_offsets', 'q'), ('features', 'i'), ('column_offsets', 'q'), ('columns', 'i'), ('edges', 'i')]
+_NODE = 5
+_EDGE = 3
+#Feature key of a node whose features are a string (the root node)
+_RAW  = -1
+
+MAGIC   = b'TABATCH1'
+_HEADER = struct.Struct('<8s%iQ' % (len(_ARRAYS) + 1))
+
+def _aligned(n):
+    return (n + 7) & ~7
+
+class SentenceView(object):
+    """
+    Sentence i of a FlatBatch, read from its arrays without building nodes
+    and edges.
+    """
+    __slots__ = ('_batch', '_i')
+
+    def __init__(self, batch, i):
+        self._batch = batch
+        self._i     = i
+
+    def id(self):
+        i = self._batch.ids[self._i]
+        return None if i < 0 else self._batch.strings[i]
+
+    def order(self):
+        offsets = self._batch.node_offsets
+        return offsets[self._i+1] - offsets[self._i]
+
+    def __len__(self):
+        offsets = self._batch.edge_offsets
+        return offsets[self._i+1] - offsets[self._i]
+
+    def tokens(self):
+        b = self._batch
+        return [b.strings[b.nodes[n*_NODE+1]] for n in range(b.node_offsets[self._i], b.node_offsets[self._i+1])]
+
+    def edges(self):
+        """
+        (source, target, label) of the edges
+        """
+        b = self._batch
+        edges, strings = b.edges, b.strings
+        return [(edges[e], edges[e+1], strings[edges[e+2]]) for e in range(b.edge_offsets[self._i]*_EDGE, b.edge_offsets[self._i+1]*_EDGE, _EDGE)]
+
+    def graph(self):
+        return self._batch.graph(self._i)
+
+class FlatBatch(object):
+    """
+    Sentences encoded as flat integer arrays and a table of interned
+    strings, so that a batch is moved between processes as a few bytes
+    buffers instead of pickled Graph objects. A batch is either built by
+    encode() or a view of a buffer written by pack_into(), whose arrays are
+    casts of the buffer (no copy, only the string table is decoded).
+
+    Nodes keep their token, lemma, cpos, pos, features and extra columns,
+    edges their label, as set by the readers.
+    """
+    def __init__(self, strings = None, **arrays):
+        self.strings = Vocabulary() if strings is None else strings
+        for name, typecode in _ARRAYS:
+            if name in arrays:
+                setattr(self, name, arrays[name])
+            else:
+                setattr(self, name, array(typecode, [0] if name.endswith('_offsets') else []))
+        self._buffer = None
+
+    @classmethod
+    def encode(cls, graphs):
+        batch = cls()
+        for graph in graphs:
+            batch.add(graph)
+        return batch
+
+    def add(self, graph):
+        s = self.strings.id
+        self.ids.append(-1 if graph.id() is None else s(graph.id()))
+        for n in graph.nodes():
+            f = n.features()
+            self.nodes.extend((n.index(), s(f['token']), s(f['lemma']), s(f['cpos']), s(f['pos'])))
+            if isinstance(f['features'], str):
+                self.features.extend((_RAW, s(f['features'])))
+            else:
+                for k, v in f['features'].items():
+                    self.features.extend((s(k), s(v)))
+            self.feature_offsets.append(len(self.features))
+            self.columns.extend(s(c) for c in f.get('ta_extra_columns', ()))
+            self.column_offsets.append(len(self.columns))
+            #Edges by dependent, in the order they were added
+            try:
+                sources = graph.sources_of(n.index())
+            except AttributeError:
+                continue
+            for e in sources.values():
+                self.edges.extend((e.source(), e.target(), s(e['label'])))
+        self.node_offsets.append(len(self.nodes) // _NODE)
+        self.edge_offsets.append(len(self.edges) // _EDGE)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        return SentenceView(self, i)
+
+    def __iter__(self):
+        return (SentenceView(self, i) for i in range(len(self)))
+
+    def graph(self, i):
+        """
+        Graph of sentence i, equal to the one encoded
+        """
+        strings, nodes, features, columns, edges = self.strings, self.nodes, self.features, self.columns, self.edges
+        graph = G.Graph()
+        if self.ids[i] >= 0:
+            graph.set_id(strings[self.ids[i]])
+        for n in range(self.node_offsets[i], self.node_offsets[i+1]):
+            k = n * _NODE
+            start, end = self.feature_offsets[n], self.feature_offsets[n+1]
+            if end - start == 2 and features[start] == _RAW:
+                feats = strings[features[start+1]]
+            else:
+                feats = dict((strings[features[f]], strings[features[f+1]]) for f in range(start, end, 2))
+            f = {'token': strings[nodes[k+1]], 'lemma': strings[nodes[k+2]], 'cpos': strings[nodes[k+3]], 'pos': strings[nodes[k+4]], 'features': feats}
+            start, end = self.column_offsets[n], self.column_offsets[n+1]
+            if end > start:
+                f['ta_extra_columns'] = [strings[c] for c in columns[start:end]]
+            graph.add_node(G.Node(nodes[k], f))
+        for e in range(self.edge_offsets[i] * _EDGE, self.edge_offsets[i+1] * _EDGE, _EDGE):
+            graph.add_edge(G.Edge(edges[e], edges[e+1], {'label': strings[edges[e+2]]}))
+        return graph
+
+    def graphs(self):
+        """
+        Graphs of the sentences, built on demand for the analyzers working
+        on Graph objects
+        """
+        return (self.graph(i) for i in range(len(self)))
+
+    def _arrays(self):
+        return [getattr(self, name) for name, _ in _ARRAYS]
+
+    def _strings(self):
+        return json.dumps(list(self.strings)).encode('utf-8')
+
+    def nbytes(self):
+        arrays = sum(_aligned(len(a) * a.itemsize) for a in self._arrays())
+        return _HEADER.size + arrays + len(self._strings())
+
+    def pack_into(self, buffer):
+        """
+        Write the batch into buffer (at least nbytes() long), in the native
+        byte order: buffers are only shared between processes of a machine
+        """
+        strings = self._strings()
+        arrays  = self._arrays()
+        _HEADER.pack_into(buffer, 0, MAGIC, *([len(a) for a in arrays] + [len(strings)]))
+        view, offset = memoryview(buffer).cast('B'), _aligned(_HEADER.size)
+        for a in arrays:
+            data = memoryview(a).cast('B')
+            view[offset:offset + len(data)] = data
+            offset += _aligned(len(data))
+        view[offset:offset + len(strings)] = strings
+        view.release()
+
+    @classmethod
+    def unpack(cls, buffer):
+        """
+        Batch whose arrays are views of buffer, call release() before
+        closing buffer
+        """
+        header = _HEADER.unpack_from(buffer, 0)
+        if header[0] != MAGIC:
+            raise ValueError('Not a sentence batch')
+        view, offset = memoryview(buffer).cast('B'), _aligned(_HEADER.size)
+        arrays = {}
+        for (name, typecode), n in zip(_ARRAYS, header[1:]):
+            size = n * struct.calcsize(typecode)
+            arrays[name] = view[offset:offset + size].cast(typecode)
+            offset += _aligned(size)
+        batch = cls(json.loads(bytes(view[offset:offset + header[-1]]).decode('utf-8')), **arrays)
+        batch._buffer = view
+        return batch
+
+    def release(self):
+        if self._buffer is None:
+            return
+        for a in self._arrays():
+            a.release()
+        self._buffer.release()
+        self._buffer = None
+
+class SharedBatch(object):
+    """
+    A FlatBatch copied once into POSIX shared memory or, where it is not
+    available, a memory mapped temporary file. handle is picklable and lets
+    another process map the same pages (see attached). The creator calls
+    close() once the batch is no longer needed.
+    """
+    def __init__(self, batch):
+        size = batch.nbytes()
+        try:
+            from multiprocessing.shared_memory import SharedMemory
+            self._memory = SharedMemory(create=True, size=size)
+            self.handle  = ('shm', self._memory.name, size)
+            batch.pack_into(self._memory.buf)
+        except (ImportError, OSError):
+            fd, path = tempfile.mkstemp(prefix='treebankanalytics-', suffix='.batch')
+            try:
+                os.ftruncate(fd, size)
+                self._memory = mmap.mmap(fd, size)
+            finally:
+                os.close(fd)
+            self.handle = ('mmap', path, size)
+            batch.pack_into(self._memory)
+
+    def close(self):
+        kind, name, _ = self.handle
+        self._memory.close()
+        if kind == 'shm':
+            self._memory.unlink()
+        else:
+            os.unlink(name)
+
+@contextlib.contextmanager
+def attached(handle):
+    """
+    FlatBatch view of the batch shared by a SharedBatch, given its handle
+    """
+    kind, name, size = handle
+    if kind == 'shm':
+        from multiprocessing.shared_memory import SharedMemory
+        memory = SharedMemory(name=name)
+        buffer = memory.buf
+    else:
+        with open(name, 'rb') as stream:
+            memory = mmap.mmap(stream.fileno(), size, access=mmap.ACCESS_READ)
+        buffer = memoryview(memory)
+    batch = FlatBatch.unpack(buffer)
+    try:
+        yield batch
+    finally:
+        batch.release()
+        buffer.release()
+        memory.close()
+
+def _call(fn, handle, args):
+    with attached(handle) as batch:
+        return fn(batch, *args)
+
+def map_batches(fn, graphs, args = (), jobs = None, size = 1000, profiler = None):
+    """
+    fn(batch, *args) for each batch of size graphs, computed by jobs worker
+    processes (default: number of CPUs), batch being a FlatBatch view of
+    shared memory. Results come in order; at most two batches per worker
+    are in flight, so memory does not grow with the corpus.
+
+    With a profiler, encoding the graphs and copying the batches to shared
+    memory are measured as the encode and share stages.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    jobs    = jobs or os.cpu_count() or 1
+    graphs  = iter(graphs)
+    pending = collections.deque()
+    share   = SharedBatch if profiler is None else profiler.wrap('share', SharedBatch)
+
+    def encode(graphs):
+        batch = FlatBatch()
+        add   = batch.add if profiler is None else profiler.wrap('encode', batch.add, True)
+        for graph in graphs:
+            add(graph)
+        return batch
+
+    def submit(executor):
+        batch = encode(itertools.islice(graphs, size))
+        if len(batch) == 0:
+            return False
+        shared = share(batch)
+        pending.append((shared, executor.submit(_call, fn, shared.handle, args)))
+        return True
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        try:
+            while len(pending) < 2 * jobs and submit(executor):
+                pass
+            while pending:
+                shared, future = pending[0]
+                result = future.result()
+                pending.popleft()
+                shared.close()
+                submit(executor)
+                yield result
+        finally:
+            for shared, future in pending:
+                future.cancel()
+            for shared, future in pending:
+                #Running tasks may still read the batch
+                if not future.cancelled():
+                    future.exception()
+                shared.close()
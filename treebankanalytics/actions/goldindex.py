@@ -0,0 +1,169 @@
+import json, struct, sys
+from array import array
+from treebankanalytics.actions.accumulators import Vocabulary
+
+__all__ = ['GoldIndex', 'KeyedSentence', 'InvalidIndexError', 'edge_key', 'attachment', 'label_id', 'edge_length', 'encode', 'count_common', 'attachments']
+
+#An edge is encoded as a single integer: ((head << 20 | dependent) << 20) | label id
+#so that sorting keys sorts edges by attachment first.
+NODE_BITS  = 20
+LABEL_BITS = 20
+NODE_MASK  = (1 << NODE_BITS) - 1
+LABEL_MASK = (1 << LABEL_BITS) - 1
+
+MAGIC   = b'TAGOLDIDX'
+VERSION = 1
+
+class InvalidIndexError(Exception):
+    pass
+
+def edge_key(head, dep, label_id):
+    return (((head << NODE_BITS) | dep) << LABEL_BITS) | label_id
+
+def attachment(key):
+    return key >> LABEL_BITS
+
+def label_id(key):
+    return key & LABEL_MASK
+
+def edge_length(key):
+    return abs((key >> (NODE_BITS + LABEL_BITS)) - ((key >> LABEL_BITS) & NODE_MASK))
+
+def encode(graph, labels):
+    """
+    Sorted edge keys of graph, label ids being taken from the vocabulary labels
+    """
+    return sorted(edge_key(e.source(), e.target(), labels.id(e['label'])) for e in graph.edges())
+
+def attachments(keys):
+    """
+    Sorted unique attachment (unlabeled) keys of sorted edge keys
+    """
+    r = []
+    last = -1
+    for k in keys:
+        a = k >> LABEL_BITS
+        if a != last:
+            r.append(a)
+            last = a
+    return r
+
+def count_common(a, b):
+    """
+    Size of the intersection of two sorted sequences without duplicates (merge-join)
+    """
+    i, j, n = 0, 0, 0
+    la, lb = len(a), len(b)
+    while i < la and j < lb:
+        x, y = a[i], b[j]
+        if x == y:
+            n += 1
+            i += 1
+            j += 1
+        elif x < y:
+            i += 1
+        else:
+            j += 1
+    return n
+
+class KeyedSentence(object):
+    """
+    Compact view of a sentence: its order (number of nodes, root included)
+    and its sorted edge keys.
+    """
+    __slots__ = ('order', 'keys', '_lengths')
+
+    def __init__(self, order, keys, lengths = None):
+        self.order = order
+        self.keys  = keys
+        self._lengths = lengths
+
+    @classmethod
+    def from_graph(cls, graph, labels):
+        return cls(graph.order(), encode(graph, labels))
+
+    def lengths(self):
+        """
+        Edge lengths, aligned with keys
+        """
+        if self._lengths is None:
+            self._lengths = [edge_length(k) for k in self.keys]
+        return self._lengths
+
+class GoldIndex(object):
+    """
+    Precompiled gold corpus: label vocabulary, sentence orders, sorted edge
+    keys (concatenated, with per sentence offsets) and edge lengths.
+    """
+    def __init__(self):
+        self.labels  = Vocabulary()
+        self.orders  = array('I')
+        self.offsets = array('q', [0])
+        self.keys    = array('q')
+        self.lengths = array('I')
+
+    @classmethod
+    def build(cls, graphs):
+        index = cls()
+        for graph in graphs:
+            index.add(graph)
+        return index
+
+    def add(self, graph):
+        keys = encode(graph, self.labels)
+        self.orders.append(graph.order())
+        self.keys.extend(keys)
+        self.lengths.extend(edge_length(k) for k in keys)
+        self.offsets.append(len(self.keys))
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __getitem__(self, i):
+        start, end = self.offsets[i], self.offsets[i+1]
+        return KeyedSentence(self.orders[i], self.keys[start:end], self.lengths[start:end])
+
+    def __iter__(self):
+        keys, lengths, offsets = self.keys, self.lengths, self.offsets
+        for i, order in enumerate(self.orders):
+            start, end = offsets[i], offsets[i+1]
+            yield KeyedSentence(order, keys[start:end], lengths[start:end])
+
+    def _arrays(self):
+        return [self.orders, self.offsets, self.keys, self.lengths]
+
+    def save(self, fileo):
+        labels = json.dumps(list(self.labels)).encode('utf-8')
+        fileo.write(MAGIC)
+        fileo.write(struct.pack('<BBQ', VERSION, sys.byteorder == 'little', len(labels)))
+        fileo.write(labels)
+        for a in self._arrays():
+            fileo.write(struct.pack('<cBQ', a.typecode.encode('ascii'), a.itemsize, len(a)))
+            fileo.write(a.tobytes())
+
+    @classmethod
+    def load(cls, fileo):
+        def read(size):
+            data = fileo.read(size)
+            if len(data) != size:
+                raise InvalidIndexError('Truncated gold index')
+            return data
+
+        if fileo.read(len(MAGIC)) != MAGIC:
+            raise InvalidIndexError('Not a gold index')
+        version, little, size = struct.unpack('<BBQ', read(10))
+        if version != VERSION:
+            raise InvalidIndexError('Unsupported gold index version %i' % version)
+
+        index = cls()
+        for label in json.loads(read(size).decode('utf-8')):
+            index.labels.id(label)
+        for a in index._arrays():
+            typecode, itemsize, n = struct.unpack('<cBQ', read(10))
+            if typecode.decode('ascii') != a.typecode or itemsize != a.itemsize:
+                raise InvalidIndexError('Gold index built on an incompatible platform')
+            del a[:]
+            a.frombytes(read(n * itemsize))
+            if bool(little) != (sys.byteorder == 'little'):
+                a.byteswap()
+        return index
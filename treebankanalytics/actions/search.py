@@ -0,0 +1,277 @@
+import io, re
+from treebankanalytics.actions.convert import numbered_reader
+from treebankanalytics.actions.fields import TERM_FIELDS
+from treebankanalytics.actions.sentindex import term
+
+__all__ = ['Pattern', 'InvalidPatternError', 'search']
+
+_TOKEN = re.compile(r'\s*(?:(?P<string>"(?:[^"\\]|\\.)*")|(?P<arrow>->)|(?P<edge>-\[)|(?P<op>!=|=|~)|(?P<punct>[\[\],|;])|(?P<word>(?:(?!->|-\[)[^\s\[\],|;"=!~])+))')
+
+class InvalidPatternError(Exception):
+    pass
+
+def _tokens(text):
+    tokens, position = [], 0
+    #New lines separate statements like ;
+    text = text.replace('\n', ';').rstrip()
+    while position < len(text):
+        m = _TOKEN.match(text, position)
+        if m is None or m.end() == position:
+            raise InvalidPatternError('Unexpected %r at character %i' % (text[position:position+10], position))
+        kind = m.lastgroup
+        value = m.group(kind)
+        if kind == 'string':
+            value = re.sub(r'\\(.)', r'\1', value[1:-1])
+        tokens.append((kind, value))
+        position = m.end()
+    return tokens
+
+class Pattern(object):
+    """
+    Subgraph pattern: statements separated by ';' or new lines, each a node
+    or a chain of edges between nodes.
+
+        H [pos=V|VPP, lemma!=être]       node H with constraints on its fields
+        H -[suj]-> D; H2 -[suj]-> D      edges labeled suj (-> for any label)
+        D [token~"[A-Z].*"]              regular expression on the whole value
+
+    Fields are token, lemma, cpos and pos. Distinct names match distinct
+    nodes: the pattern above finds nodes with two incoming suj edges, one
+    from a V or VPP. matches() searches the bindings by backtracking,
+    binding first the names with the fewest candidate nodes and then
+    their neighbours in the pattern.
+    """
+    def __init__(self, text):
+        self.text        = text
+        self.names       = []
+        self.constraints = {}
+        self.edges       = []
+        self._parse(_tokens(text))
+        self._required = [[t.split('=', 1)[1] for t in group] for group in self.terms()]
+
+    #Parser
+    def _parse(self, tokens):
+        self._tokens, self._i = tokens, 0
+        while self._peek() is not None:
+            if self._peek() == ('punct', ';'):
+                self._i += 1
+                continue
+            source = self._node()
+            while self._peek() is not None and self._peek()[0] in ('arrow', 'edge'):
+                labels = self._edge()
+                target = self._node()
+                self.edges.append((source, labels, target))
+                source = target
+            if self._peek() not in (None, ('punct', ';')):
+                raise InvalidPatternError('Expected ; or an edge, got %r' % self._peek()[1])
+        if not self.names:
+            raise InvalidPatternError('Empty pattern')
+
+    def _peek(self):
+        return self._tokens[self._i] if self._i < len(self._tokens) else None
+
+    def _next(self, kind, value = None):
+        token = self._peek()
+        if token is None or token[0] != kind or (value is not None and token[1] != value):
+            raise InvalidPatternError('Expected %s, got %s' % (value or kind, 'end of pattern' if token is None else repr(token[1])))
+        self._i += 1
+        return token[1]
+
+    def _values(self):
+        values = [self._value()]
+        while self._peek() == ('punct', '|'):
+            self._i += 1
+            values.append(self._value())
+        return values
+
+    def _value(self):
+        token = self._peek()
+        if token is None or token[0] not in ('word', 'string'):
+            raise InvalidPatternError('Expected a value, got %s' % ('end of pattern' if token is None else repr(token[1])))
+        self._i += 1
+        return token[1]
+
+    def _node(self):
+        name = self._next('word')
+        if not re.match(r'^\w+$', name):
+            raise InvalidPatternError('Invalid node name %r' % name)
+        if name not in self.constraints:
+            self.names.append(name)
+            self.constraints[name] = []
+        if self._peek() == ('punct', '['):
+            self._i += 1
+            while True:
+                field = self._next('word')
+                if field not in TERM_FIELDS:
+                    raise InvalidPatternError('Unknown field %s (available: %s)' % (field, ', '.join(TERM_FIELDS)))
+                op = self._next('op')
+                values = self._values()
+                if op == '~':
+                    try:
+                        values = [re.compile(v) for v in values]
+                    except re.error as e:
+                        raise InvalidPatternError('Invalid regular expression: %s' % e)
+                self.constraints[name].append((field, op, values))
+                token = self._peek()
+                if token not in (('punct', ','), ('punct', ']')):
+                    raise InvalidPatternError('Expected , or ], got %s' % ('end of pattern' if token is None else repr(token[1])))
+                self._i += 1
+                if token[1] == ']':
+                    break
+        return name
+
+    def _edge(self):
+        if self._next(self._peek()[0]) == '->':
+            return None
+        labels = self._values()
+        self._next('punct', ']')
+        self._next('arrow')
+        return set(labels)
+
+    #Index
+    def terms(self):
+        """
+        Groups of search terms (see SentenceIndex.candidates): a matching
+        sentence holds at least one term of each group
+        """
+        groups = []
+        for name in self.names:
+            for field, op, values in self.constraints[name]:
+                if op == '=':
+                    groups.append(sorted(term(field, v) for v in values))
+        for _, labels, _ in self.edges:
+            if labels is not None:
+                groups.append(sorted(term('label', l) for l in labels))
+        return groups
+
+    def label_counts(self):
+        """
+        Least number of edges of each label in a matching sentence: edges
+        between distinct pairs of names match distinct edges
+        """
+        pairs = {}
+        for s, labels, t in self.edges:
+            if labels is not None and len(labels) == 1:
+                pairs.setdefault(next(iter(labels)), set()).add((s, t))
+        return dict((l, len(p)) for l, p in pairs.items() if len(p) > 1)
+
+    def prefilter(self, text):
+        """
+        False when text, the lines of a sentence, cannot match (a value or
+        label required by the pattern is missing)
+        """
+        for values in self._required:
+            if not any(v in text for v in values):
+                return False
+        return True
+
+    #Matcher
+    @staticmethod
+    def _test(features, field, op, values):
+        value = features[field]
+        if op == '=':
+            return value in values
+        if op == '!=':
+            return value not in values
+        return any(r.fullmatch(value) for r in values)
+
+    def candidates(self, graph):
+        """
+        Nodes of graph satisfying the constraints of each name
+        """
+        nodes  = [(n.index(), n.features()) for n in graph.nodes()]
+        result = {}
+        for name in self.names:
+            selected = nodes
+            for c in self.constraints[name]:
+                selected = [(i, f) for i, f in selected if self._test(f, *c)]
+            result[name] = set(i for i, _ in selected)
+        return result
+
+    def _plan(self, candidates):
+        """
+        Binding order: the name with the fewest candidates, then repeatedly
+        the neighbour of the names already bound with the fewest candidates.
+        Each step gives the edges linking the name to names bound before.
+        """
+        neighbours = dict((name, set()) for name in self.names)
+        for s, _, t in self.edges:
+            neighbours[s].add(t)
+            neighbours[t].add(s)
+        order, bound = [], set()
+        while len(order) < len(self.names):
+            pool = [n for n in self.names if n not in bound and neighbours[n] & bound] or [n for n in self.names if n not in bound]
+            name = min(pool, key=lambda n: len(candidates[n]))
+            links = [(s, labels, t) for s, labels, t in self.edges if (s == name and t in bound) or (t == name and s in bound) or (s == t == name)]
+            order.append((name, links))
+            bound.add(name)
+        return order
+
+    def matches(self, graph):
+        """
+        Bindings (dicts name: node index) of the pattern in graph
+        """
+        candidates = self.candidates(graph)
+        if any(not c for c in candidates.values()):
+            return
+        yield from self._bind(graph, self._plan(candidates), candidates, {}, set())
+
+    def _bind(self, graph, plan, candidates, binding, used):
+        if len(binding) == len(plan):
+            yield dict(binding)
+            return
+        name, links = plan[len(binding)]
+        for i in self._expand(graph, name, links, candidates[name], binding):
+            if i in used or not self._linked(graph, name, i, links, binding):
+                continue
+            binding[name] = i
+            used.add(i)
+            yield from self._bind(graph, plan, candidates, binding, used)
+            used.discard(i)
+            del binding[name]
+
+    @staticmethod
+    def _expand(graph, name, links, candidates, binding):
+        #Nodes reached through an edge from a bound name, rather than all candidates
+        for s, _, t in links:
+            try:
+                if s in binding:
+                    return [i for i in graph.targets_of(binding[s]) if i in candidates]
+                if t in binding:
+                    return [i for i in graph.sources_of(binding[t]) if i in candidates]
+            except AttributeError:
+                return []
+        return sorted(candidates)
+
+    @staticmethod
+    def _linked(graph, name, i, links, binding):
+        for s, labels, t in links:
+            try:
+                edge = graph.edge(i if s == name else binding[s], i if t == name else binding[t])
+            except AttributeError:
+                return False
+            if labels is not None and edge['label'] not in labels:
+                return False
+        return True
+
+def search(pattern, sentences, format, all_matches = False):
+    """
+    (position, text, graph, bindings) of the sentences matching pattern
+    among sentences, (position, text) pairs of sentences in format (see
+    convert.sentence_batches), with the first binding only unless
+    all_matches
+    """
+    for position, text in sentences:
+        if not pattern.prefilter(text):
+            continue
+        graph = next(iter(numbered_reader(format, position + 1)(io.StringIO(text))), None)
+        if graph is None:
+            continue
+        bindings = pattern.matches(graph)
+        if all_matches:
+            bindings = list(bindings)
+        else:
+            first = next(bindings, None)
+            bindings = [first] if first is not None else []
+        if bindings:
+            yield position, text, graph, bindings
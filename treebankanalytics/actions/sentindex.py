@@ -0,0 +1,259 @@
+import os, re, sqlite3, sys
+from array import array
+from collections import Counter, defaultdict
+from treebankanalytics.graphs.Graph import Graph
+from treebankanalytics.actions.accumulators import Counts
+from treebankanalytics.actions.cache import prefix_checksum
+from treebankanalytics.actions.fields import COLUMNS, TERM_FIELDS
+
+__all__ = ['SentenceIndex', 'OffsetStream', 'InvalidPredicateError', 'StaleIndexError', 'COLUMNS', 'TERM_FIELDS', 'term']
+
+_PREDICATE = re.compile(r'^\s*(label:\S+?|\w+)\s*(<=|>=|!=|==|=|<|>)\s*(.+?)\s*$')
+
+class InvalidPredicateError(Exception):
+    pass
+
+class StaleIndexError(Exception):
+    pass
+
+class OffsetStream(object):
+    """
+    Text lines of a binary stream, keeping the byte offset of the end of the
+    last line read, so that the offset of each sentence produced by a reader
+    is known without parsing the file again.
+    """
+    def __init__(self, stream, encoding = 'utf-8'):
+        self._stream  = stream
+        self.encoding = encoding
+        self.name     = stream.name
+        self.offset   = stream.tell()
+        self.end      = self.offset
+
+    def __iter__(self):
+        for line in self._stream:
+            self.offset += len(line)
+            yield line.decode(self.encoding)
+
+    def track(self, graphs):
+        """
+        Pass graphs through, keeping in end the offset just after the last
+        graph (lines of an unterminated last sentence are not counted)
+        """
+        for graph in graphs:
+            self.end = self.offset
+            yield graph
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._stream.close()
+
+def term(field, value):
+    return '%s=%s' % (field, value)
+
+def file_stamp(path):
+    st = os.stat(path)
+    return "%i:%i" % (st.st_size, st.st_mtime_ns)
+
+class SentenceIndex(object):
+    """
+    SQLite index of per sentence properties of a corpus: position, sentid,
+    length (number of tokens), edges, crossings (number of edges crossing
+    another edge), cycles (strongly connected components), voids (as
+    counted by VoidAnalyzer), label histogram and byte offset/size of the
+    sentence in the corpus file, and an inverted index from search terms
+    (see term) to the sentences holding them.
+    """
+    #Number of sentences whose term positions are kept in memory before being written
+    POSTINGS_BLOCK = 10000
+
+    def __init__(self, connection, void = None):
+        self._db       = connection
+        self._void     = void
+        self._position = 0
+        self._postings = defaultdict(lambda: array('I'))
+
+    @classmethod
+    def create(cls, path, corpus, format, config = {}):
+        if os.path.exists(path):
+            os.unlink(path)
+        db = sqlite3.connect(path)
+        db.executescript("""
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE sentences (position INTEGER PRIMARY KEY, sentid TEXT, length INTEGER, edges INTEGER,
+                                    crossings INTEGER, cycles INTEGER, voids INTEGER, offset INTEGER, size INTEGER);
+            CREATE TABLE labels (position INTEGER, label TEXT, count INTEGER, PRIMARY KEY (position, label)) WITHOUT ROWID;
+            CREATE TABLE postings (term TEXT, block INTEGER, positions BLOB, PRIMARY KEY (term, block)) WITHOUT ROWID;
+        """)
+        corpus = os.path.abspath(corpus)
+        db.executemany("INSERT INTO meta VALUES (?, ?)", [('corpus', corpus), ('format', format), ('stamp', file_stamp(corpus)),
+                                                          ('checksum', prefix_checksum(corpus, os.path.getsize(corpus)))])
+        #Imported here so that select and search (open) do not load the analyzers
+        from treebankanalytics.actions.analyze import VoidAnalyzer
+        return cls(db, VoidAnalyzer(config))
+
+    @classmethod
+    def open(cls, path):
+        if not os.path.isfile(path):
+            raise StaleIndexError('%s does not exist' % path)
+        return cls(sqlite3.connect(path))
+
+    def meta(self, key):
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def add(self, graph, offset, size):
+        try:
+            sentid = graph.node(1)['features']['sentid'].strip()
+        except (AttributeError, KeyError):
+            sentid = None
+        voids = Counts('Tokens', 'Void')
+        self._void.analyze(graph, voids)
+
+        position = self._position
+        self._db.execute("INSERT INTO sentences VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (position, sentid, graph.order() - 1, len(graph), len(graph.crossing_edges()),
+             len(Graph.strongly_connected_components(graph)), voids['Void'], offset, size))
+        labels = Counter(e['label'] for e in graph.edges())
+        self._db.executemany("INSERT INTO labels VALUES (?, ?, ?)", ((position, l, n) for l, n in labels.items()))
+        terms = set(term('label', l) for l in labels)
+        for n in graph.nodes():
+            features = n.features()
+            terms.update(term(f, features[f]) for f in TERM_FIELDS)
+        for t in terms:
+            self._postings[t].append(position)
+        self._position += 1
+        if self._position % self.POSTINGS_BLOCK == 0:
+            self._flush()
+
+    def _flush(self):
+        """
+        Write the positions of the sentences of the current block holding each
+        term, as one little endian array per term
+        """
+        block = (self._position - 1) // self.POSTINGS_BLOCK
+        rows  = []
+        for t, positions in self._postings.items():
+            if sys.byteorder != 'little':
+                positions.byteswap()
+            rows.append((t, block, positions.tobytes()))
+        self._db.executemany("INSERT INTO postings VALUES (?, ?, ?)", rows)
+        self._postings.clear()
+
+    def record(self, graphs, stream):
+        """
+        Index graphs read from stream (an OffsetStream) while passing them through
+        """
+        start = stream.offset
+        for graph in graphs:
+            self.add(graph, start, stream.offset - start)
+            start = stream.offset
+            yield graph
+
+    def close(self):
+        if self._postings:
+            self._flush()
+        self._db.commit()
+        self._db.close()
+
+    @staticmethod
+    def _condition(predicate):
+        """
+        SQL condition and parameters of a predicate: COLUMN OP VALUE or label:LABEL OP VALUE
+        """
+        m = _PREDICATE.match(predicate)
+        if m is None:
+            raise InvalidPredicateError('Invalid predicate %r, expected COLUMN OP VALUE' % predicate)
+        column, op, value = m.groups()
+        op = '=' if op == '==' else op
+
+        if column.startswith('label:'):
+            lhs, params = "COALESCE((SELECT count FROM labels l WHERE l.position = s.position AND l.label = ?), 0)", [column[6:]]
+        elif column in COLUMNS:
+            lhs, params = column, []
+        else:
+            raise InvalidPredicateError('Unknown column %s (available: %s, label:LABEL)' % (column, ', '.join(COLUMNS)))
+
+        if column != 'sentid':
+            try:
+                value = int(value)
+            except ValueError:
+                raise InvalidPredicateError('%s should be compared to an integer' % column)
+        return "%s %s ?" % (lhs, op), params + [value]
+
+    def select(self, predicates):
+        """
+        (position, offset, size) of the sentences matching all predicates, in corpus order
+        """
+        conditions, params = ["1"], []
+        for p in predicates:
+            c, ps = self._condition(p)
+            conditions.append(c)
+            params.extend(ps)
+        query = "SELECT position, offset, size FROM sentences s WHERE %s ORDER BY position" % ' AND '.join(conditions)
+        return self._db.execute(query, params)
+
+    def candidates(self, groups, labels = {}):
+        """
+        (position, offset, size) of the sentences holding, for each group of
+        search terms, at least one of them, and at least labels[l] edges
+        labeled l, in corpus order
+        """
+        if self._db.execute("SELECT name FROM sqlite_master WHERE name = 'postings'").fetchone() is None:
+            raise StaleIndexError('The index has no search terms, build it again with analyze --index')
+        if not groups and not labels:
+            yield from self._db.execute("SELECT position, offset, size FROM sentences ORDER BY position")
+            return
+
+        sets = []
+        for group in groups:
+            positions = array('I')
+            for data, in self._db.execute("SELECT positions FROM postings WHERE term IN (%s)" % ', '.join('?' * len(group)), group):
+                positions.frombytes(data)
+            if sys.byteorder != 'little':
+                positions.byteswap()
+            sets.append(set(positions))
+        for label, count in labels.items():
+            sets.append(set(p for p, in self._db.execute("SELECT position FROM labels WHERE label = ? AND count >= ?", (label, count))))
+        #Smallest first, so that each intersection is at most as large
+        sets.sort(key=len)
+        selected = sorted(sets[0].intersection(*sets[1:]))
+        for i in range(0, len(selected), 500):
+            chunk = selected[i:i+500]
+            yield from self._db.execute("SELECT position, offset, size FROM sentences WHERE position IN (%s) ORDER BY position" % ', '.join('?' * len(chunk)), chunk)
+
+    def _check(self, corpus):
+        """
+        Raise StaleIndexError unless corpus is the indexed file. The indexed
+        file is checked against its size and modification time, another
+        file (e.g. a copy) against its size and content (see prefix_checksum).
+        """
+        checksum = self.meta('checksum')
+        if corpus is None or checksum is None:
+            corpus = corpus or self.meta('corpus')
+            fresh  = file_stamp(corpus) == self.meta('stamp')
+        else:
+            size  = os.path.getsize(corpus)
+            fresh = size == int(self.meta('stamp').split(':')[0]) and prefix_checksum(corpus, size) == checksum
+        if not fresh:
+            raise StaleIndexError('%s changed since it was indexed' % corpus)
+        return corpus
+
+    def read(self, rows, corpus = None):
+        """
+        (position, bytes) of the sentences of rows, read from the corpus file
+        (by default the indexed file)
+        """
+        corpus = self._check(corpus)
+        with open(corpus, 'rb') as stream:
+            for position, offset, size in rows:
+                stream.seek(offset)
+                yield position, stream.read(size)
+
+    def extract(self, rows, output, corpus = None):
+        """
+        Copy the sentences of rows from the corpus file to output (binary stream)
+        """
+        for _, data in self.read(rows, corpus):
+            output.write(data)
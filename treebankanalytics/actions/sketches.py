@@ -0,0 +1,212 @@
+import hashlib, heapq, math
+from treebankanalytics.actions.accumulators import Accumulator, MergeNotDefinedError
+
+__all__ = ['SpaceSaving', 'HyperLogLog', 'Cardinality', 'stable_hash']
+
+def stable_hash(item):
+    """
+    64 bits hash of a string (or a tuple of strings) that does not depend on
+    the process (unlike hash()), so that sketches can be merged across runs.
+    """
+    if isinstance(item, tuple):
+        item = '\x1f'.join(str(i) for i in item)
+    return int.from_bytes(hashlib.blake2b(str(item).encode('utf-8'), digest_size=8).digest(), 'big')
+
+class SpaceSaving(Accumulator):
+    """
+    Space-Saving heavy hitters sketch (Metwally et al., 2005) holding at most
+    capacity counters. A monitored item's count never underestimates its true
+    frequency and overestimates it by at most its error, itself bounded by
+    min_count() <= total / capacity. Mergeable as described by Agarwal et al.
+    (2012) "Mergeable Summaries", with the same bound on the merged stream.
+    """
+    def __init__(self, capacity, top = None):
+        self.capacity = capacity
+        self.top      = top
+        self.total    = 0
+        self._counters = {} #item -> [count, error]
+        self._heap     = [] #(count, item), counts may be stale (lower) for updated items
+
+    def __len__(self):
+        return len(self._counters)
+
+    def __contains__(self, item):
+        return item in self._counters
+
+    def add(self, item, n = 1):
+        self.total += n
+        c = self._counters.get(item)
+        if c is not None:
+            c[0] += n
+        elif len(self._counters) < self.capacity:
+            self._counters[item] = [n, 0]
+            heapq.heappush(self._heap, (n, item))
+        else:
+            m, victim = self._min()
+            del self._counters[victim]
+            self._counters[item] = [m + n, m]
+            heapq.heapreplace(self._heap, (m + n, item))
+
+    def _min(self):
+        """
+        Smallest counter, left on top of the heap
+        """
+        heap, counters = self._heap, self._counters
+        while True:
+            count, item = heap[0]
+            current = counters[item][0]
+            if current == count:
+                return count, item
+            heapq.heapreplace(heap, (current, item))
+
+    def min_count(self):
+        if len(self._counters) < self.capacity:
+            return 0
+        return self._min()[0]
+
+    def count(self, item):
+        """
+        (estimated count, maximal overestimation) of item
+        """
+        c = self._counters.get(item)
+        if c is None:
+            m = self.min_count()
+            return m, m
+        return c[0], c[1]
+
+    def items(self):
+        """
+        (item, count, error) triples by decreasing count, limited to the top first ones
+        """
+        items = ((item, c[0], c[1]) for item, c in self._counters.items())
+        if self.top is None:
+            return sorted(items, key=lambda k: k[1], reverse=True)
+        return heapq.nlargest(self.top, items, key=lambda k: k[1])
+
+    def merge(self, other):
+        self._check_mergeable(other)
+        #Items not monitored by a sketch may have occurred up to its min count
+        m1, m2 = self.min_count(), other.min_count()
+        counters = {}
+        for item, (count, error) in self._counters.items():
+            c = other._counters.get(item)
+            counters[item] = [count + c[0], error + c[1]] if c is not None else [count + m2, error + m2]
+        for item, (count, error) in other._counters.items():
+            if item not in counters:
+                counters[item] = [count + m1, error + m1]
+
+        if len(counters) > self.capacity:
+            kept = heapq.nlargest(self.capacity, counters.items(), key=lambda k: k[1][0])
+            counters = dict(kept)
+        self._counters = counters
+        self._heap = [(c[0], item) for item, c in counters.items()]
+        heapq.heapify(self._heap)
+        self.total += other.total
+        return self
+
+class HyperLogLog(Accumulator):
+    """
+    HyperLogLog cardinality sketch (Flajolet et al., 2007) with 2^precision
+    one byte registers. The relative standard error is 1.04 / sqrt(2^precision).
+    """
+    def __init__(self, precision = 12):
+        if not 4 <= precision <= 16:
+            raise ValueError('HyperLogLog precision should be between 4 and 16')
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, item):
+        self.add_hash(stable_hash(item))
+
+    def add_hash(self, h):
+        p = self.precision
+        w = h & ((1 << (64 - p)) - 1)
+        rank = (64 - p) - w.bit_length() + 1
+        idx = h >> (64 - p)
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def estimate(self):
+        m = len(self.registers)
+        if m >= 128:
+            alpha = 0.7213 / (1. + 1.079 / m)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        e = alpha * m * m / sum(2. ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if e <= 2.5 * m and zeros > 0: #Small range correction (linear counting)
+            e = m * math.log(m / zeros)
+        return e
+
+    def merge(self, other):
+        self._check_mergeable(other)
+        if other.precision != self.precision:
+            raise MergeNotDefinedError('Cannot merge HyperLogLog sketches of different precisions')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+class Cardinality(Accumulator):
+    """
+    Number of distinct items: exact (a set) up to threshold distinct items,
+    then estimated with a HyperLogLog sketch, so that memory stays bounded.
+    total is the number of (non distinct) items added.
+    """
+    def __init__(self, threshold = 10000, precision = 12):
+        self.threshold = threshold
+        self.precision = precision
+        self.total     = 0
+        self._items    = set()
+        self._sketch   = None
+
+    def add(self, item):
+        self.total += 1
+        if self._items is None:
+            self._sketch.add(item)
+        else:
+            self._items.add(item)
+            if len(self._items) > self.threshold:
+                self._to_sketch()
+
+    def _to_sketch(self):
+        self._sketch = self._build_sketch(self._items)
+        self._items  = None
+
+    def _build_sketch(self, items):
+        sketch = HyperLogLog(self.precision)
+        for item in items:
+            sketch.add(item)
+        return sketch
+
+    def is_exact(self):
+        return self._items is not None
+
+    def estimate(self):
+        if self._items is not None:
+            return len(self._items)
+        return self._sketch.estimate()
+
+    def error(self):
+        """
+        Standard error of estimate() (0 when exact)
+        """
+        if self._items is not None:
+            return 0.
+        return self._sketch.relative_error() * self._sketch.estimate()
+
+    def merge(self, other):
+        self._check_mergeable(other)
+        self.total += other.total
+        if self._items is not None and other._items is not None:
+            self._items |= other._items
+            if len(self._items) > self.threshold:
+                self._to_sketch()
+            return self
+
+        if self._items is not None:
+            self._to_sketch()
+        sketch = other._sketch if other._items is None else self._build_sketch(other._items)
+        self._sketch.merge(sketch)
+        return self
@@ -0,0 +1,167 @@
+import heapq, itertools, os, pickle, re, shutil, sys, tempfile, weakref
+
+__all__ = ['SpilledCounts', 'footprint', 'parse_size']
+
+_SIZE = re.compile(r'^\s*(\d+)\s*([KMG]?)i?B?\s*$', re.IGNORECASE)
+
+def parse_size(x):
+    """
+    Number of bytes of a size such as 512M or 2G (binary units)
+    """
+    m = _SIZE.match(x)
+    if m is None:
+        raise ValueError('Invalid size %s, expected e.g. 512M or 2G' % x)
+    return int(m.group(1)) << {'': 0, 'K': 10, 'M': 20, 'G': 30}[m.group(2).upper()]
+
+def footprint(obj, sample = 32):
+    """
+    Estimate of the memory used by obj and what it holds, extrapolated from
+    the first sample items of large containers (shared objects are counted
+    several times, which errs on the side of spilling early)
+    """
+    if isinstance(obj, (str, bytes, int, float, type(None))):
+        return sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size, n = sys.getsizeof(obj), len(obj)
+        if n:
+            items = list(itertools.islice(obj.items(), sample))
+            size += n * sum(footprint(k, sample) + footprint(v, sample) for k, v in items) // len(items)
+        return size
+    if isinstance(obj, (tuple, list, set)):
+        size, n = sys.getsizeof(obj), len(obj)
+        if n:
+            items = list(itertools.islice(obj, sample))
+            size += n * sum(footprint(x, sample) for x in items) // len(items)
+        return size
+    if hasattr(obj, '__dict__'):
+        return sys.getsizeof(obj) + footprint(vars(obj), sample)
+    return sys.getsizeof(obj)
+
+class _Runs(object):
+    """
+    Temporary files, each holding records sorted on some key, written and
+    read by blocks of pickled lists
+    """
+    BLOCK = 4096
+
+    def __init__(self):
+        self._directory = tempfile.mkdtemp(prefix='treebankanalytics-')
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self._directory, True)
+        self._next      = 0
+
+    def write(self, records):
+        path = os.path.join(self._directory, '%i.run' % self._next)
+        self._next += 1
+        with open(path, 'wb') as stream:
+            block = []
+            for r in records:
+                block.append(r)
+                if len(block) == self.BLOCK:
+                    pickle.dump(block, stream, protocol=pickle.HIGHEST_PROTOCOL)
+                    block = []
+            if block:
+                pickle.dump(block, stream, protocol=pickle.HIGHEST_PROTOCOL)
+        return path
+
+    @staticmethod
+    def read(path):
+        with open(path, 'rb') as stream:
+            while True:
+                try:
+                    block = pickle.load(stream)
+                except EOFError:
+                    return
+                yield from block
+
+    def close(self):
+        self._finalizer()
+
+def _first(record):
+    return record[2]
+
+class SpilledCounts(object):
+    """
+    Exact counts of an accumulator spilled to disk by Analyzer under a
+    memory budget. Each spill is a run of (key, count, first) records
+    sorted by key, first being (spill number, position of the key in the
+    accumulator) so that the first occurrence order of the keys, on which
+    the order of equal counts in tables depends, is kept.
+
+    items() merges the runs (k-way) and ranked() sorts the merged counts on
+    disk, so neither holds more than one record per run (or per block of
+    chunk records) in memory.
+    """
+    FAN_IN = 64
+
+    def __init__(self, chunk = 100000):
+        self.chunk  = chunk
+        self._runs  = _Runs()
+        self._paths = []
+        self._spills = 0
+        self._total  = None
+
+    def __len__(self):
+        return len(self._paths)
+
+    def spill(self, items):
+        """
+        Add a run from (key, count) pairs in first occurrence order
+        """
+        n = self._spills
+        self._spills += 1
+        self._total = None
+        self._paths.append(self._runs.write(sorted((key, count, (n, i)) for i, (key, count) in enumerate(items))))
+        #Bounds the number of files open by items()
+        if len(self._paths) >= self.FAN_IN:
+            merged = self._runs.write(self.items())
+            paths, self._paths = self._paths, [merged]
+            for path in paths:
+                os.unlink(path)
+
+    def items(self):
+        """
+        Merged (key, count, first) records, in key order
+        """
+        current = None
+        for key, count, first in heapq.merge(*[_Runs.read(path) for path in self._paths]):
+            if current is not None and current[0] == key:
+                current[1] += count
+                current[2] = min(current[2], first)
+            else:
+                if current is not None:
+                    yield tuple(current)
+                current = [key, count, first]
+        if current is not None:
+            yield tuple(current)
+
+    def total(self):
+        if self._total is None:
+            self._total = sum(count for _, count, _ in self.items())
+        return self._total
+
+    def ranked(self, key = _first, top = None):
+        """
+        (key, count) pairs sorted on key(record), by default in first
+        occurrence order. With top, only the top first ones are selected,
+        in one pass holding at most top records.
+        """
+        if top is not None:
+            return ((k, count) for k, count, _ in heapq.nsmallest(top, self.items(), key=key))
+        return self._sorted(key)
+
+    def _sorted(self, key):
+        runs, paths = _Runs(), []
+        records = self.items()
+        while True:
+            chunk = sorted(itertools.islice(records, self.chunk), key=key)
+            if not chunk:
+                break
+            paths.append(runs.write(chunk))
+        try:
+            for k, count, _ in heapq.merge(*[_Runs.read(path) for path in paths], key=key):
+                yield k, count
+        finally:
+            runs.close()
+
+    def close(self):
+        self._runs.close()
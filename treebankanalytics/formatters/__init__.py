@@ -1,2 +1,10 @@
-from treebankanalytics.formatters.csvformatter import CSVFormatter
-from treebankanalytics.formatters.latexformatter import LaTeXFormatter
+import importlib
+
+#Formatters are imported on first access
+_MODULES = {'CSVFormatter': 'csvformatter', 'LaTeXFormatter': 'latexformatter', 'JSONFormatter': 'jsonformatter'}
+__all__ = list(_MODULES)
+
+def __getattr__(name):
+    if name in _MODULES:
+        return getattr(importlib.import_module('%s.%s' % (__name__, _MODULES[name])), name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -1,4 +1,5 @@
 import io
+from treebankanalytics.formatters.streamed import StreamedTable
 
 __all__ = ['CSVFormatter']
 
@@ -6,10 +7,16 @@ class CSVFormatter(object):
     def __init__(self):
         pass
 
+    def write(self, table, stream):
+        for row in table:
+            print('\t'.join(row), file=stream)
+
     def format(self, table):
         output = io.StringIO()
-        for row in table:
-            print('\t'.join(row), file=output)
+        self.write(table, output)
         c = output.getvalue()
         output.close()
         return c
+
+    def stream(self, rows):
+        return StreamedTable(self, rows)
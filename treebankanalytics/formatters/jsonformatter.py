@@ -0,0 +1,30 @@
+import json
+from treebankanalytics.formatters.streamed import StreamedTable
+
+__all__ = ['JSONFormatter']
+
+class JSONFormatter(object):
+    def __init__(self):
+        pass
+
+    def records(self, table):
+        rows   = iter(table)
+        header = next(rows)
+        return [dict(zip(header, row)) for row in rows]
+
+    def write(self, table, stream):
+        #Same output as json.dumps(self.records(table)), one record at a time
+        rows   = iter(table)
+        header = next(rows)
+        stream.write('[')
+        for i, row in enumerate(rows):
+            if i > 0:
+                stream.write(', ')
+            stream.write(json.dumps(dict(zip(header, row))))
+        stream.write(']')
+
+    def format(self, table):
+        return json.dumps(self.records(table))
+
+    def stream(self, rows):
+        return StreamedTable(self, rows)
@@ -1,4 +1,5 @@
 import io
+from treebankanalytics.formatters.streamed import StreamedTable
 
 __all__ = ['LaTeXFormatter']
 
@@ -6,17 +7,24 @@ class LaTeXFormatter(object):
     def __init__(self):
         pass
 
+    def write(self, table, stream):
+        rows   = iter(table)
+        header = next(rows)
+        print("\\begin{{tabular}}{{{0}}}".format("c"*len(header)), file=stream)
+        print("\t\\toprule", file=stream)
+        print("\t{0}\\\\".format(" & ".join(header)), file=stream)
+        print("\t\\midrule", file=stream)
+        for row in rows:
+            print("\t{0}\\\\".format(' & '.join(row)), file=stream)
+        print("\t\\bottomrule", file=stream)
+        print("\\end{tabular}", file=stream)
+
     def format(self, table):
         output = io.StringIO()
-        print("\\begin{tabular}{{{0}}}".format("c"*len(table[0])), file=output)
-        print("\t\\toprule", file=output)
-        print("\t{0}\\\\".format(" & ".join(table[0])), file=output)
-        print("\t\\midrule", file=output)
-        for row in table[1:]:
-            print("\t{0}\\\\".format(' & '.join(row)), file=output)
-        print("\t\\bottomrule", file=output)
-        print("\\end{tabular}")
-
+        self.write(table, output)
         c = output.getvalue()
         output.close()
         return c
+
+    def stream(self, rows):
+        return StreamedTable(self, rows)
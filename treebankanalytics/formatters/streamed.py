@@ -0,0 +1,36 @@
+__all__ = ['StreamedTable']
+
+class StreamedTable(object):
+    """
+    Table whose rows (an iterable, header first) are only produced and
+    formatted when it is written, so that a large table is never held in
+    memory as a whole. str() renders it at once. Rows can only be consumed once:
+    the callbacks given to on_done() are called once they are.
+    """
+    def __init__(self, formatter, rows):
+        self._formatter = formatter
+        self._rows      = rows
+        self._done      = []
+
+    def on_done(self, callback):
+        self._done.append(callback)
+
+    def _finished(self):
+        callbacks, self._done = self._done, []
+        for callback in callbacks:
+            callback()
+
+    def write(self, stream):
+        try:
+            if hasattr(self._formatter, 'write'):
+                self._formatter.write(self._rows, stream)
+            else:
+                stream.write(self._formatter.format(list(self._rows)))
+        finally:
+            self._finished()
+
+    def __str__(self):
+        try:
+            return self._formatter.format(self._rows)
+        finally:
+            self._finished()
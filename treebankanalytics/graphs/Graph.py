@@ -1,11 +1,14 @@
-import codecs, os, re, sys, functools
+import bisect, codecs, hashlib, os, re, sys, functools
 
 from collections import defaultdict
 from collections import OrderedDict
 
 import argparse
 
-__all__ = ['Graph', 'read_sagae', 'read_deepsequoia', 'print_graph', 'Node', 'Edge']
+__all__ = ['Graph', 'read_sagae', 'read_deepsequoia', 'print_graph', 'Node', 'Edge', 'DFS_PRIORITIES', 'dfs_key']
+
+#Features holding metadata of the sentence rather than of a node (readers copy the id to the first node)
+_SENTENCE_FEATURES = frozenset(['sentid'])
 
 class ComparableMixin(object):
     """Mixin which implements rich comparison operators in terms of a single _compare_to() helper"""
@@ -114,6 +117,9 @@ class Graph(object):
         self._nodes = {}
         self._edges = set([])
         self._id = None
+        #Sorted outgoing edges by priority (see sorted_targets)
+        self._orders = None
+        self._fingerprint = None
 
     def __len__(self):
         return len(self._edges)
@@ -128,9 +134,12 @@ class Graph(object):
         self._id = _id_
 
     def add_node(self, node):
+        self._fingerprint = None
         self._nodes[node.index()] = node
 
     def add_edge(self, edge):
+        self._orders = None
+        self._fingerprint = None
         self._edges.add(edge)
         self._graph_source[edge.source()][edge.target()] = edge
         self._graph_target[edge.target()][edge.source()] = edge
@@ -138,6 +147,28 @@ class Graph(object):
     def edges(self):
         return self._edges
 
+    def fingerprint(self):
+        '''
+        128 bits hash (bytes) of the nodes (index, token, lemma, cpos, pos
+        and features) and labeled edges, whatever the order in which they
+        were added. The id, including the sentid feature the readers copy to
+        the first node, is left out, so that the same sentence gets the same
+        fingerprint in any corpus. Computed once until the graph changes.
+        '''
+        if self._fingerprint is None:
+            records = []
+            for i in sorted(self._nodes):
+                f = self._nodes[i].features()
+                features = f['features']
+                if isinstance(features, str):
+                    features = '|'.join(kv for kv in features.split('|') if kv.split('=', 1)[0] not in _SENTENCE_FEATURES)
+                else:
+                    features = '\x1c' + '\x1d'.join('%s\x1e%s' % kv for kv in sorted(features.items()) if kv[0] not in _SENTENCE_FEATURES)
+                records.append('n\x1f%i\x1f%s\x1f%s\x1f%s\x1f%s\x1f%s' % (i, f['token'], f['lemma'], f['cpos'], f['pos'], features))
+            records.extend(sorted('e\x1f%i\x1f%i\x1f%s' % (e.source(), e.target(), e['label']) for e in self._edges))
+            self._fingerprint = hashlib.blake2b('\n'.join(records).encode('utf-8'), digest_size=16).digest()
+        return self._fingerprint
+
     def edge(self, source, target):
         if source in self._graph_source and target in self._graph_source[source]:
             return self._graph_source[source][target]
@@ -196,6 +227,8 @@ class Graph(object):
 
     def remove_edge(self, edge):
         src, tar = edge.source(), edge.target()
+        self._orders = None
+        self._fingerprint = None
         self._edges.discard(edge)
         if src in self._graph_source:
             if tar in self._graph_source[src]:
@@ -206,29 +239,43 @@ class Graph(object):
         #        del self._graph_source[tar][src]
         #        del self._graph_target[src][tar]
 
-    def crossing_edges(self):
-        def is_crossing(e1, e2):
-            '''
-            Crossing followed Gomez-Rodriguez and Nivre article (2013)
-            "Divisible Transition Systems and Multiplanar Dependency Parsing"
-            '''
-            head1, dep1 = e1.source(), e1.target()
-            head2, dep2 = e2.source(), e2.target()
-
-            max1, max2 = max(head1, dep1), max(head2, dep2)
-            min1, min2 = min(head1, dep1), min(head2, dep2)
-
-            if min1 < min2 < max1 < max2 or min2 < min1 < max2 < max1:
-                return True
-            else:
-                return False
+    def crossing_pairs(self):
+        '''
+        Pairs of crossing edges (see crossing_edges), each pair given once.
+        Edges are swept by left endpoint: the edges crossing (l, r) on its
+        right start strictly between l and r and end strictly after r, they
+        are found by bisection among the edges sorted by right endpoint.
+        '''
+        starts = defaultdict(list)
+        for e in self._edges:
+            l, r = min(e.source(), e.target()), max(e.source(), e.target())
+            starts[l].append((r, e))
+        rights = {}
+        for l in starts:
+            starts[l].sort(key=lambda k: k[0])
+            rights[l] = [r for r, _ in starts[l]]
+        positions = sorted(starts)
+
+        pairs = []
+        for i, l in enumerate(positions):
+            for r, e1 in starts[l]:
+                j = i + 1
+                while j < len(positions) and positions[j] < r:
+                    p = positions[j]
+                    pairs.extend((e1, e2) for _, e2 in starts[p][bisect.bisect_right(rights[p], r):])
+                    j += 1
+        return pairs
 
+    def crossing_edges(self):
+        '''
+        Crossing followed Gomez-Rodriguez and Nivre article (2013)
+        "Divisible Transition Systems and Multiplanar Dependency Parsing":
+        (a, b) and (c, d) cross when min(a, b) < min(c, d) < max(a, b) < max(c, d)
+        '''
         crossings = set()
-        for e1 in self._edges:
-            for e2 in self._edges:
-                if is_crossing(e1, e2):
-                    crossings.add(e1)
-                    crossings.add(e2)
+        for e1, e2 in self.crossing_pairs():
+            crossings.add(e1)
+            crossings.add(e2)
         return crossings
 
 
@@ -272,54 +319,71 @@ class Graph(object):
 
     @staticmethod
     def DFSDecomposition(graph, priority = ("LEFT", "MIN", "LABEL")):
-        def ordering(priority, edge):
-            def left(edge):
-                return (edge.source() - edge.target()) >= 0
-            def dist(edge):
-                return abs(edge.source() - edge.target())
-            def label(edge):
-                return edge['label']
-
-            o = []
-            for p in priority:
-                if p == "LEFT":
-                    o.append( int(not left(edge)) )
-                elif p == "RIGHT":
-                    o.append( int(left(edge)) )
-                elif p == "MIN":
-                    o.append(dist(edge))
-                elif p == "LABEL":
-                    o.append(label(edge))
-            return tuple(o)
-
-        def rec(G, v, order, visited = set(), visited_edges = set()):
-            visited.add(v)
-            try:targets = G.targets_of(v)
-            except AttributeError: targets = {}
-
-            #try:sources = G.sources_of(v)
-            #except AttributeError: sources = {}
-            edges = [targets[i] for i in targets] #+ [sources[i] for i in sources]
-
-            partial_ordering = functools.partial(ordering, priority)
-            edges = sorted(edges, key=partial_ordering)
-            for edge in edges:
-                w = edge.source() if edge.source() != v else edge.target()
-                if edge not in visited_edges:
-                    order.append(edge)
-                    visited_edges.add(edge)
-
-                if w not in visited:
-                    rec(G, w, order, visited)
-                order.append("backtrack")
-
-        order = []
-        visited = set()
-        for n in graph.nodes():
-            if n not in visited:
-                rec(graph, graph.nodes()[0], order, visited)
+        """
+        Depth-first traversal of the outgoing edges of graph, from the root
+        then from each node not reached yet, by index: the edges in visit
+        order, "backtrack" following each explored edge. The edges of a node
+        are explored in the order given by priority (see dfs_key).
+        Iterative, so that long chains do not hit the recursion limit.
+        """
+        orders = graph.sorted_targets(priority)
+        order, visited = [], set()
+        for start in sorted(graph._nodes):
+            if start in visited:
+                continue
+            visited.add(start)
+            stack = [iter(orders.get(start, ()))]
+            while stack:
+                edge = next(stack[-1], None)
+                if edge is None:
+                    stack.pop()
+                    if stack:
+                        order.append("backtrack")
+                    continue
+                order.append(edge)
+                w = edge.target()
+                if w in visited:
+                    order.append("backtrack")
+                else:
+                    visited.add(w)
+                    stack.append(iter(orders.get(w, ())))
         return order
 
+    def sorted_targets(self, priority = ("LEFT", "MIN", "LABEL")):
+        """
+        Outgoing edges of each node sorted on dfs_key(priority, edge),
+        computed once per priority until the graph is modified
+        """
+        priority = tuple(priority)
+        if self._orders is None:
+            self._orders = {}
+        orders = self._orders.get(priority)
+        if orders is None:
+            key = functools.partial(dfs_key, priority)
+            orders = self._orders[priority] = dict((src, sorted(targets.values(), key=key)) for src, targets in self._graph_source.items())
+        return orders
+
+DFS_PRIORITIES = ("LEFT", "RIGHT", "MIN", "LABEL")
+
+def dfs_key(priority, edge):
+    """
+    Sort key of edge for the criteria of priority, in order: "LEFT" (left
+    edges, whose head follows the dependent, first), "RIGHT" (right edges
+    first), "MIN" (shortest first) or "LABEL"
+    """
+    src, tar = edge.source(), edge.target()
+    o = []
+    for p in priority:
+        if p == "LEFT":
+            o.append(int(src < tar))
+        elif p == "RIGHT":
+            o.append(int(src >= tar))
+        elif p == "MIN":
+            o.append(abs(src - tar))
+        elif p == "LABEL":
+            o.append(edge['label'])
+    return tuple(o)
+
 def print_graph(g, mode = "sagae", out=sys.stdout):
     if mode not in ["sagae", "deepsequoia"]:
         print("Invalid mode. Mode should be 'sagae' or 'deepsequoia'", file=sys.stderr)
@@ -1,23 +1,26 @@
-import yaml, argparse, functools
+import argparse, functools, os, sys
 
-from treebankanalytics.actions import Analyzer, PropertyAnalyzer, VoidAnalyzer, CrossingEdgesAnalyzer, NonPlanarAnalyzer, CyclesAnalyzer, LabelsAnalyzer, EdgeLengthBinsAnalyzer, LexicalLabelPairsAnalyzer, LexicalPairsByLabelAnalyzer, SentenceLengthBinsAnalyzer, DependencyPathsAnalyzer
-from treebankanalytics.actions import AllScorer, SentenceBinsScorer, EdgeLengthBinsScorer, LabelsScorer, Scorer, Evaluator, MergeNotDefinedError, FilteredScorer
-
-from treebankanalytics.formatters import *
-from treebankanalytics.supported_formats import format_factory_reader, format_factory_writer
-
-import os, re, sys
+#Commands import what they use, so that the CLI starts fast (see registry)
+from treebankanalytics.registry import ANALYZERS, SCORERS, READERS, WRITERS, FORMATTERS, UnknownNameError
 from treebankanalytics import __version__ as ta_version
 __version__ = ta_version
 
 def formatter_factory(f):
-    if f == "latex":
-        return LaTeXFormatter
-    elif f == "csv":
-        return CSVFormatter
-    else:
+    try:
+        return FORMATTERS.get(f)
+    except UnknownNameError:
         return None
 
+def resolve(registry, names):
+    """
+    Analyzer or scorer classes of the names given in a config file
+    """
+    try:
+        return [registry.get(k) for k in names]
+    except UnknownNameError as e:
+        print(e, file=sys.stderr)
+        sys.exit(-1)
+
 def test_file(t, x):
     """
     'Type' for argparse - checks that file exists and if so open it.
@@ -27,12 +30,168 @@ def test_file(t, x):
     return open(x, t)
 
 def open_yaml_file(stream):
+    import yaml
     try:
-        return yaml.load(stream.read())
-    except yaml.scanner.ScannerError as e:
+        return yaml.safe_load(stream.read())
+    except yaml.YAMLError as e:
         print("The config file seems not to be a valid YAML file", file=sys.stderr)
         return None
 
+def corpus_path(x):
+    """
+    'Type' for argparse - a file, a directory or a glob pattern matching files.
+    """
+    from treebankanalytics.actions.corpus import corpus_files
+    if not os.path.exists(x) and not corpus_files(x):
+        raise argparse.ArgumentTypeError("{0} does not exist".format(x))
+    return x
+
+def named_file(x):
+    """
+    'Type' for argparse - [NAME=]FILE, NAME defaults to the file name without extension.
+    """
+    name, sep, path = x.partition('=')
+    if not sep:
+        name, path = os.path.splitext(os.path.basename(x))[0], x
+    if not os.path.isfile(path):
+        raise argparse.ArgumentTypeError("{0} does not exist".format(path))
+    return name, path
+
+def load_gold_index(path, format):
+    """
+    Load a gold index, or build it if path is a gold file in the given format.
+    """
+    from treebankanalytics.actions.goldindex import GoldIndex, InvalidIndexError
+    with open(path, 'rb') as stream:
+        try:
+            return GoldIndex.load(stream)
+        except InvalidIndexError:
+            pass
+    return GoldIndex.build(READERS.get(format)(open(path, 'r')))
+
+def profiled(profiler, stage, graphs, count = True):
+    if profiler is None:
+        return graphs
+    return profiler.iterate(stage, graphs, count)
+
+def merged_profiles(profiler, results):
+    """
+    Results of tasks run with a profile (see corpus.analyze_file), whose
+    profilers are merged into profiler
+    """
+    if profiler is None:
+        yield from results
+        return
+    for r, p in results:
+        profiler.merge(p)
+        yield r
+
+def report_profile(profiler, path, formatter):
+    if path == '-':
+        print(profiler.table(formatter), file=sys.stderr)
+    else:
+        with open(path, 'w') as stream:
+            profiler.save(stream)
+
+def open_memo(path, classes, kind):
+    """
+    SentenceMemo for --memo: in memory only when no file is given. Warns
+    when none of the classes (analyzers or scorers) is memoizable.
+    """
+    if path is None:
+        return None
+    if not any(c.memoizable for c in classes):
+        print("--memo: none of the selected %s is memoizable, nothing will be memoized" % kind, file=sys.stderr)
+    from treebankanalytics.actions.cache import SentenceMemo
+    return SentenceMemo(path or None)
+
+def close_memo(memo, profiler):
+    """
+    Close the memo of --memo, reporting its hits and misses with --profile
+    """
+    if profiler is not None:
+        print("memo: %i hits, %i misses" % (memo.hits, memo.misses), file=sys.stderr)
+    memo.close()
+
+def dfs_priority(x):
+    """
+    'Type' for argparse - comma separated criteria of Graph.DFSDecomposition.
+    """
+    from treebankanalytics.graphs.Graph import DFS_PRIORITIES
+    priority = tuple(p.strip().upper() for p in x.split(',') if p.strip())
+    for p in priority:
+        if p not in DFS_PRIORITIES:
+            raise argparse.ArgumentTypeError("unknown criterion %s (available: %s)" % (p, ', '.join(DFS_PRIORITIES)))
+    return priority
+
+def at_least(minimum):
+    """
+    'Type' for argparse - integer not lower than minimum.
+    """
+    def check(x):
+        try:
+            n = int(x)
+        except ValueError:
+            raise argparse.ArgumentTypeError("invalid integer %s" % x)
+        if n < minimum:
+            raise argparse.ArgumentTypeError("%s is lower than %i" % (x, minimum))
+        return n
+    return check
+
+def memory_size(x):
+    """
+    'Type' for argparse - size in bytes (512M, 2G, ...).
+    """
+    from treebankanalytics.actions.spill import parse_size
+    try:
+        return parse_size(x)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def registered(registry):
+    """
+    'Type' for argparse - checks that a reader, writer or formatter exists.
+    """
+    def check(x):
+        if x not in registry:
+            raise argparse.ArgumentTypeError("unknown %s %s (available: %s)" % (registry.kind, x, ', '.join(registry.names())))
+        return x
+    return check
+
+def print_table(table, stream = sys.stdout):
+    """
+    Print a formatted table, writing streamed tables row by row.
+    """
+    if hasattr(table, 'write'):
+        table.write(stream)
+        print(file=stream)
+    else:
+        print(table, file=stream)
+
+def print_tables(tables, print_name):
+    for n, t in tables:
+        if print_name:
+            print(n)
+        print_table(t)
+
+def report_files(total, runner, results, print_name, aggregate_only = False):
+    """
+    Print the tables of each file of a corpus, given as (name, results)
+    pairs, then those of the whole corpus: total, an Analyzer or Evaluator
+    into which the results of the files are merged.
+    """
+    n = 0
+    for name, r in results:
+        part = runner()
+        part.merge(r)
+        if not aggregate_only:
+            print("==> %s <==" % name)
+            print_tables(part.tables(), print_name)
+        total.merge(part.results())
+        n += 1
+    print("==> all (%i files) <==" % n)
+    print_tables(total.tables(), print_name)
+
 def should_print_name(config, type):
     if 'General' not in config:
         return True
@@ -47,6 +206,10 @@ def options():
     """
     test_file_r = functools.partial(test_file, 'r')
     test_file_w = functools.partial(test_file, 'w')
+    test_file_rb = functools.partial(test_file, 'rb')
+
+    from treebankanalytics.actions.fields import COLUMNS
+    readers, writers, formatters = (', '.join(r.names(plugins=False)) for r in (READERS, WRITERS, FORMATTERS))
 
     parser = argparse.ArgumentParser(prog="TreebankAnalytics %s" % __version__)
     subs = parser.add_subparsers(dest='commands')
@@ -58,25 +221,98 @@ Supported formats are:
 - sagae (dependency graph format where multi-heads are expressed by repeated tokens)
 - sequoia (dependency graph format where multi-heads are separated by a pipe)
 - tikz (dependency graph for LaTeX printing (writer only))
+- dfs (depth-first decomposition of each graph on one line, e.g. oracles for transition parsers (writer only))
 If you're trying to transform from a CoNLL file to a SDP file,
 use sagae or sequoia as CoNLL because they are retro-compatible.
 
 """)
     evaluate  = subs.add_parser('eval', help='Evaluate a system output against a reference')
     analyze   = subs.add_parser('analyze', help='Analyze corpus to extract meaningful information')
+    indexer   = subs.add_parser('index-gold', help='Compile a gold file into a binary index (see eval --gold-index)')
+    server    = subs.add_parser('serve', help='Keep gold corpora in memory and evaluate system outputs sent over HTTP')
+    selector  = subs.add_parser('select', help='Extract the sentences matching predicates from a sentence index (see analyze --index)')
+    searcher  = subs.add_parser('search', help='Find the sentences matching a subgraph pattern, with a sentence index (see analyze --index) or by reading a corpus')
+    dedup     = subs.add_parser('dedup', help='Find near-duplicate sentences in a corpus, or sentences of a corpus duplicated in a reference corpus')
 
     for p in [evaluate, analyze]:
         p.add_argument('-c', '--config', required=True, help='Config file (YAML format)', metavar="FILE", type=test_file_r)
-        p.add_argument('-g', '--gold', required=True, help='Gold (reference) file', metavar="FILE", type=test_file_r)
-        p.add_argument('-f', '--format', default='sequoia', choices=['sagae', 'sdp', 'sequoia'], help='File format to be read')
-        p.add_argument('-t', '--table', default='csv', choices=['csv', 'latex'], help='Table formatter')
+        p.add_argument('-f', '--format', default='sequoia', type=registered(READERS), help='File format to be read (%s)' % readers)
+        p.add_argument('-t', '--table', default='csv', type=registered(FORMATTERS), help='Table formatter (%s)' % formatters)
+        p.add_argument('--profile', nargs='?', const='-', metavar="FILE",
+                       help='Time each stage (reading, each analyzer or scorer, tables) and print a summary on stderr, or write it to FILE as JSON')
+        p.add_argument('--profile-memory', action='store_true', help='With --profile, also trace the memory peak of each stage (slow)')
+        p.add_argument('-j', '--jobs', type=at_least(1), default=None, help='With several files, number of worker processes (default: number of CPUs)')
+        p.add_argument('--aggregate-only', action='store_true', help='With several files, only print the tables of the whole corpus')
+        p.add_argument('--memo', nargs='?', const='', metavar="FILE",
+                       help='Reuse the results of the memoizable %s for graphs seen before in the run, or in any run using FILE (SQLite)' % ('scorers' if p is evaluate else 'analyzers'))
+
+    analyze.add_argument('-g', '--gold', required=True, metavar="PATH", type=corpus_path,
+                         help='Gold (reference) file, or directory or glob pattern: tables of each file, then of all of them')
+    analyze.add_argument('--batch-size', type=at_least(1), default=1000, metavar="N",
+                         help='With one file and -j N (N > 1), sentences are sent to the worker processes by batches of N (default: 1000)')
+    analyze.add_argument('-i', '--index', help='Also store per sentence properties in this SQLite file (see select)', metavar="FILE")
+    analyze.add_argument('--max-memory', type=memory_size, metavar="SIZE",
+                         help='Spill the counts of LabelsAnalyzer, the lexical pairs analyzers and DependencyPathsAnalyzer '
+                              'to temporary files when they exceed SIZE (e.g. 512M, 2G), results are unchanged')
+    reuse = analyze.add_mutually_exclusive_group()
+    reuse.add_argument('--cache', nargs='?', const='', metavar="DIR",
+                       help='Reuse the results of analyzers whose config section did not change since a run on the same corpus (default DIR: $XDG_CACHE_HOME/treebankanalytics)')
+    reuse.add_argument('--state', metavar="FILE",
+                       help='Incremental mode for append-only corpora: only analyze the sentences appended since the run which saved FILE')
 
-    evaluate.add_argument('-s', '--system', required=True, help='System file', metavar="FILE", type=test_file_r)
-    evaluate.add_argument('-F', '--gold-format', default='sequoia', choices=['sagae', 'sdp', 'sequoia'], help='Gold file format to be read')
+    gold = evaluate.add_mutually_exclusive_group(required=True)
+    gold.add_argument('-g', '--gold', help='Gold (reference) file, directory or glob pattern', metavar="PATH", type=corpus_path)
+    gold.add_argument('-G', '--gold-index', help='Gold index built by index-gold', metavar="FILE", type=test_file_rb)
+    evaluate.add_argument('-s', '--system', required=True, metavar="PATH", type=corpus_path,
+                          help='System file, or directory or glob pattern: files are paired with the gold files by name')
+    evaluate.add_argument('-F', '--gold-format', default='sequoia', type=registered(READERS), help='Gold file format to be read (%s)' % readers)
 
-    converter.add_argument('-f', '--from', required=True, help='Convert from this format', choices=['sdp', 'sagae', 'sequoia'], dest='ffrom')
-    converter.add_argument('-t', '--to', required=True, help='Convert to this format', choices=['sdp', 'sagae', 'sequoia', 'tikz'])
+    converter.add_argument('-f', '--from', required=True, help='Convert from this format (%s)' % readers, type=registered(READERS), dest='ffrom')
+    converter.add_argument('-t', '--to', required=True, help='Convert to this format (%s)' % writers, type=registered(WRITERS))
     converter.add_argument('path', nargs='?', help='Absolute path to the file', metavar="FILE", type=test_file_r)
+    converter.add_argument('-j', '--jobs', type=at_least(0), default=1, help='Number of worker processes converting batches of sentences, 0 for the number of CPUs (default: 1)')
+    converter.add_argument('-p', '--priority', type=dfs_priority, metavar="CRITERIA",
+                           help='With -t dfs, order in which the edges of a node are explored: comma separated LEFT, RIGHT, MIN or LABEL (default: LEFT,MIN,LABEL)')
+    converter.add_argument('--batch-size', type=at_least(1), default=1000, metavar="N", help='With several jobs, number of sentences per batch (default: 1000)')
+
+    indexer.add_argument('-g', '--gold', required=True, help='Gold (reference) file', metavar="FILE", type=test_file_r)
+    indexer.add_argument('-f', '--format', default='sequoia', type=registered(READERS), help='File format to be read (%s)' % readers)
+    indexer.add_argument('-o', '--output', required=True, help='Index file', metavar="FILE")
+
+    server.add_argument('-c', '--config', required=True, action='append', help='Config file (YAML format), may be repeated', metavar="[NAME=]FILE", type=named_file)
+    server.add_argument('-g', '--gold', required=True, action='append', help='Gold file or gold index, may be repeated', metavar="[NAME=]FILE", type=named_file)
+    server.add_argument('-F', '--gold-format', default='sequoia', type=registered(READERS), help='Gold file format to be read (%s)' % readers)
+    server.add_argument('-w', '--workers', type=at_least(1), default=None, help='Number of worker processes (default: number of CPUs)')
+    address = server.add_mutually_exclusive_group(required=True)
+    address.add_argument('-p', '--port', type=int, help='Listen on localhost:PORT')
+    address.add_argument('-u', '--socket', help='Listen on the Unix socket PATH', metavar="PATH")
+
+    selector.add_argument('-i', '--index', required=True, help='Sentence index built by analyze --index', metavar="FILE")
+    selector.add_argument('-w', '--where', action='append', default=[], metavar="PREDICATE",
+                          help='COLUMN OP VALUE or label:LABEL OP VALUE, OP being one of < <= = != >= >. '
+                               'Columns: %s. May be repeated (all predicates must hold)' % ', '.join(COLUMNS))
+    selector.add_argument('-g', '--gold', help='Corpus file (default: the indexed file)', metavar="FILE")
+    selector.add_argument('--count', action='store_true', help='Only print the number of matching sentences')
+
+    searcher.add_argument('pattern', metavar="PATTERN",
+                          help='Nodes and edges, e.g. "H [pos=V]; H -[suj]-> D; H2 -[suj]-> D" (see README)')
+    searcher.add_argument('-i', '--index', help='Sentence index built by analyze --index: only the sentences holding the values and labels of the pattern are read', metavar="FILE")
+    searcher.add_argument('-g', '--gold', help='Corpus file (default: the indexed file)', metavar="FILE")
+    searcher.add_argument('-f', '--format', default='sequoia', type=registered(READERS), help='Without index, file format to be read (%s)' % readers)
+    output = searcher.add_mutually_exclusive_group()
+    output.add_argument('--count', action='store_true', help='Only print the number of matching sentences')
+    output.add_argument('--matches', action='store_true', help='Print every match as the position of the sentence and NAME=INDEX:TOKEN bindings')
+
+    dedup.add_argument('-g', '--gold', required=True, help='Corpus file', metavar="FILE")
+    dedup.add_argument('-r', '--reference', help='Only find the sentences of the corpus with a near-duplicate in this corpus file (e.g. test sentences in a training set)', metavar="FILE")
+    dedup.add_argument('-f', '--format', default='sequoia', type=registered(READERS), help='File format to be read (%s)' % readers)
+    dedup.add_argument('-t', '--table', default='csv', type=registered(FORMATTERS), help='Table formatter (%s)' % formatters)
+    dedup.add_argument('--threshold', type=float, default=0.8, help='Least estimated Jaccard similarity of the shingles of near-duplicates (default: 0.8)')
+    dedup.add_argument('--permutations', type=at_least(1), default=64, metavar="K", help='Number of values of the MinHash signatures (default: 64)')
+    dedup.add_argument('--ngram', type=at_least(1), default=3, metavar="N", help='Length of the token n-grams (default: 3)')
+    dedup.add_argument('--shingles', default='tokens,edges', metavar="KINDS",
+                       help='Comma separated kinds of shingles: tokens (n-grams) and edges (head token, label, dependent token) (default: tokens,edges)')
+    dedup.add_argument('-o', '--output', help='Write the corpus without its duplicates: the first sentence of each cluster is kept, or with -r, the duplicated sentences are removed', metavar="FILE")
     return parser
 
 def main():
@@ -84,41 +320,240 @@ def main():
     args   = parser.parse_args()
 
     if args.commands == "convert":
-        reader  = format_factory_reader(args.ffrom)
-        writer  = format_factory_writer(args.to)
+        from treebankanalytics.actions.convert import convert
+        if args.priority is not None and args.to != 'dfs':
+            print("--priority can only be used with -t dfs", file=sys.stderr)
+            sys.exit(-1)
         with args.path as stream:
-            for g in reader(stream):
-                writer(g, sys.stdout)
+            convert(stream, sys.stdout, args.ffrom, args.to, args.jobs, args.batch_size,
+                    {'priority': args.priority} if args.priority is not None else None)
     elif args.commands == "eval":
+        from treebankanalytics.actions.corpus import is_corpus, corpus_files, pair_files, eval_files, map_files
+        from treebankanalytics.actions.eval import Evaluator
+        from treebankanalytics.actions.goldindex import GoldIndex, InvalidIndexError
+        from treebankanalytics.profiling import Profiler
         config    = open_yaml_file(args.config)
         if config is None:
             sys.exit(-1)
 
-        scorers   = [eval(k) for k in config['Scorers']]
-        reader    = format_factory_reader(args.format)
-        greader   = format_factory_reader(args.gold_format)
-        formatter = formatter_factory(args.table)()
-        evaluator = Evaluator(formatter, config, scorers)#[AllScorer, SentenceBinsScorer, EdgeLengthBinsScorer, LabelsScorer])
-
+        scorers   = resolve(SCORERS, config['Scorers'])
+        reader    = READERS.get(args.format)
+        greader   = READERS.get(args.gold_format)
+        formatter = FORMATTERS.get(args.table)()
+        profiler  = Profiler(memory=args.profile_memory) if args.profile is not None else None
+        memo      = open_memo(args.memo, scorers, 'scorers')
+        evaluator = Evaluator(formatter, config, scorers, profiler, memo)#[AllScorer, SentenceBinsScorer, EdgeLengthBinsScorer, LabelsScorer])
         print_name = should_print_name(config, 'Scorers')
-        for n, t in evaluator.eval(golds=greader(args.gold), systems=reader(args.system)):
-            if print_name:
-                print(n)
-            print(t)
+
+        if is_corpus(args.system) or (args.gold is not None and is_corpus(args.gold)):
+            if args.gold_index is not None or memo is not None:
+                print("--gold-index and --memo cannot be used with several system files", file=sys.stderr)
+                sys.exit(-1)
+            pairs, unpaired = pair_files(corpus_files(args.gold), corpus_files(args.system))
+            for name in unpaired:
+                print("%s has no matching gold or system file, skipped" % name, file=sys.stderr)
+            profile = args.profile_memory if profiler is not None else None
+            results = map_files(eval_files, [(g, s, args.gold_format, args.format, config, scorers, profile) for _, g, s in pairs], args.jobs)
+            results = merged_profiles(profiler, results)
+            report_files(evaluator, lambda: Evaluator(formatter, config, scorers), zip([name for name, _, _ in pairs], results),
+                         print_name, args.aggregate_only)
+            if profiler is not None:
+                report_profile(profiler, args.profile, formatter)
+            return
+
+        args.system = open(args.system, 'r')
+        if args.gold_index is not None:
+            if memo is not None:
+                print("--memo cannot be used with --gold-index", file=sys.stderr)
+                sys.exit(-1)
+            try:
+                with args.gold_index as stream:
+                    load  = GoldIndex.load if profiler is None else profiler.wrap('load gold index', GoldIndex.load)
+                    index = load(stream)
+            except InvalidIndexError as e:
+                print("%s: %s" % (args.gold_index.name, e), file=sys.stderr)
+                sys.exit(-1)
+            tables = evaluator.eval_index(index, systems=profiled(profiler, 'read system', reader(args.system)))
+        else:
+            tables = evaluator.eval(golds=profiled(profiler, 'read gold', greader(open(args.gold, 'r'))),
+                                    systems=profiled(profiler, 'read system', reader(args.system), False))
+        print_tables(tables, print_name)
+        if memo is not None:
+            close_memo(memo, profiler)
+        if profiler is not None:
+            report_profile(profiler, args.profile, formatter)
     elif args.commands == "analyze":
+        from treebankanalytics.actions.analyze import Analyzer
+        from treebankanalytics.actions.corpus import is_corpus, corpus_files, analyze_file, map_files
+        from treebankanalytics.profiling import Profiler
         config    = open_yaml_file(args.config)
         if config is None:
             sys.exit(-1)
-        analyzers = [eval(k) for k in config['Analyzers']]
-        reader    = format_factory_reader(args.format)
-        formatter = formatter_factory(args.table)()
-        analyzer  = Analyzer(formatter, config, analyzers)#[VoidAnalyzer, CrossingEdgesAnalyzer, NonPlanarAnalyzer, CyclesAnalyzer, LabelsAnalyzer])
-
+        analyzers = resolve(ANALYZERS, config['Analyzers'])
+        reader    = READERS.get(args.format)
+        formatter = FORMATTERS.get(args.table)()
+        profiler  = Profiler(memory=args.profile_memory) if args.profile is not None else None
+        memo      = open_memo(args.memo, analyzers, 'analyzers')
+        analyzer  = Analyzer(formatter, config, analyzers, profiler, args.max_memory, memo)#[VoidAnalyzer, CrossingEdgesAnalyzer, NonPlanarAnalyzer, CyclesAnalyzer, LabelsAnalyzer])
         print_name = should_print_name(config, 'Analyzers')
-        for n, t in analyzer.analyze(reader(args.gold)):
-            if print_name:
-                print(n)
-            print(t)
+
+        if is_corpus(args.gold):
+            if args.index is not None or args.state is not None or args.cache is not None or memo is not None:
+                print("--index, --state, --cache and --memo cannot be used with several files", file=sys.stderr)
+                sys.exit(-1)
+            files   = corpus_files(args.gold)
+            profile = args.profile_memory if profiler is not None else None
+            results = map_files(analyze_file, [(path, args.format, config, analyzers, args.max_memory, profile) for _, path in files], args.jobs)
+            results = merged_profiles(profiler, results)
+            report_files(analyzer, lambda: Analyzer(formatter, config, analyzers), zip([name for name, _ in files], results),
+                         print_name, args.aggregate_only)
+            if profiler is not None:
+                report_profile(profiler, args.profile, formatter)
+            return
+
+        args.gold = open(args.gold, 'r')
+        graphs = reader(args.gold)
+        if args.jobs is not None and args.jobs != 1:
+            if args.index is not None or args.state is not None or args.cache is not None or memo is not None:
+                print("--index, --state, --cache and --memo cannot be used with --jobs", file=sys.stderr)
+                sys.exit(-1)
+            from treebankanalytics.actions.corpus import analyze_batch
+            from treebankanalytics.actions.flatbatch import map_batches
+            profile = args.profile_memory if profiler is not None else None
+            results = map_batches(analyze_batch, profiled(profiler, 'read', graphs), (config, analyzers, args.max_memory, profile),
+                                  args.jobs, args.batch_size, profiler)
+            for results in merged_profiles(profiler, results):
+                analyzer.merge(results)
+            print_tables(analyzer.tables(), print_name)
+            if profiler is not None:
+                report_profile(profiler, args.profile, formatter)
+            return
+
+        if args.state is not None or args.cache is not None:
+            from treebankanalytics.actions.cache import ResultCache, AnalyzerState, file_fingerprint, prefix_checksum, default_cache_dir
+        if args.state is not None or args.index is not None:
+            from treebankanalytics.actions.sentindex import SentenceIndex, OffsetStream
+        if args.state is not None:
+            if args.index is not None:
+                print("--index cannot be used with --state", file=sys.stderr)
+                sys.exit(-1)
+            key   = AnalyzerState.config_key(args.format, config, [an.name() for an in analyzers])
+            state = AnalyzerState.load(args.state) if os.path.exists(args.state) else None
+            args.gold.close()
+            stream = open(args.gold.name, 'rb')
+            if state is not None and state.matches(args.gold.name, key):
+                analyzer.merge(state.results)
+                stream.seek(state.offset)
+            elif state is not None:
+                print("%s does not match the corpus or the config, analyzing the whole corpus" % args.state, file=sys.stderr)
+            stream = OffsetStream(stream)
+            graphs = stream.track(reader(stream))
+        if args.cache is not None:
+            cache = ResultCache(args.cache or default_cache_dir())
+            fingerprint = file_fingerprint(args.gold.name)
+            keys = dict((an.name(), cache.key(fingerprint, args.format, an.name(), config.get(an.name()))) for an in analyzers)
+            cached = dict((name, cache.get(key)) for name, key in keys.items())
+            analyzer.restore(dict((name, r) for name, r in cached.items() if r is not None))
+            if not analyzer.pending():
+                graphs = []
+        if args.index is not None:
+            args.gold.close()
+            stream = OffsetStream(open(args.gold.name, 'rb'))
+            index  = SentenceIndex.create(args.index, args.gold.name, args.format, config)
+            graphs = index.record(reader(stream), stream)
+
+        analyzer.accumulate(profiled(profiler, 'read', graphs))
+        if args.index is not None:
+            index.close()
+        if args.state is not None:
+            AnalyzerState(key, stream.end, prefix_checksum(args.gold.name, stream.end), analyzer.results()).save(args.state)
+        if args.cache is not None:
+            results = analyzer.results()
+            for name in analyzer.pending():
+                cache.put(keys[name], results[name])
+        if memo is not None:
+            close_memo(memo, profiler)
+
+        print_tables(analyzer.tables(), print_name)
+        if profiler is not None:
+            report_profile(profiler, args.profile, formatter)
+    elif args.commands == "index-gold":
+        from treebankanalytics.actions.goldindex import GoldIndex
+        reader = READERS.get(args.format)
+        index  = GoldIndex.build(reader(args.gold))
+        with open(args.output, 'wb') as stream:
+            index.save(stream)
+    elif args.commands == "serve":
+        from treebankanalytics.server import serve
+        configs = {}
+        for name, path in args.config:
+            with open(path, 'r') as stream:
+                configs[name] = open_yaml_file(stream)
+            if configs[name] is None:
+                sys.exit(-1)
+            if not isinstance(configs[name], dict) or 'Scorers' not in configs[name]:
+                print("%s has no Scorers" % path, file=sys.stderr)
+                sys.exit(-1)
+            resolve(SCORERS, configs[name]['Scorers'])
+        golds = dict((name, load_gold_index(path, args.gold_format)) for name, path in args.gold)
+        serve(golds, configs, port=args.port, socket=args.socket, workers=args.workers)
+    elif args.commands == "select":
+        from treebankanalytics.actions.sentindex import SentenceIndex, InvalidPredicateError, StaleIndexError
+        try:
+            index = SentenceIndex.open(args.index)
+            rows  = index.select(args.where)
+            if args.count:
+                print(len(rows.fetchall()))
+            else:
+                index.extract(rows, sys.stdout.buffer, args.gold)
+        except (InvalidPredicateError, StaleIndexError) as e:
+            print(e, file=sys.stderr)
+            sys.exit(-1)
+    elif args.commands == "search":
+        from treebankanalytics.actions.convert import sentence_batches
+        from treebankanalytics.actions.search import Pattern, InvalidPatternError, search
+        from treebankanalytics.actions.sentindex import SentenceIndex, StaleIndexError
+        if args.index is None and args.gold is None:
+            print("search needs a sentence index (-i) or a corpus file (-g)", file=sys.stderr)
+            sys.exit(-1)
+        try:
+            pattern = Pattern(args.pattern)
+            if args.index is not None:
+                index     = SentenceIndex.open(args.index)
+                format    = index.meta('format')
+                sentences = ((p, data.decode('utf-8')) for p, data in index.read(index.candidates(pattern.terms(), pattern.label_counts()), args.gold))
+            else:
+                format    = args.format
+                sentences = ((n - 1, text) for n, text in sentence_batches(open(args.gold, 'r'), 1))
+            count = 0
+            for position, text, graph, bindings in search(pattern, sentences, format, args.matches):
+                count += 1
+                if args.matches:
+                    for b in bindings:
+                        print(position, ' '.join('%s=%i:%s' % (name, b[name], graph.node(b[name])['token']) for name in pattern.names), sep='\t')
+                elif not args.count:
+                    sys.stdout.write(text)
+            if args.count:
+                print(count)
+        except (InvalidPatternError, StaleIndexError) as e:
+            print(e, file=sys.stderr)
+            sys.exit(-1)
+    elif args.commands == "dedup":
+        from treebankanalytics.actions.dedup import SHINGLES, Deduplicator, deduplicate
+        kinds = tuple(k.strip() for k in args.shingles.split(','))
+        if not kinds or any(k not in SHINGLES for k in kinds):
+            print("Unknown shingles %s (available: %s)" % (args.shingles, ', '.join(SHINGLES)), file=sys.stderr)
+            sys.exit(-1)
+        if not 0 < args.threshold <= 1:
+            print("--threshold must be in ]0, 1]", file=sys.stderr)
+            sys.exit(-1)
+        for path in (args.gold, args.reference):
+            if path is not None and not os.path.isfile(path):
+                print("%s does not exist" % path, file=sys.stderr)
+                sys.exit(-1)
+        deduplicator = Deduplicator(args.threshold, args.permutations, args.ngram, kinds)
+        tables = deduplicate(deduplicator, args.gold, args.format, FORMATTERS.get(args.table)(), args.reference, args.output)
+        print_tables(tables, True)
 
 if __name__ == '__main__':
     main()
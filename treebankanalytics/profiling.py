@@ -0,0 +1,154 @@
+import json, time, tracemalloc
+from collections import OrderedDict
+
+__all__ = ['Profiler', 'StageStats']
+
+class StageStats(object):
+    __slots__ = ('calls', 'seconds', 'peak', 'per_sentence')
+
+    def __init__(self, per_sentence = False):
+        self.calls   = 0
+        self.seconds = 0.
+        self.peak    = 0
+        self.per_sentence = per_sentence
+
+class Profiler(object):
+    """
+    Wall time, number of calls and optionally memory peak (tracemalloc) of
+    the stages of a run: reading, analyze()/score() of each analyzer or
+    scorer, merge() and table(). Stages are instrumented by wrapping the
+    functions once, so nothing is measured (nor slowed down) when no
+    profiler is given.
+
+    hooks are called after each measured call as hook(stage, seconds, peak),
+    peak being 0 when memory is not traced.
+    """
+    def __init__(self, memory = False, hooks = ()):
+        self.memory    = memory
+        self.hooks     = list(hooks)
+        self.stages    = OrderedDict()
+        self.sentences = 0
+        self.tokens    = 0
+        self._start    = time.perf_counter()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def _stats(self, stage, per_sentence = False):
+        stats = self.stages.get(stage)
+        if stats is None:
+            stats = self.stages[stage] = StageStats(per_sentence)
+        return stats
+
+    def record(self, stage, seconds, peak = 0, count = True):
+        stats = self._stats(stage)
+        stats.calls   += 1 if count else 0
+        stats.seconds += seconds
+        stats.peak     = max(stats.peak, peak)
+        for hook in self.hooks:
+            hook(stage, seconds, peak)
+
+    def wrap(self, stage, fn, per_sentence = False, count = True):
+        """
+        fn measured as stage. per_sentence stages are called once per
+        sentence, their throughput is reported. Unless count, the calls of
+        fn add to the time of stage but not to its number of calls (e.g.
+        writing a table built by another call of the stage).
+        """
+        self._stats(stage, per_sentence)
+        perf, record = time.perf_counter, self.record
+        if not self.memory:
+            def wrapper(*args, **kwargs):
+                start = perf()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    record(stage, perf() - start, 0, count)
+            return wrapper
+
+        def traced(*args, **kwargs):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            start = perf()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                seconds = perf() - start
+                record(stage, seconds, max(0, tracemalloc.get_traced_memory()[1] - before), count)
+        return traced
+
+    def merge(self, other):
+        """
+        Add the stages, sentences and tokens of other, e.g. the profiler of
+        a worker process. Times of the stages are summed over the workers,
+        so they may exceed the wall time of the run.
+        """
+        for stage, stats in other.stages.items():
+            mine = self._stats(stage, stats.per_sentence)
+            mine.calls   += stats.calls
+            mine.seconds += stats.seconds
+            mine.peak     = max(mine.peak, stats.peak)
+        self.sentences += other.sentences
+        self.tokens    += other.tokens
+        return self
+
+    def iterate(self, stage, graphs, count = True):
+        """
+        Pass graphs through, measuring the time spent producing them (reading).
+        If count, the graphs are the sentences of the run.
+        """
+        self._stats(stage, True)
+        return self._iterate(stage, iter(graphs), count)
+
+    def _iterate(self, stage, graphs, count):
+        perf, record = time.perf_counter, self.record
+        while True:
+            start = perf()
+            try:
+                graph = next(graphs)
+            except StopIteration:
+                return
+            record(stage, perf() - start)
+            if count:
+                self.sentences += 1
+                self.tokens    += graph.order() - 1
+            yield graph
+
+    def summary(self):
+        wall = time.perf_counter() - self._start
+        stages = OrderedDict()
+        for stage, stats in self.stages.items():
+            s = {'calls': stats.calls, 'seconds': stats.seconds}
+            if stats.per_sentence:
+                s['sentences_per_second'] = self.sentences / stats.seconds if stats.seconds > 0 else 0.
+                s['tokens_per_second']    = self.tokens / stats.seconds if stats.seconds > 0 else 0.
+            if self.memory:
+                s['peak_bytes'] = stats.peak
+            stages[stage] = s
+        return {'wall_seconds': wall, 'sentences': self.sentences, 'tokens': self.tokens,
+                'sentences_per_second': self.sentences / wall if wall > 0 else 0.,
+                'tokens_per_second': self.tokens / wall if wall > 0 else 0., 'stages': stages}
+
+    def table(self, formatter):
+        summary = self.summary()
+        wall = summary['wall_seconds']
+        header = ['Stage', 'Calls', 'Seconds', '% Time', 'Sentences/s', 'Tokens/s']
+        if self.memory:
+            header.append('Peak KiB')
+        table = [header]
+        rows = list(summary['stages'].items())
+        rows.append(('Total', {'calls': summary['sentences'], 'seconds': wall,
+                               'sentences_per_second': summary['sentences_per_second'], 'tokens_per_second': summary['tokens_per_second']}))
+        for stage, s in rows:
+            row = [stage, str(s['calls']), "%.3f" % s['seconds'], "%.1f" % (s['seconds'] / wall * 100.0 if wall > 0 else 0.)]
+            row.extend("%.0f" % s[k] if k in s else '-' for k in ('sentences_per_second', 'tokens_per_second'))
+            if self.memory:
+                row.append("%.1f" % (s['peak_bytes'] / 1024.) if 'peak_bytes' in s else '-')
+            table.append(row)
+        return formatter.format(table)
+
+    def save(self, fileo):
+        json.dump(self.summary(), fileo, indent=2)
+        fileo.write('\n')
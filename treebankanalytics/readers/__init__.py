@@ -1,4 +1,9 @@
-from treebankanalytics.readers import sagae
-from treebankanalytics.readers import sdp
-from treebankanalytics.readers import sequoia
+import importlib
 
+#Submodules are imported on first access, so that reading one format does not load the others
+__all__ = ['sagae', 'sdp', 'sequoia']
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module('%s.%s' % (__name__, name))
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -5,9 +5,9 @@ from treebankanalytics.readers import utils
 
 __all__ = ['sdp_reader']
 
-def sdp_reader(fileo):
+def sdp_reader(fileo, numsent = 1):
+    #numsent: number of the first sentence, giving the ids of sentences without an id comment
     kept_id = None
-    numsent = 1
     predicates = []
     edges = {}
     graph = G.Graph()
@@ -0,0 +1,90 @@
+import importlib
+
+__all__ = ['Registry', 'UnknownNameError', 'ANALYZERS', 'SCORERS', 'READERS', 'WRITERS', 'FORMATTERS']
+
+class UnknownNameError(Exception):
+    pass
+
+class Registry(object):
+    """
+    Names of analyzers, scorers, readers, writers or formatters mapped to
+    'module:attribute' targets, which are only imported when the name is
+    looked up. Other packages add theirs through the entry point group of
+    the registry, e.g. in their setup.py:
+
+        entry_points = {'treebankanalytics.analyzers': ['MyAnalyzer = mypackage.analyzers:MyAnalyzer']}
+
+    Entry points are only scanned when a name is not built in (or when all
+    names are listed), and built in names cannot be shadowed.
+    """
+    def __init__(self, kind, group, targets):
+        self.kind     = kind
+        self.group    = group
+        self._targets = dict(targets)
+        self._loaded  = {}
+        self._plugins = False
+
+    def register(self, name, target):
+        """
+        target is either the object itself or a 'module:attribute' string
+        """
+        self._targets[name] = target
+        self._loaded.pop(name, None)
+
+    def _load_plugins(self):
+        if self._plugins:
+            return
+        self._plugins = True
+        from importlib.metadata import entry_points
+        try:
+            eps = entry_points(group=self.group)
+        except TypeError:
+            #Python < 3.10
+            eps = entry_points().get(self.group, [])
+        for ep in eps:
+            self._targets.setdefault(ep.name, ep.value.split('[')[0].strip())
+
+    def names(self, plugins = True):
+        if plugins:
+            self._load_plugins()
+        return sorted(self._targets)
+
+    def __contains__(self, name):
+        if name not in self._targets:
+            self._load_plugins()
+        return name in self._targets
+
+    def get(self, name):
+        if name in self._loaded:
+            return self._loaded[name]
+        if name not in self:
+            raise UnknownNameError('Unknown %s %s (available: %s)' % (self.kind, name, ', '.join(self.names())))
+
+        target = self._targets[name]
+        if isinstance(target, str):
+            module, _, attribute = target.partition(':')
+            target = importlib.import_module(module)
+            for a in attribute.split('.') if attribute else []:
+                target = getattr(target, a)
+        self._loaded[name] = target
+        return target
+
+def _targets(module, names):
+    return [(name, '%s:%s' % (module, name)) for name in names]
+
+ANALYZERS = Registry('analyzer', 'treebankanalytics.analyzers', _targets('treebankanalytics.actions.analyze', [
+    'VoidAnalyzer', 'CrossingEdgesAnalyzer', 'NonPlanarAnalyzer', 'MultiplanarityAnalyzer', 'NonProjectivityAnalyzer',
+    'CyclesAnalyzer', 'LabelsAnalyzer', 'EdgeLengthBinsAnalyzer', 'LexicalLabelPairsAnalyzer', 'LexicalPairsByLabelAnalyzer',
+    'SentenceLengthBinsAnalyzer', 'DependencyPathsAnalyzer', 'VocabularyAnalyzer']))
+
+SCORERS = Registry('scorer', 'treebankanalytics.scorers', _targets('treebankanalytics.actions.eval', [
+    'AllScorer', 'SentenceBinsScorer', 'EdgeLengthBinsScorer', 'LabelsScorer', 'FilteredScorer', 'LabelConfusionScorer']))
+
+READERS = Registry('reader', 'treebankanalytics.readers', [(f, 'treebankanalytics.readers.%s:%s_reader' % (f, f)) for f in ['sagae', 'sdp', 'sequoia']])
+
+WRITERS = Registry('writer', 'treebankanalytics.writers', [(f, 'treebankanalytics.writers.%s:%s_writer' % (f, f)) for f in ['dfs', 'sagae', 'sequoia', 'tikz']])
+
+FORMATTERS = Registry('formatter', 'treebankanalytics.formatters', [
+    ('csv', 'treebankanalytics.formatters.csvformatter:CSVFormatter'),
+    ('latex', 'treebankanalytics.formatters.latexformatter:LaTeXFormatter'),
+    ('json', 'treebankanalytics.formatters.jsonformatter:JSONFormatter')])
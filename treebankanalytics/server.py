@@ -0,0 +1,154 @@
+import io, json, os, socketserver, sys
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from treebankanalytics.actions.eval import Evaluator
+from treebankanalytics.formatters.jsonformatter import JSONFormatter
+from treebankanalytics.registry import SCORERS, UnknownNameError
+from treebankanalytics.supported_formats import format_factory_reader
+
+__all__ = ['serve', 'EvaluationServer', 'UnixEvaluationServer', 'RequestError']
+
+class RequestError(Exception):
+    pass
+
+class _RecordsFormatter(JSONFormatter):
+    def format(self, table):
+        return self.records(table)
+
+#Set once in each worker process by _init_worker
+_golds   = {}
+_configs = {}
+
+def _init_worker(golds, configs):
+    _golds.update(golds)
+    _configs.update(configs)
+
+def _pick(resources, name, kind):
+    if name is None:
+        if len(resources) != 1:
+            raise RequestError('Several %ss are loaded, one must be given (%s)' % (kind, ', '.join(sorted(resources))))
+        return next(iter(resources.values()))
+    if name not in resources:
+        raise RequestError('Unknown %s %s' % (kind, name))
+    return resources[name]
+
+def score(request):
+    """
+    Score one system output against a gold corpus held in memory.
+    request is a dict with the keys:
+      - system: system output (text) or path: path to the system file
+      - format: system file format (default: sequoia)
+      - gold, config: names of the gold corpus and of the config to use
+        (optional when only one is loaded)
+    Returns a dict scorer name -> table (list of rows as dicts).
+    """
+    index  = _pick(_golds, request.get('gold'), 'gold')
+    config = _pick(_configs, request.get('config'), 'config')
+    reader = format_factory_reader(request.get('format', 'sequoia'))
+    if reader is None:
+        raise RequestError('Unsupported format %s' % request.get('format'))
+
+    try:
+        scorers = [SCORERS.get(k) for k in config['Scorers']]
+    except KeyError:
+        raise RequestError('The config has no Scorers')
+    except UnknownNameError as e:
+        raise RequestError(str(e))
+    evaluator = Evaluator(_RecordsFormatter(), config, scorers)
+
+    if 'system' in request:
+        stream = io.StringIO(request['system'])
+    elif 'path' in request:
+        try:
+            stream = open(request['path'], 'r')
+        except OSError as e:
+            raise RequestError(str(e))
+    else:
+        raise RequestError('Either system or path must be given')
+    with stream:
+        return dict(evaluator.eval_index(index, reader(stream)))
+
+class _Handler(BaseHTTPRequestHandler):
+    def _reply(self, code, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != '/':
+            self._reply(404, {'error': 'Not found'})
+            return
+        self._reply(200, {'golds': sorted(self.server.golds), 'configs': sorted(self.server.configs)})
+
+    def do_POST(self):
+        if self.path != '/eval':
+            self._reply(404, {'error': 'Not found'})
+            return
+        try:
+            length  = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            if not isinstance(request, dict):
+                raise RequestError('Request should be a JSON object')
+            result = self.server.submit(request)
+        except (ValueError, RequestError) as e:
+            self._reply(400, {'error': str(e)})
+        except Exception as e:
+            self._reply(500, {'error': '%s: %s' % (type(e).__name__, e)})
+        else:
+            self._reply(200, result)
+
+    def address_string(self):
+        #Unix sockets have no client address
+        return self.client_address[0] if self.client_address else 'unix'
+
+class _EvaluationServerMixin(socketserver.ThreadingMixIn):
+    """
+    Requests are read by one thread each, scoring is done by a pool of
+    worker processes which got the gold corpora and configs once at startup.
+    """
+    daemon_threads = True
+
+    def setup_evaluation(self, golds, configs, workers):
+        self.golds   = golds
+        self.configs = configs
+        self.pool    = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(golds, configs))
+
+    def submit(self, request):
+        return self.pool.submit(score, request).result()
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown()
+
+class EvaluationServer(_EvaluationServerMixin, HTTPServer):
+    pass
+
+class UnixEvaluationServer(_EvaluationServerMixin, socketserver.UnixStreamServer):
+    pass
+
+def serve(golds, configs, port = None, socket = None, workers = None):
+    """
+    golds: name -> GoldIndex, configs: name -> config (dict)
+    Listen on localhost:port or on the Unix socket path socket.
+    """
+    if socket is not None:
+        if os.path.exists(socket):
+            os.unlink(socket)
+        server = UnixEvaluationServer(socket, _Handler)
+    else:
+        server = EvaluationServer(('127.0.0.1', port), _Handler)
+    server.setup_evaluation(golds, configs, workers)
+
+    print("Serving %s on %s" % (', '.join(sorted(golds)), socket if socket is not None else 'http://127.0.0.1:%i' % port), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket is not None and os.path.exists(socket):
+            os.unlink(socket)
@@ -1,19 +1,17 @@
-import os, re, sys
+import sys
 
-import treebankanalytics.readers as readers
-import treebankanalytics.writers as writers
+from treebankanalytics.registry import READERS, WRITERS, UnknownNameError
 __all__ = ['format_factory_reader', 'format_factory_writer']
 
-def _format_factory(f, type):
+def _format_factory(f, registry):
     try:
-        reader = eval('%ss.%s.%s_%s' % (type, f, f, type))
-        return reader
-    except:
-        print("Format %s is not supported as a %s" % (f, type), file=sys.stderr)
+        return registry.get(f)
+    except UnknownNameError:
+        print("Format %s is not supported as a %s" % (f, registry.kind), file=sys.stderr)
         return None
 
 def format_factory_reader(f):
-    return _format_factory(f, 'reader')
+    return _format_factory(f, READERS)
 
 def format_factory_writer(f):
-    return _format_factory(f, 'writer')
+    return _format_factory(f, WRITERS)
@@ -1,5 +1,9 @@
-from treebankanalytics.writers import sagae
-from treebankanalytics.writers import sdp
-from treebankanalytics.writers import sequoia
-from treebankanalytics.writers import tikz
+import importlib
 
+#Submodules are imported on first access, so that writing one format does not load the others
+__all__ = ['dfs', 'sagae', 'sdp', 'sequoia', 'tikz']
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module('%s.%s' % (__name__, name))
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,17 @@
+import os, re, sys
+
+import treebankanalytics.graphs.Graph as G
+
+__all__ = ['dfs_writer']
+
+def dfs_writer(graph, fileo, priority = ("LEFT", "MIN", "LABEL")):
+    #One line per sentence: the steps of G.Graph.DFSDecomposition separated by
+    #tabs, HEAD:LABEL:DEP for an edge (labels may hold ':', heads and
+    #dependents do not) and 'backtrack'
+    steps = []
+    for step in G.Graph.DFSDecomposition(graph, priority):
+        if isinstance(step, str):
+            steps.append(step)
+        else:
+            steps.append("%i:%s:%i" % (step.source(), step['label'], step.target()))
+    print("\t".join(steps), file=fileo)